@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""d2tp benchmark suite
+
+Measures d2tp's own overhead against a fake Proton tree (see ``fake_proton.py``), so no Steam
+install is needed. Each case runs in a fresh interpreter and the median of ``--runs`` runs is
+reported and compared against a stored baseline.
+
+    bench.py [--sizes 1000,10000,100000] [--runs N] [--work-dir DIR]
+             [--run-latency S] [--file-latency S] [--boot-latency S] [--jobs N]
+             [--baseline FILE] [--save-baseline] [--tolerance RATIO] [--min-delta S]
+
+Cases:
+
+    start_session/cold      Build.start_session with empty build and prefix directories
+    start_session/warm      Build.start_session with an existing build and prefix
+    session_state/snapshot  Build.session_state restored from the session snapshot
+    wine_path/dosdevices    1000 Runner.wine_path conversions resolved through dosdevices
+    wine_path/winepath      20 Runner.wine_path conversions falling back to ``winepath``
+    scan/<size>             CustomGame.scan of a synthetic addon with <size> files
+    compile/<size>          Runner.compile_custom_game of the addon without a manifest
+    compile_noop/<size>     Runner.compile_custom_game of the unchanged addon
+
+Baselines are machine specific: save one with ``--save-baseline`` before a change and compare
+after it. The exit status is 1 if a case got slower than the baseline by more than
+``--tolerance`` (relative) and ``--min-delta`` (absolute seconds).
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT_DIR = BENCH_DIR.parent
+
+sys.path.insert(0, str(ROOT_DIR))
+
+# pylint: disable=wrong-import-position
+import fake_proton  # noqa: E402
+
+BASELINE_VERSION = 1
+DEFAULT_BASELINE = BENCH_DIR.joinpath("baseline.json")
+DEFAULT_SIZES = "1000,10000,100000"
+ADDON_NAME = "bench"
+
+
+class Paths:  # pylint: disable=too-few-public-methods
+    """Layout of the benchmark work directory"""
+
+    def __init__(self, work_dir: Path) -> None:
+        self.work_dir = work_dir
+        self.latency_file = work_dir.joinpath("latency.json")
+        self.steam = work_dir.joinpath("steam")
+        self.proton = work_dir.joinpath("proton")
+        self.game = work_dir.joinpath("game")
+        self.build = work_dir.joinpath("cache", "build")
+        self.prefix = work_dir.joinpath("cache", "prefix")
+        self.cache = work_dir.joinpath("cache", "cache")
+
+    def addon(self, size: int) -> Path:
+        return self.work_dir.joinpath("addons", str(size))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="d2tp benchmark suite")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Addon sizes in files")
+    parser.add_argument("--runs", type=int, default=3, help="Number of runs per case")
+    parser.add_argument("--work-dir", type=Path, help="Directory for the fake trees")
+    parser.add_argument("--run-latency", type=float, default=0.05, help="Compiler run latency")
+    parser.add_argument("--file-latency", type=float, default=0.0, help="Compiler file latency")
+    parser.add_argument("--boot-latency", type=float, default=0.0, help="Prefix boot latency")
+    parser.add_argument("--jobs", type=int, default=1, help="Concurrent compile jobs")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help="Baseline file")
+    parser.add_argument("--save-baseline", action="store_true", help="Save results as baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown")
+    parser.add_argument("--min-delta", type=float, default=0.05, help="Ignored slowdown in s")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+
+    return parser.parse_args()
+
+
+def setup(paths: Paths, sizes: list[int], args: argparse.Namespace) -> None:
+    paths.work_dir.mkdir(parents=True, exist_ok=True)
+    fake_proton.set_latency(
+        paths.latency_file, args.run_latency, args.file_latency, args.boot_latency
+    )
+
+    if not paths.proton.exists():
+        fake_proton.make_proton(paths.proton, paths.latency_file)
+        fake_proton.make_game(paths.game)
+        paths.steam.mkdir(parents=True, exist_ok=True)
+
+    for size in sizes:
+        addon = paths.addon(size)
+
+        if not addon.exists():
+            print(f"generating addon with {size} files", file=sys.stderr)
+            tmp_dir = addon.with_name(f".{addon.name}.tmp")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            fake_proton.make_addon(tmp_dir, size)
+            tmp_dir.rename(addon)
+
+
+def cases(sizes: list[int]) -> list[str]:
+    names = [
+        "start_session/cold",
+        "start_session/warm",
+        "session_state/snapshot",
+        "wine_path/dosdevices",
+        "wine_path/winepath",
+    ]
+
+    for size in sizes:
+        names.extend([f"scan/{size}", f"compile/{size}", f"compile_noop/{size}"])
+
+    return names
+
+
+def run_case(paths: Paths, case: str, args: argparse.Namespace) -> float:
+    """Runs a benchmark case in this process and returns its duration in seconds"""
+
+    # pylint: disable=import-outside-toplevel
+    from d2tp.build import Build
+    from d2tp.game import Game
+    from d2tp.runner import Runner
+
+    name, _, param = case.partition("/")
+
+    def new_build() -> Build:
+        return Build(
+            steam_path=paths.steam,
+            proton_path=paths.proton,
+            build_path=paths.build,
+            prefix_path=paths.prefix,
+        )
+
+    def new_runner() -> Runner:
+        return Runner(build=new_build(), game=Game(paths.game), cache_path=paths.cache)
+
+    if name == "start_session":
+        if param == "cold":
+            shutil.rmtree(paths.build, ignore_errors=True)
+            shutil.rmtree(paths.prefix, ignore_errors=True)
+        else:
+            new_build().start_session()
+
+        build = new_build()
+        start = time.perf_counter()
+        build.start_session()
+
+        return time.perf_counter() - start
+
+    if name == "session_state":
+        new_build().session_state()
+
+        build = new_build()
+        start = time.perf_counter()
+        build.session_state()
+
+        return time.perf_counter() - start
+
+    if name == "wine_path":
+        runner = new_runner()
+
+        if param == "dosdevices":
+            targets = [paths.game.joinpath("content", f"file{i}.vmat") for i in range(1000)]
+        else:
+            targets = [paths.game.joinpath(f"file{i}?.vmat") for i in range(20)]
+
+        start = time.perf_counter()
+
+        for target in targets:
+            runner.wine_path(target)
+
+        return time.perf_counter() - start
+
+    size = int(param)
+    custom_game = Game(paths.game).custom_game(ADDON_NAME, paths.addon(size))
+
+    if name == "scan":
+        start = time.perf_counter()
+        custom_game.scan()
+
+        return time.perf_counter() - start
+
+    runner = new_runner()
+
+    if name == "compile":
+        shutil.rmtree(paths.cache, ignore_errors=True)
+    else:
+        runner.compile_custom_game(ADDON_NAME, paths.addon(size), jobs=args.jobs)
+
+    start = time.perf_counter()
+    results = runner.compile_custom_game(ADDON_NAME, paths.addon(size), jobs=args.jobs)
+    duration = time.perf_counter() - start
+
+    if not all(result.ok for result in results):
+        raise RuntimeError(f"compile jobs failed in case {case}")
+
+    return duration
+
+
+def time_case(paths: Paths, case: str, args: argparse.Namespace) -> float:
+    cmd = [
+        sys.executable,
+        __file__,
+        "--work-dir",
+        str(paths.work_dir),
+        "--jobs",
+        str(args.jobs),
+        "--case",
+        case,
+    ]
+    times = []
+
+    for _ in range(args.runs):
+        process = subprocess.run(cmd, capture_output=True, check=False, encoding="utf-8")
+
+        if process.returncode != 0:
+            sys.stderr.write(process.stderr)
+            raise RuntimeError(f"case {case} failed with exit code {process.returncode}")
+
+        times.append(json.loads(process.stdout)["seconds"])
+
+    return statistics.median(times)
+
+
+def load_baseline(file: Path) -> dict[str, float]:
+    try:
+        data = json.loads(file.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+
+    if data.get("version") != BASELINE_VERSION:
+        return {}
+
+    return data["results"]
+
+
+def save_baseline(file: Path, results: dict[str, float], args: argparse.Namespace) -> None:
+    data = {
+        "version": BASELINE_VERSION,
+        "settings": {
+            "run_latency": args.run_latency,
+            "file_latency": args.file_latency,
+            "boot_latency": args.boot_latency,
+            "jobs": args.jobs,
+            "runs": args.runs,
+        },
+        "results": results,
+    }
+
+    tmp_file = file.with_name(f".{file.name}.tmp")
+    tmp_file.write_text(json.dumps(data, indent=2) + "\n", encoding="utf-8")
+    os.replace(tmp_file, file)
+
+
+def report(
+    results: dict[str, float],
+    baseline: dict[str, float],
+    args: argparse.Namespace,
+) -> bool:
+    ok = True
+
+    print(f"{'case':<24} {'time':>10} {'baseline':>10} {'delta':>8}")
+
+    for case, seconds in results.items():
+        base = baseline.get(case)
+
+        if base is None:
+            print(f"{case:<24} {seconds:>9.3f}s {'-':>10} {'-':>8}")
+            continue
+
+        delta = (seconds - base) / base if base > 0 else 0.0
+        regressed = seconds - base > args.min_delta and delta > args.tolerance
+        mark = "  SLOWER" if regressed else ""
+
+        print(f"{case:<24} {seconds:>9.3f}s {base:>9.3f}s {delta:>+7.0%}{mark}")
+
+        if regressed:
+            ok = False
+
+    return ok
+
+
+def main() -> None:
+    args = parse_args()
+
+    if args.case is not None:
+        # keep the output of compiler runs out of the result
+        with os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8") as result:
+            os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+            seconds = run_case(Paths(args.work_dir), args.case, args)
+            result.write(json.dumps({"seconds": seconds}) + "\n")
+
+        return
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    work_dir = args.work_dir or Path(tempfile.mkdtemp(prefix="d2tp-bench-"))
+    paths = Paths(work_dir.resolve())
+
+    setup(paths, sizes, args)
+
+    results = {}
+
+    for case in cases(sizes):
+        print(f"running {case}", file=sys.stderr)
+        results[case] = time_case(paths, case, args)
+
+    ok = report(results, load_baseline(args.baseline), args)
+
+    if args.save_baseline:
+        save_baseline(args.baseline, results, args)
+        print(f"saved baseline {args.baseline}", file=sys.stderr)
+
+    if args.work_dir is None:
+        shutil.rmtree(work_dir)
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,418 @@
+"""Fake Proton, game and addon trees for benchmarks
+
+The fake Proton tree has the files listed in ``d2tp.build.PROTON_FILES``. Its ``proton`` module
+follows ``stubs/proton.pyi`` and its dist tarball contains a fake ``wine64`` that handles
+``winepath``, ``wineboot`` and ``resourcecompiler.exe`` (which sleep for a configurable latency,
+the compiler writing ``_c`` outputs and child resources for the textures they reference) and a
+fake ``wineserver`` supporting ``-p``, ``-k`` and ``-w``. Latencies are read from a JSON file at
+run time, so they can be changed without rebuilding the tree or invalidating session snapshots.
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import os
+import tarfile
+from pathlib import Path
+
+PROTON_VERSION = "7.0-5"
+
+PROTON_MODULE = """\
+import os
+import shutil
+import tarfile
+
+g_proton = None
+g_compatdata = None
+g_session = None
+
+
+class Proton:
+    def __init__(self, base_dir):
+        self.base_dir = base_dir + "/"
+        self.dist_dir = self.base_dir + "dist/"
+        self.bin_dir = self.dist_dir + "bin/"
+        self.lib_dir = self.dist_dir + "lib/"
+        self.lib64_dir = self.dist_dir + "lib64/"
+        self.fonts_dir = self.dist_dir + "share/fonts/"
+        self.version_file = self.base_dir + "version"
+        self.default_pfx_dir = self.dist_dir + "share/default_pfx/"
+        self.user_settings_file = self.base_dir + "user_settings.py"
+        self.wine_bin = self.bin_dir + "wine"
+        self.wine64_bin = self.bin_dir + "wine64"
+        self.wineserver_bin = self.bin_dir + "wineserver"
+        self.proton_dist_tarball = self.base_dir + "proton_dist.tar"
+
+    def need_tarball_extraction(self):
+        try:
+            with open(self.dist_dir + "version") as dist_f, open(self.version_file) as f:
+                return dist_f.read() != f.read()
+        except OSError:
+            return True
+
+    def extract_tarball(self):
+        shutil.rmtree(self.dist_dir, ignore_errors=True)
+
+        with tarfile.open(self.proton_dist_tarball) as tar:
+            tar.extractall(self.dist_dir)
+
+        shutil.copy(self.version_file, self.dist_dir + "version")
+
+    def missing_default_prefix(self):
+        return not os.path.isdir(self.default_pfx_dir)
+
+    def make_default_prefix(self):
+        system32 = self.default_pfx_dir + "drive_c/windows/system32/"
+        os.makedirs(system32, exist_ok=True)
+
+        for i in range(DLL_COUNT):
+            with open(system32 + "fake%d.dll" % i, "wb") as f:
+                f.write(os.urandom(DLL_SIZE))
+
+        with open(self.default_pfx_dir + "system.reg", "w") as f:
+            f.write("WINE REGISTRY Version 2\\n")
+
+
+class CompatData:
+    def __init__(self, base_dir):
+        self.base_dir = base_dir + "/"
+        self.prefix_dir = self.base_dir + "pfx/"
+        self.version_file = self.base_dir + "version"
+        self.config_info_file = self.base_dir + "config_info"
+        self.tracked_files_file = self.prefix_dir + "tracked_files"
+
+
+class Session:
+    def __init__(self):
+        self.env = dict(os.environ)
+
+    def init_wine(self):
+        self.env["WINEPREFIX"] = g_compatdata.prefix_dir
+        self.env["WINEDEBUG"] = "-all"
+
+    def init_session(self, update_prefix_files):
+        pfx = g_compatdata.prefix_dir
+
+        if not os.path.exists(g_compatdata.version_file):
+            tracked = []
+
+            for dir_path, _, file_names in os.walk(g_proton.default_pfx_dir):
+                rel_dir = os.path.relpath(dir_path, g_proton.default_pfx_dir)
+                os.makedirs(os.path.join(pfx, rel_dir), exist_ok=True)
+
+                for name in file_names:
+                    rel_path = os.path.normpath(os.path.join(rel_dir, name))
+                    shutil.copy2(os.path.join(dir_path, name), os.path.join(pfx, rel_path))
+
+                    if name.endswith(".dll"):
+                        tracked.append(rel_path)
+
+            with open(g_compatdata.tracked_files_file, "w") as f:
+                f.write("".join(rel_path + "\\n" for rel_path in tracked))
+
+        os.makedirs(pfx + "dosdevices", exist_ok=True)
+
+        for drive, target in (("c:", "../drive_c"), ("z:", "/")):
+            if not os.path.lexists(pfx + "dosdevices/" + drive):
+                os.symlink(target, pfx + "dosdevices/" + drive)
+
+        shutil.copy(g_proton.version_file, g_compatdata.version_file)
+"""
+
+WINE64_SCRIPT = """\
+#!/usr/bin/env python3
+import json
+import os
+import sys
+import time
+
+LATENCY_FILE = {latency_file!r}
+
+
+def native_path(dosdevices, path):
+    return os.path.join(dosdevices, path[:2].lower(), path[3:].replace("\\\\", "/"))
+
+
+def windows_path(dosdevices, path):
+    path = os.path.abspath(path)
+    best = None
+
+    for drive in os.listdir(dosdevices):
+        root = os.path.realpath(os.path.join(dosdevices, drive))
+
+        if path == root or path.startswith(root.rstrip("/") + "/"):
+            if best is None or len(root) > len(best[1]):
+                best = (drive, root)
+
+    rel_path = os.path.relpath(path, best[1])
+
+    return best[0].upper() + "\\\\" + ("" if rel_path == "." else rel_path.replace("/", "\\\\"))
+
+
+def latency():
+    with open(LATENCY_FILE) as f:
+        return json.load(f)
+
+
+def compile_files(dosdevices, args):
+    latencies = latency()
+
+    files = []
+
+    if "-i" in args:
+        files.append(args[args.index("-i") + 1])
+
+    if "-filelist" in args:
+        with open(native_path(dosdevices, args[args.index("-filelist") + 1])) as f:
+            files.extend(line.strip() for line in f if line.strip())
+
+    time.sleep(latencies["run"])
+    returncode = 0
+
+    for file in files:
+        start = time.perf_counter()
+        print("+- Compiling " + file, flush=True)
+        time.sleep(latencies["file"])
+
+        if "broken" in file:
+            print("ERROR: Failed to compile " + file, flush=True)
+            returncode = 1
+            continue
+
+        # files are relative to the game directory, the working directory
+        # maps compile to a .vpk, other resources to a _c file
+        dst = os.path.join("game", os.path.relpath(file, "content"))
+        dst = dst[: -len(".vmap")] + ".vpk" if dst.endswith(".vmap") else dst + "_c"
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+
+        with open(dst, "wb") as f:
+            f.write(file.encode())
+
+        # textures referenced by a resource compile to child resources named after the texture
+        addon_dir = os.path.join("game", *os.path.relpath(file, "content").split("/")[:2])
+
+        # raw inputs (e.g. the textures themselves) are binary
+        with open(file, "rb") as f:
+            data = f.read()
+
+        refs = [
+            ref.decode(errors="replace")
+            for ref in data.split(b'"')
+            if ref.lower().endswith(b".tga")
+        ]
+
+        for ref in refs:
+            child = os.path.join(addon_dir, ref[: -len(".tga")] + "_tga.vtex_c")
+            os.makedirs(os.path.dirname(child), exist_ok=True)
+
+            with open(child, "wb") as f:
+                f.write(ref.encode())
+
+        print("   (%.3fs)" % (time.perf_counter() - start), flush=True)
+
+    sys.exit(returncode)
+
+
+def main(args):
+    dosdevices = os.path.join(os.environ["WINEPREFIX"], "dosdevices")
+
+    if args[0] == "winepath":
+        if args[1] == "-w":
+            for path in args[2:]:
+                print(windows_path(dosdevices, path))
+        else:
+            for path in args[1:]:
+                print(native_path(dosdevices, path))
+    elif args[0] == "wineboot":
+        time.sleep(latency()["boot"])
+    elif args[0].lower().endswith("resourcecompiler.exe"):
+        compile_files(dosdevices, args[1:])
+    else:
+        os.execvp(args[0], args)
+
+
+main(sys.argv[1:])
+"""
+
+WINESERVER_SCRIPT = """\
+#!/usr/bin/env python3
+import os
+import signal
+import socket
+import sys
+import time
+
+prefix = os.stat(os.environ["WINEPREFIX"])
+server_dir = "/tmp/.wine-%d/server-%x-%x" % (os.getuid(), prefix.st_dev, prefix.st_ino)
+socket_path = os.path.join(server_dir, "socket")
+pid_file = os.path.join(server_dir, "fake.pid")
+arg = sys.argv[1] if len(sys.argv) > 1 else ""
+
+
+def serve(ready_fd, idle_timeout):
+    os.setsid()
+    os.makedirs(server_dir, exist_ok=True)
+
+    if os.path.lexists(socket_path):
+        os.unlink(socket_path)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen()
+
+    with open(pid_file, "w") as f:
+        f.write(str(os.getpid()))
+
+    def shutdown(*_):
+        os.unlink(socket_path)
+        os.unlink(pid_file)
+        os._exit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+
+    null_fd = os.open(os.devnull, os.O_RDWR)
+
+    for fd in (0, 1, 2):
+        os.dup2(null_fd, fd)
+
+    os.write(ready_fd, b"1")
+    os.close(ready_fd)
+
+    # without clients to track, a server with an idle timeout exits that long after the last
+    # connection
+    server.settimeout(idle_timeout)
+
+    while True:
+        try:
+            server.accept()[0].close()
+        except socket.timeout:
+            shutdown()
+
+
+if arg.startswith("-p"):
+    read_fd, write_fd = os.pipe()
+
+    if os.fork() == 0:
+        os.close(read_fd)
+        serve(write_fd, float(arg[2:]) if arg[2:] else None)
+
+    os.close(write_fd)
+    os.read(read_fd, 1)
+elif arg.startswith("-k"):
+    try:
+        with open(pid_file) as f:
+            os.kill(int(f.read()), signal.SIGTERM)
+    except (OSError, ValueError):
+        sys.exit(1)
+elif arg == "-w":
+    while os.path.exists(socket_path):
+        time.sleep(0.05)
+"""
+
+FILELOCK_MODULE = """\
+class FileLock:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+"""
+
+ADDONINFO = """\
+"AddonInfo"
+{
+    "maps" "%s"
+    "IsPlayable" "1"
+}
+"""
+
+
+def make_proton(
+    path: Path,
+    latency_file: Path,
+    dll_count: int = 200,
+    dll_size: int = 16384,
+) -> None:
+    """Creates a fake Proton tree at ``path`` whose default prefix has ``dll_count`` dlls"""
+
+    path.mkdir(parents=True, exist_ok=True)
+    path.joinpath("version").write_text(f"1650000000 proton-{PROTON_VERSION}\n", encoding="utf-8")
+    path.joinpath("filelock.py").write_text(FILELOCK_MODULE, encoding="utf-8")
+    path.joinpath("proton").write_text(
+        f"DLL_COUNT = {dll_count}\nDLL_SIZE = {dll_size}\n\n{PROTON_MODULE}", encoding="utf-8"
+    )
+
+    scripts = {
+        "bin/wine64": WINE64_SCRIPT.format(latency_file=str(latency_file)),
+        "bin/wineserver": WINESERVER_SCRIPT,
+    }
+
+    with tarfile.open(path.joinpath("proton_dist.tar"), "w") as tar:
+        for name, content in scripts.items():
+            data = content.encode("utf-8")
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mode = 0o755
+            tar.addfile(info, io.BytesIO(data))
+
+
+def set_latency(latency_file: Path, run: float, file: float, boot: float = 0.0) -> None:
+    """Sets the latency of compiler runs, compiled files and wineboot, in seconds"""
+
+    latency_file.write_text(
+        json.dumps({"run": run, "file": file, "boot": boot}), encoding="utf-8"
+    )
+
+
+def make_game(path: Path) -> None:
+    """Creates a fake dota 2 install at ``path``"""
+
+    compiler = path.joinpath("game", "bin", "win64", "resourcecompiler.exe")
+    compiler.parent.mkdir(parents=True, exist_ok=True)
+    compiler.touch()
+    path.joinpath("game", "dota_addons").mkdir(exist_ok=True)
+    path.joinpath("content", "dota_addons").mkdir(parents=True, exist_ok=True)
+
+
+def make_addon(path: Path, file_count: int, map_count: int = 4) -> None:
+    """Creates a synthetic addon source tree with ``file_count`` content files at ``path``
+
+    Assets are a mix of textures, materials referencing them and particles, spread over
+    directories of at most 100 files.
+    """
+
+    content = path.joinpath("content")
+    game = path.joinpath("game")
+    game.mkdir(parents=True, exist_ok=True)
+
+    maps = [f"map{i}" for i in range(map_count)]
+    game.joinpath("addoninfo.txt").write_text(ADDONINFO % " ".join(maps), encoding="utf-8")
+
+    content.joinpath("maps").mkdir(parents=True, exist_ok=True)
+
+    for name in maps:
+        content.joinpath("maps", f"{name}.vmap").write_text(
+            '"materials/dir0/asset1.vmat"\n', encoding="utf-8"
+        )
+
+    for i in range(file_count - map_count):
+        kind = ("textures", "materials", "particles")[i % 3]
+        dir_path = content.joinpath(kind, f"dir{i // 300}")
+
+        if i % 300 < 3:
+            dir_path.mkdir(parents=True, exist_ok=True)
+
+        if i % 3 == 0:
+            dir_path.joinpath(f"asset{i}.tga").write_bytes(os.urandom(64))
+        elif i % 3 == 1:
+            dir_path.joinpath(f"asset{i}.vmat").write_text(
+                f'"TextureColor" "textures/dir{i // 300}/asset{i - 1}.tga"\n', encoding="utf-8"
+            )
+        else:
+            dir_path.joinpath(f"asset{i}.vpcf").write_text(
+                f'"m_hMaterial" "materials/dir{i // 300}/asset{i - 1}.vmat"\n', encoding="utf-8"
+            )
@@ -0,0 +1,287 @@
+from __future__ import annotations
+
+import asyncio
+import codecs
+import io
+import os
+import signal
+import subprocess
+import sys
+from collections.abc import AsyncIterator, Callable, Iterable
+from contextlib import ExitStack, asynccontextmanager
+from pathlib import PosixPath, PureWindowsPath
+from subprocess import CompletedProcess
+from typing import TYPE_CHECKING, Final
+
+from .log import Logger
+from .runner import MAX_LINE, debug_cmd
+from .trace import span
+
+if TYPE_CHECKING:
+    from .report import CompileReport
+    from .runner import Runner
+
+LOG: Final = Logger(__name__)
+
+READ_SIZE: Final = 64 * 1024
+
+
+class AsyncRunner:
+    """Asyncio counterpart of :class:`Runner`'s command and resource compiler methods
+
+    Commands run in the runner's session environment, at most ``limit`` at once. Each command
+    runs in its own process group: when it times out or its task is cancelled, the whole group
+    (the wine process and every process it started) is killed.
+
+    Inside :meth:`Runner.prefix_pool` with at least ``limit`` prefixes, resource compiler
+    processes run in isolated worker prefixes.
+    """
+
+    runner: Runner
+    limit: int
+
+    def __init__(self, runner: Runner, limit: int = 1) -> None:
+        self.runner = runner
+        self.limit = limit
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def run(
+        self,
+        *args: str,
+        cwd: str | PosixPath | None = None,
+        capture: bool = False,
+        output: Callable[[str], None] | None = None,
+        env: dict[str, str] | None = None,
+        timeout: float | None = None,
+    ) -> CompletedProcess:
+        """Runs a command like :meth:`Runner.run`, raising if it fails
+
+        Raises :class:`subprocess.TimeoutExpired` if it does not exit within ``timeout`` seconds.
+        """
+
+        async with self._semaphore:
+            return await self._run(
+                *args,
+                cwd=cwd,
+                capture=capture,
+                output=output,
+                env=env,
+                timeout=timeout,
+            )
+
+    async def _run(
+        self,
+        *args: str,
+        cwd: str | PosixPath | None = None,
+        capture: bool = False,
+        output: Callable[[str], None] | None = None,
+        env: dict[str, str] | None = None,
+        timeout: float | None = None,
+    ) -> CompletedProcess:
+        cmd = [self.runner.state.wine64_bin, *args]
+
+        if env is None:
+            env = self.runner.state.env
+
+        debug_cmd(cmd, cwd=cwd, env=env)
+
+        with span("run", cmd=PureWindowsPath(args[0]).name if args else ""):
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                env=env,
+                cwd=cwd,
+                stdout=subprocess.PIPE if capture or output is not None else None,
+                stderr=subprocess.PIPE if capture else subprocess.STDOUT if output else None,
+                start_new_session=True,
+            )
+
+            try:
+                stdout, stderr = await asyncio.wait_for(
+                    communicate(process, capture, output), timeout
+                )
+            except asyncio.TimeoutError:
+                LOG.error("Command timed out after %ss, killing it: %r", timeout, cmd)
+                await kill(process)
+                raise subprocess.TimeoutExpired(cmd, timeout or 0) from None
+            except asyncio.CancelledError:
+                LOG.debug("command cancelled, killing it: %r", cmd)
+                await kill(process)
+                raise
+
+        assert process.returncode is not None
+
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, cmd, stdout, stderr)
+
+        return CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+    async def compile(
+        self,
+        *args: str,
+        force: bool = False,
+        report: CompileReport | None = None,
+        name: str = "compile",
+        timeout: float | None = None,
+    ) -> CompletedProcess:
+        """Runs the resource compiler like :meth:`Runner.compile`"""
+
+        cmd = self.runner.compiler_cmd(force=force)
+        cwd = self.runner.game.path
+
+        # the slot is taken before leasing a prefix, so leasing never waits for a free prefix
+        async with self._semaphore:
+            async with self.compiler_env() as env:
+                if report is None:
+                    return await self._run(*cmd, *args, cwd=cwd, env=env, timeout=timeout)
+
+                parser = report.parser(name)
+
+                try:
+                    process = await self._run(
+                        *cmd,
+                        *args,
+                        cwd=cwd,
+                        output=parser.feed,
+                        env=env,
+                        timeout=timeout,
+                    )
+                except subprocess.CalledProcessError as ex:
+                    parser.close(ex.returncode)
+                    raise
+                except (subprocess.TimeoutExpired, asyncio.CancelledError):
+                    parser.close(-signal.SIGKILL)
+                    raise
+
+        parser.close(process.returncode)
+
+        return process
+
+    @asynccontextmanager
+    async def compiler_env(self) -> AsyncIterator[dict[str, str] | None]:
+        """Leases a compiler environment like :meth:`Runner.compiler_env`, in a thread
+
+        Leasing may create a worker prefix or start a wineserver, which would block the event
+        loop. If the task is cancelled while leasing, the lease is released once taken.
+        """
+
+        lease = self.runner.compiler_env()
+        entered = asyncio.ensure_future(asyncio.to_thread(lease.__enter__))
+
+        def release(future: asyncio.Future) -> None:
+            if not future.cancelled() and future.exception() is None:
+                lease.__exit__(None, None, None)
+
+        try:
+            env = await asyncio.shield(entered)
+        except asyncio.CancelledError:
+            entered.add_done_callback(release)
+            raise
+
+        with ExitStack() as stack:
+            stack.push(lease)
+            yield env
+
+    async def compile_file(
+        self,
+        path: PosixPath,
+        force: bool = False,
+        report: CompileReport | None = None,
+        timeout: float | None = None,
+    ) -> CompletedProcess:
+        rel_path = str(self.runner.game_rel_path(path))
+
+        return await self.compile(
+            "-i",
+            rel_path,
+            force=force,
+            report=report,
+            name=rel_path,
+            timeout=timeout,
+        )
+
+    async def compile_filelist(  # pylint: disable=too-many-arguments
+        self,
+        paths: Iterable[PosixPath],
+        force: bool = False,
+        report: CompileReport | None = None,
+        name: str = "filelist",
+        timeout: float | None = None,
+    ) -> CompletedProcess:
+        with self.runner.filelist(paths) as filelist_proton_path:
+            return await self.compile(
+                "-filelist",
+                str(filelist_proton_path),
+                force=force,
+                report=report,
+                name=name,
+                timeout=timeout,
+            )
+
+
+async def communicate(
+    process: asyncio.subprocess.Process,
+    capture: bool,
+    output: Callable[[str], None] | None,
+) -> tuple[str | None, str | None]:
+    """Waits for ``process``, returning its captured output or streaming it to ``output``"""
+
+    if capture:
+        stdout, stderr = await process.communicate()
+
+        return stdout.decode("utf-8", errors="replace"), stderr.decode("utf-8", errors="replace")
+
+    if output is not None:
+        assert process.stdout is not None
+
+        await stream_lines(process.stdout, output)
+
+    await process.wait()
+
+    return None, None
+
+
+async def stream_lines(reader: asyncio.StreamReader, output: Callable[[str], None]) -> None:
+    """Echoes lines read from ``reader`` and passes each to ``output``
+
+    Newlines are translated and lines longer than :data:`MAX_LINE` are split, like
+    :func:`d2tp.runner.stream` does.
+    """
+
+    decoder = io.IncrementalNewlineDecoder(
+        codecs.getincrementaldecoder("utf-8")(errors="replace"), translate=True
+    )
+    pending = ""
+
+    def emit(line: str) -> None:
+        sys.stdout.write(line)
+        output(line)
+
+    while chunk := await reader.read(READ_SIZE):
+        pending += decoder.decode(chunk)
+        lines = pending.split("\n")
+        pending = lines.pop()
+
+        for line in lines:
+            emit(f"{line}\n")
+
+        while len(pending) >= MAX_LINE:
+            emit(pending[:MAX_LINE])
+            pending = pending[MAX_LINE:]
+
+    pending += decoder.decode(b"", final=True)
+
+    if pending:
+        emit(pending)
+
+    sys.stdout.flush()
+
+
+async def kill(process: asyncio.subprocess.Process) -> None:
+    """Kills the process group of ``process`` and waits for ``process`` to exit"""
+
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+    await process.wait()
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import subprocess
+from collections.abc import Callable
+from contextlib import nullcontext
+from pathlib import PosixPath
+from typing import TYPE_CHECKING, Final
+
+from .jobs import BatchFailure, batch
+from .log import Logger
+
+if TYPE_CHECKING:
+    from .custom_game import CustomGame
+    from .journal import CompileJournal
+    from .output_cache import OutputRecorder
+    from .report import CompileReport
+    from .runner import Runner
+
+LOG: Final = Logger(__name__)
+
+
+class BatchCompiler:  # pylint: disable=too-few-public-methods
+    """Compiles a custom game's assets in filelists, bisecting the batches that fail"""
+
+    runner: Runner
+    custom_game: CustomGame
+    force: bool
+    report: CompileReport | None
+    journal: CompileJournal | None
+    recorder: OutputRecorder | None
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        runner: Runner,
+        custom_game: CustomGame,
+        force: bool = False,
+        report: CompileReport | None = None,
+        journal: CompileJournal | None = None,
+        recorder: OutputRecorder | None = None,
+    ) -> None:
+        self.runner = runner
+        self.custom_game = custom_game
+        self.force = force
+        self.report = report
+        self.journal = journal
+        self.recorder = recorder
+
+    def compile(
+        self,
+        paths: list[PosixPath],
+        size: Callable[[PosixPath], int],
+        name: str = "filelist",
+    ) -> None:
+        """Compiles ``paths``, raising :class:`BatchFailure` with the files that failed"""
+
+        batches = batch(paths, self.runner.batch_files, self.runner.batch_bytes, weight=size)
+        failed: list[PosixPath] = []
+        error: subprocess.CalledProcessError | None = None
+
+        for i, batch_paths in enumerate(batches, start=1):
+            batch_name = name if len(batches) == 1 else f"{name} batch {i}/{len(batches)}"
+
+            try:
+                self._compile_batch(batch_paths, batch_name)
+            except subprocess.CalledProcessError as ex:
+                error = ex
+                failed.extend(self._bisect(batch_paths, batch_name))
+            else:
+                LOG.debug("  compiled %s", batch_name)
+
+        if failed:
+            assert error is not None
+
+            raise BatchFailure(error.returncode, error.cmd, failed)
+
+    def _compile_batch(self, paths: list[PosixPath], name: str) -> None:
+        with self.recorder.run(paths) if self.recorder is not None else nullcontext():
+            self.runner.compile_filelist(
+                self.custom_game.content_files(paths),
+                force=self.force,
+                report=self.report,
+                name=name,
+            )
+
+        if self.journal is not None:
+            self.journal.record(name, paths)
+
+    def _bisect(self, paths: list[PosixPath], name: str) -> list[PosixPath]:
+        """Recompiles the halves of a failed batch recursively, returns the files that fail"""
+
+        if len(paths) == 1:
+            return paths
+
+        LOG.warning("Batch %s failed, bisecting its %d files", name, len(paths))
+
+        half = len(paths) // 2
+        failed_halves: list[tuple[list[PosixPath], str]] = []
+
+        for i, half_paths in enumerate((paths[:half], paths[half:]), start=1):
+            half_name = f"{name}.{i}"
+
+            try:
+                self._compile_batch(half_paths, half_name)
+            except subprocess.CalledProcessError:
+                failed_halves.append((half_paths, half_name))
+
+        # the compiler itself fails (e.g. it can't start), not the batch's files
+        if len(failed_halves) == 2 and all(
+            failed_whole(self.report, half_name) for _, half_name in failed_halves
+        ):
+            LOG.error("Both halves of batch %s failed without compiling any file", name)
+
+            return paths
+
+        failed: list[PosixPath] = []
+
+        for half_paths, half_name in failed_halves:
+            failed.extend(self._bisect(half_paths, half_name))
+
+        return failed
+
+
+def failed_whole(report: CompileReport | None, name: str) -> bool:
+    """Returns whether the run ``name`` of ``report`` failed before compiling any file"""
+
+    if report is None:
+        return True
+
+    runs = [run for run in report.runs if run.name == name]
+
+    return not runs or runs[-1].files == 0
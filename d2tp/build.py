@@ -1,12 +1,17 @@
 from __future__ import annotations
 
+import fcntl
 import os
 import sys
 from collections.abc import Generator
 from pathlib import Path
-from typing import TYPE_CHECKING, Final
+from typing import TYPE_CHECKING, Any, Final, TextIO
 
+from . import __version__
+from .cache_gc import session_lock_file
 from .log import Logger
+from .session_cache import SessionCache, SessionState, mtime_ns, session_env_key
+from .trace import span
 from .version import ProtonVersion
 
 if TYPE_CHECKING:
@@ -41,6 +46,9 @@ class Build:  # pylint: disable=too-many-instance-attributes
     proton_path: Path
     build_path: Path
     prefix_path: Path
+    worker_prefix_path: Path
+    dist_store_path: Path
+    prefix_template_path: Path
 
     def __init__(
         self,
@@ -60,19 +68,32 @@ class Build:  # pylint: disable=too-many-instance-attributes
         self.compatdata = None
         self.session = None
         self._proton_version: ProtonVersion | None = None
+        self._session_state: SessionState | None = None
+        self._session_lock: TextIO | None = None
 
-        self._validate_version()
+        with span("validate_version"):
+            self._validate_version()
 
         LOG.debug("  found proton version = %s", self.proton_version)
 
         self.build_path: Path = build_path.joinpath(str(self.proton_version))
+        self.dist_store_path: Path = build_path.joinpath("dist-store")
+        self.prefix_template_path: Path = build_path.joinpath(
+            "prefix-templates", str(self.proton_version)
+        )
         self.prefix_path: Path = prefix_path.joinpath(str(self.proton_version))
+        self.worker_prefix_path: Path = prefix_path.joinpath("workers", str(self.proton_version))
 
         self._validate_files()
 
+        self.session_cache = SessionCache(self.build_path.joinpath("session.json"))
+
         LOG.debug("initialized Build")
         LOG.debug("  build_path = %s", self.build_path)
         LOG.debug("  prefix_path = %s", self.prefix_path)
+        LOG.debug("  worker_prefix_path = %s", self.worker_prefix_path)
+        LOG.debug("  dist_store_path = %s", self.dist_store_path)
+        LOG.debug("  prefix_template_path = %s", self.prefix_template_path)
 
     def _validate_files(self) -> None:
         for (src, _) in self.proton_files:
@@ -99,6 +120,31 @@ class Build:  # pylint: disable=too-many-instance-attributes
             )
 
     def _prepare(self) -> None:
+        self._lock_session()
+
+        with span("prepare"):
+            self._prepare_paths()
+
+    def _lock_session(self) -> None:
+        """Holds a shared lock on the build for the lifetime of the process
+
+        ``d2tp cache gc`` never evicts a build while its lock is held, and uses the lock file's
+        mtime as the time the build was last used.
+        """
+
+        if self._session_lock is not None:
+            return
+
+        file = session_lock_file(self.build_path)
+        file.parent.mkdir(parents=True, exist_ok=True)
+
+        self._session_lock = file.open("a")  # pylint: disable=consider-using-with
+        fcntl.flock(self._session_lock.fileno(), fcntl.LOCK_SH)
+        os.utime(file)
+
+        LOG.trace("  locked %s", file)
+
+    def _prepare_paths(self) -> None:
         LOG.debug("preparing build")
 
         steam_path_str = str(self.steam_path)
@@ -143,6 +189,61 @@ class Build:  # pylint: disable=too-many-instance-attributes
 
             yield src, dst
 
+    def _session_key(self) -> dict[str, Any]:
+        return {
+            "d2tp_version": __version__,
+            "proton_version": str(self.proton_version),
+            "steam_path": str(self.steam_path),
+            "proton_path": str(self.proton_path),
+            "prefix_path": str(self.prefix_path),
+            "proton_files": {str(src): mtime_ns(src) for src, _ in self.proton_files},
+            "prefix_version": mtime_ns(self.prefix_path.joinpath("version")),
+            "env": session_env_key(),
+        }
+
+    def session_state(self) -> SessionState:
+        """Returns the session state, restoring it from the session snapshot if still valid
+
+        Only if the snapshot is missing or stale a full session is started (see
+        :meth:`start_session`) and a new snapshot is saved.
+        """
+
+        if self._session_state is not None:
+            return self._session_state
+
+        self._prepare()
+
+        state = self.session_cache.load(self._session_key())
+
+        if state is None:
+            proton, compatdata, session = self.start_session()
+            state = SessionState(
+                env=session.env,
+                wine64_bin=proton.wine64_bin,
+                wineserver_bin=proton.wineserver_bin,
+                prefix_dir=compatdata.prefix_dir,
+            )
+
+            # the key is computed after starting the session, which may update the prefix
+            self.session_cache.save(self._session_key(), state)
+        else:
+            LOG.debug("restored session from snapshot")
+
+        self._session_state = state
+
+        return state
+
+    def _extract_tarball(self) -> None:
+        """Installs Proton's dist tarball through the shared :class:`DistStore`"""
+
+        assert self.proton is not None
+
+        from .dist import DistStore  # pylint: disable=import-outside-toplevel
+
+        tarball = self.proton_path.joinpath("proton_dist.tar")
+        store = DistStore(self.dist_store_path)
+        store.install(tarball, Path(self.proton.dist_dir), Path(self.proton.version_file))
+
     def start_session(self) -> tuple[Proton, CompatData, Session]:
         if self.proton and self.compatdata and self.session:
             return self.proton, self.compatdata, self.session
@@ -155,7 +256,8 @@ class Build:  # pylint: disable=too-many-instance-attributes
 
         LOG.trace("  sys.path = %r", sys.path)
 
-        import proton  # pylint: disable=import-outside-toplevel,import-error
+        with span("import_proton"):
+            import proton  # pylint: disable=import-outside-toplevel,import-error
 
         proton.g_proton = proton.Proton(str(self.build_path))
         proton.g_compatdata = proton.CompatData(str(self.prefix_path))
@@ -176,19 +278,49 @@ class Build:  # pylint: disable=too-many-instance-attributes
         if self.proton.need_tarball_extraction():
             LOG.debug("  extracting proton tarball")
 
-            self.proton.extract_tarball()
+            with span("extract_tarball"):
+                self._extract_tarball()
 
         LOG.debug("  initializing wine")
 
-        self.session.init_wine()
+        with span("init_wine"):
+            self.session.init_wine()
+
+        from .prefix import PrefixTemplate  # pylint: disable=import-outside-toplevel
+
+        template = PrefixTemplate(self.prefix_template_path)
+        default_pfx_dir = Path(self.proton.default_pfx_dir)
 
         if self.proton.missing_default_prefix():
-            LOG.debug("  creating default prefix")
+            with span("restore_default_prefix"):
+                restored = template.restore_default_prefix(default_pfx_dir)
+
+            if not restored:
+                LOG.debug("  creating default prefix")
+
+                with span("make_default_prefix"):
+                    self.proton.make_default_prefix()
 
-            self.proton.make_default_prefix()
+        if not Path(self.compatdata.version_file).exists():
+            with span("restore_prefix"):
+                template.restore_prefix(self.prefix_path)
 
         LOG.debug("  initializing session")
 
-        self.session.init_session(True)
+        with span("init_session"):
+            self.session.init_session(True)
+
+        if not template.exists:
+            with span("save_prefix_template"):
+                template.save(default_pfx_dir, self.prefix_path)
 
         return self.proton, self.compatdata, self.session
+
+    def clone_prefix(self, dst: Path) -> None:
+        """Creates a throwaway copy of this build's prefix at ``dst``, e.g. for a parallel job"""
+
+        from .prefix import clone_prefix  # pylint: disable=import-outside-toplevel
+
+        # the session state is only available once the prefix is initialized
+        self.session_state()
+        clone_prefix(self.prefix_path, dst)
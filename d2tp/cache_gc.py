@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import fcntl
+import os
+import shutil
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Final, NamedTuple
+
+from .log import Logger
+
+LOG: Final = Logger(__name__)
+
+COMPLETE_MARKER: Final = ".d2tp-complete"
+DIST_STORE_DIR: Final = "dist-store"
+PREFIX_TEMPLATES_DIR: Final = "prefix-templates"
+WORKER_PREFIXES_DIR: Final = "workers"
+
+SIZE_UNITS: Final = ["B", "K", "M", "G", "T"]
+
+
+class CacheItem(NamedTuple):
+    """Evictable unit of d2tp's cache directories, ``size`` is its disk usage in bytes
+
+    ``lock`` is the file sessions using the item hold a shared lock on, if any.
+    """
+
+    kind: str
+    name: str
+    paths: list[Path]
+    size: int
+    last_used: float
+    lock: Path | None
+
+
+class CacheDirs:
+    """d2tp's cache directories: Proton builds and prefixes, extracted dists, compiled outputs
+
+    Everything for a Proton version (build, prefix, worker prefixes and prefix template) is one
+    item, last used when a session of the version last started; sessions hold a shared lock on
+    it (see :func:`session_lock_file`). Extracted dists are last used when last installed into a
+    build, and output cache entries when last stored or restored. Compilation manifests and
+    reports are counted but never evicted, since they are small and dropping them would force
+    full recompilations.
+    """
+
+    build_path: Path
+    prefix_path: Path
+    cache_path: Path
+    output_cache_path: Path
+
+    def __init__(
+        self,
+        build_path: Path,
+        prefix_path: Path,
+        cache_path: Path,
+        output_cache_path: Path,
+    ) -> None:
+        self.build_path = build_path
+        self.prefix_path = prefix_path
+        self.cache_path = cache_path
+        self.output_cache_path = output_cache_path
+
+    def items(self) -> list[CacheItem]:
+        """Returns the evictable items, least recently used first"""
+
+        items = [*self._proton_items(), *self._dist_items(), *self._output_items()]
+
+        return sorted(items, key=lambda item: item.last_used)
+
+    def state_size(self) -> int:
+        """Returns the disk usage of compilation manifests, indexes and reports"""
+
+        return sum(
+            disk_usage(path)
+            for path in list_dirs(self.cache_path)
+            if path != self.output_cache_path
+        )
+
+    def gc(self, budget: int, dry_run: bool = False) -> list[CacheItem]:
+        """Evicts least recently used items until the total size is within ``budget`` bytes
+
+        Items held by a running session are skipped. Returns the evicted items.
+        """
+
+        items = self.items()
+        total = self.state_size() + sum(item.size for item in items)
+        evicted = []
+
+        LOG.debug("cache size %s, budget %s", format_size(total), format_size(budget))
+
+        for item in items:
+            if total <= budget:
+                break
+
+            with try_lock(item.lock) as locked:
+                if not locked:
+                    LOG.info("skipping %s %s, in use", item.kind, item.name)
+                    continue
+
+                LOG.info("evicting %s %s (%s)", item.kind, item.name, format_size(item.size))
+
+                if not dry_run:
+                    for path in item.paths:
+                        remove(path)
+
+            total -= item.size
+            evicted.append(item)
+
+        return evicted
+
+    def _proton_items(self) -> Iterator[CacheItem]:
+        templates_path = self.build_path.joinpath(PREFIX_TEMPLATES_DIR)
+        workers_path = self.prefix_path.joinpath(WORKER_PREFIXES_DIR)
+        versions: dict[str, list[Path]] = {}
+
+        for root, excluded in (
+            (self.build_path, (DIST_STORE_DIR, PREFIX_TEMPLATES_DIR)),
+            (self.prefix_path, (WORKER_PREFIXES_DIR,)),
+            (templates_path, ()),
+            (workers_path, ()),
+        ):
+            for path in list_dirs(root):
+                if path.name not in excluded:
+                    versions.setdefault(path.name, []).append(path)
+
+        for version, paths in versions.items():
+            lock = session_lock_file(self.build_path.joinpath(version))
+
+            yield CacheItem(
+                kind="proton",
+                name=version,
+                paths=paths,
+                size=sum(disk_usage(path) for path in paths),
+                last_used=last_used([lock, *paths]),
+                lock=lock,
+            )
+
+    def _dist_items(self) -> Iterator[CacheItem]:
+        store_path = self.build_path.joinpath(DIST_STORE_DIR)
+
+        for path in list_dirs(store_path):
+            yield CacheItem(
+                kind="dist",
+                name=path.name,
+                paths=[path],
+                size=disk_usage(path),
+                last_used=last_used([path.joinpath(COMPLETE_MARKER), path]),
+                lock=store_path.joinpath(f".{path.name}.lock"),
+            )
+
+    def _output_items(self) -> Iterator[CacheItem]:
+        for shard_path in list_dirs(self.output_cache_path):
+            for path in list_dirs(shard_path):
+                yield CacheItem(
+                    kind="outputs",
+                    name=path.name,
+                    paths=[path],
+                    size=disk_usage(path),
+                    last_used=last_used([path]),
+                    lock=None,
+                )
+
+
+def session_lock_file(build_path: Path) -> Path:
+    """Returns the file sessions of the build at ``build_path`` hold a shared lock on"""
+
+    return build_path.with_name(f".{build_path.name}.lock")
+
+
+@contextmanager
+def try_lock(file: Path | None) -> Iterator[bool]:
+    """Takes an exclusive lock on ``file`` if nobody holds one, yielding whether it did"""
+
+    if file is None:
+        yield True
+        return
+
+    file.parent.mkdir(parents=True, exist_ok=True)
+
+    with file.open("a") as f:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+
+        yield True
+
+
+def list_dirs(path: Path) -> list[Path]:
+    try:
+        with os.scandir(path) as entries:
+            return [
+                Path(entry.path)
+                for entry in entries
+                if entry.is_dir(follow_symlinks=False) and not entry.name.startswith(".")
+            ]
+    except FileNotFoundError:
+        return []
+
+
+def disk_usage(path: Path) -> int:
+    """Returns the disk usage of ``path``, splitting hardlinked files between their links"""
+
+    total = 0
+    dirs = [str(path)]
+
+    while dirs:
+        try:
+            with os.scandir(dirs.pop()) as entries:
+                for entry in entries:
+                    stat = entry.stat(follow_symlinks=False)
+
+                    if entry.is_dir(follow_symlinks=False):
+                        total += stat.st_blocks * 512
+                        dirs.append(entry.path)
+                    else:
+                        total += stat.st_blocks * 512 // max(stat.st_nlink, 1)
+        except OSError:
+            continue
+
+    return total
+
+
+def last_used(paths: list[Path]) -> float:
+    """Returns the mtime of the first of ``paths`` that exists"""
+
+    for path in paths:
+        try:
+            return path.stat().st_mtime
+        except FileNotFoundError:
+            continue
+
+    return 0.0
+
+
+def remove(path: Path) -> None:
+    """Removes ``path``, renaming it first so it never looks complete while half removed"""
+
+    trash = path.with_name(f".{path.name}.{os.getpid()}.gc")
+
+    try:
+        os.rename(path, trash)
+    except FileNotFoundError:
+        return
+
+    shutil.rmtree(trash, ignore_errors=True)
+
+
+def format_size(size: float) -> str:
+    for unit in SIZE_UNITS[:-1]:
+        if abs(size) < 1024:
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+
+        size /= 1024
+
+    return f"{size:.1f}{SIZE_UNITS[-1]}"
+
+
+def parse_size(value: str) -> int:
+    """Parses a size like ``512M`` or ``20G`` (powers of 1024) into bytes"""
+
+    value = value.strip().upper().removesuffix("B") or "0"
+    unit = value[-1]
+
+    if unit in SIZE_UNITS:
+        return int(float(value[:-1]) * 1024 ** SIZE_UNITS.index(unit))
+
+    return int(value)
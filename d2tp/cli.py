@@ -1,19 +1,27 @@
 from __future__ import annotations
 
 import argparse
+import os
 import sys
+from collections import deque
+from collections.abc import Iterator
+from functools import cache
 from pathlib import Path, PosixPath
-from typing import Final, NoReturn
-
-from appdirs import AppDirs
+from typing import TYPE_CHECKING, Final, NoReturn
 
 from . import APP_NAME
 from . import LOG as APP_LOG
 from . import __version__
-from .build import PROTON_MIN_VERSION, Build
-from .game import Game
 from .log import Level, Logger
-from .runner import Runner
+
+if TYPE_CHECKING:
+    from .cache_gc import CacheDirs
+    from .jobs import JobResult
+    from .runner import Runner
+
+# Modules needed by commands are imported where they are used, so that startup (and commands like
+# --version) only pay for what they need.
+# pylint: disable=import-outside-toplevel
 
 LOG: Final = Logger(__name__)
 
@@ -28,22 +36,90 @@ COMMANDS: Final[dict[str, str]] = {
 """,
     "compile_custom_game": """Compile a custom game using the resource compiler
 
-      compile_custom_game <name> <src_path>
+      compile_custom_game [--jobs N] [--shards N] <name> <src_path>
+""",
+    "compile_custom_games": """Compile several custom games with one shared pool of jobs
+
+      compile_custom_games [--jobs N] [--shards N] <addons_file>
+
+      <addons_file> lists one "<name> <src_path>" pair per line; empty lines and lines starting
+      with "#" are ignored, relative paths are relative to the file's directory.
 """,
-    "protonpath": """Converts a native path to Proton path
+    "watch": """Recompile a custom game's sources as they change
 
-      protonpath <native_path>
+      watch [--jobs N] [--shards N] <name> <src_path>
 """,
-    "nativepath": """Converts a Proton path to native path
+    "protonpath": """Converts native paths to Proton paths
 
-      nativepath <proton_path>
+      protonpath [--null] [<native_path>...]
+
+      Without arguments, paths are read from stdin, one per line (NUL separated with --null).
+""",
+    "nativepath": """Converts Proton paths to native paths
+
+      nativepath [--null] [<proton_path>...]
+
+      Without arguments, paths are read from stdin, one per line (NUL separated with --null).
+""",
+    "wineserver": """Control a persistent wineserver for the prefix, reused by later commands
+
+      wineserver start|stop [--kill]|status
+
+      A started server exits by itself a minute after its last client. stop waits for that, or
+      with --kill, kills the server and every wine process in the prefix.
+""",
+    "serve": """Serve commands from clients using --socket with a warm session
+
+      serve
+""",
+    "cache": """Show the disk usage of d2tp's caches, or evict from them down to --cache-budget
+
+      cache stats|gc
+
+      gc evicts Proton builds and prefixes, extracted dists and compiled outputs, least recently
+      used first. Builds in use by a running d2tp process are never evicted.
 """,
 }
 
-APP_DIRS: Final = AppDirs(appname=APP_NAME)
+CLIENT_ARGS: Final = [
+    "cmd",
+    "cmd_args",
+    "force",
+    "jobs",
+    "shards",
+    "resume",
+    "null",
+    "kill",
+    "verbosity",
+]
+
+# stdin read size when streaming NUL separated paths
+READ_SIZE: Final = 64 * 1024
+
+DEFAULT_CACHE_BUDGET: Final = "20G"
+
+
+@cache
+def user_cache_dir() -> Path:
+    from appdirs import AppDirs
+
+    return Path(AppDirs(appname=APP_NAME).user_cache_dir)
 
-DEFAULT_BUILD_PATH: Final = Path(APP_DIRS.user_cache_dir).joinpath("build")
-DEFAULT_PREFIX_PATH: Final = Path(APP_DIRS.user_cache_dir).joinpath("prefix")
+
+def default_build_path() -> Path:
+    return user_cache_dir().joinpath("build")
+
+
+def default_prefix_path() -> Path:
+    return user_cache_dir().joinpath("prefix")
+
+
+def default_cache_path() -> Path:
+    return user_cache_dir().joinpath("cache")
+
+
+def default_socket_path() -> Path:
+    return Path(os.environ.get("XDG_RUNTIME_DIR", user_cache_dir())).joinpath(f"{APP_NAME}.sock")
 
 
 def epilog() -> str:
@@ -103,7 +179,7 @@ def parse_args() -> argparse.Namespace:
         "-b",
         type=str,
         dest="build_path",
-        default=str(DEFAULT_BUILD_PATH),
+        default=str(default_build_path()),
         help="Build path [default: %(default)s]",
         metavar="PATH",
     )
@@ -113,18 +189,154 @@ def parse_args() -> argparse.Namespace:
         "-w",
         type=str,
         dest="prefix_path",
-        default=str(DEFAULT_PREFIX_PATH),
+        default=str(default_prefix_path()),
         help="Wine prefix path [default: %(default)s]",
         metavar="PATH",
     )
 
+    parser.add_argument(
+        "--cache-path",
+        "-c",
+        type=str,
+        dest="cache_path",
+        default=str(default_cache_path()),
+        help="Cache path (compilation manifests) [default: %(default)s]",
+        metavar="PATH",
+    )
+
+    parser.add_argument(
+        "--output-cache",
+        type=str,
+        dest="output_cache_path",
+        default=os.environ.get("D2TP_OUTPUT_CACHE"),
+        help=(
+            "Compiled outputs cache path, may be shared between machines "
+            "[default: $D2TP_OUTPUT_CACHE, or CACHE_PATH/outputs]"
+        ),
+        metavar="PATH",
+    )
+
+    parser.add_argument(
+        "--cache-budget",
+        type=str,
+        dest="cache_budget",
+        default=os.environ.get("D2TP_CACHE_BUDGET", DEFAULT_CACHE_BUDGET),
+        help="Total size 'cache gc' evicts down to, e.g. 512M or 20G [default: %(default)s]",
+        metavar="SIZE",
+    )
+
+    parser.add_argument(
+        "--socket",
+        type=str,
+        dest="socket_path",
+        default=os.environ.get("D2TP_SOCKET"),
+        help=(
+            "Send commands to the server listening on this socket, or listen on it with 'serve' "
+            f"[default: $D2TP_SOCKET, or {default_socket_path()} for 'serve']"
+        ),
+        metavar="PATH",
+    )
+
     parser.add_argument(
         "--force",
         "-f",
         action="store_true",
         dest="force",
         default=False,
-        help="Force resource compilation [default: %(default)s]",
+        help="Force resource compilation of all files [default: %(default)s]",
+    )
+
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=jobs_count,
+        dest="jobs",
+        default=1,
+        help=(
+            "Number of resource compiler processes to run at once, or 'auto' to pick it from the "
+            "CPU count, available memory and peak memory of past compiles [default: %(default)s]"
+        ),
+        metavar="N",
+    )
+
+    parser.add_argument(
+        "--shards",
+        type=positive_int,
+        dest="shards",
+        default=1,
+        help=(
+            "Number of filelists to split assets into, balanced by predicted compile time "
+            "[default: %(default)s]"
+        ),
+        metavar="N",
+    )
+
+    parser.add_argument(
+        "--batch-files",
+        type=positive_int,
+        dest="batch_files",
+        default=None,
+        help=(
+            "Maximum number of files per compiler filelist; a failed filelist is split to find "
+            "the failing files and compile the others [default: unlimited]"
+        ),
+        metavar="N",
+    )
+
+    parser.add_argument(
+        "--batch-size",
+        type=size_bytes,
+        dest="batch_bytes",
+        default=None,
+        help="Maximum total source size per compiler filelist, e.g. 64M [default: unlimited]",
+        metavar="SIZE",
+    )
+
+    parser.add_argument(
+        "--shared-prefix",
+        action="store_false",
+        dest="isolate_prefixes",
+        default=True,
+        help=(
+            "Run concurrent resource compiler processes in the build's prefix instead of one "
+            "worker prefix each"
+        ),
+    )
+
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        dest="resume",
+        default=False,
+        help=(
+            "Skip files an interrupted compilation completed, if their inputs are unchanged "
+            "[default: %(default)s]"
+        ),
+    )
+
+    parser.add_argument(
+        "--null",
+        "-z",
+        action="store_true",
+        dest="null",
+        default=False,
+        help="Read and write NUL separated paths in protonpath/nativepath [default: %(default)s]",
+    )
+
+    parser.add_argument(
+        "--kill",
+        action="store_true",
+        dest="kill",
+        default=False,
+        help="Make wineserver stop kill the server and its wine processes [default: %(default)s]",
+    )
+
+    parser.add_argument(
+        "--trace-file",
+        type=str,
+        dest="trace_file",
+        help="Write timings of d2tp's phases to this file as Chrome trace JSON",
+        metavar="PATH",
     )
 
     parser.add_argument(
@@ -142,8 +354,42 @@ def parse_args() -> argparse.Namespace:
     return parser.parse_args()
 
 
+def positive_int(value: str) -> int:
+    number = int(value)
+
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"invalid positive integer: {value!r}")
+
+    return number
+
+
+def jobs_count(value: str) -> int:
+    """Parses a job count, ``auto`` is returned as 0"""
+
+    if value == "auto":
+        return 0
+
+    return positive_int(value)
+
+
+def size_bytes(value: str) -> int:
+    from .cache_gc import parse_size
+
+    try:
+        size = parse_size(value)
+    except ValueError:
+        size = 0
+
+    if size < 1:
+        raise argparse.ArgumentTypeError(f"invalid size: {value!r}")
+
+    return size
+
+
 def resolve_proton_path(steam_path, value=None):
     if value is None:
+        from .build import PROTON_MIN_VERSION
+
         min_version = f"{PROTON_MIN_VERSION.major}.{PROTON_MIN_VERSION.minor}"
         return steam_path.joinpath("steamapps", "common", f"Proton {min_version}")
 
@@ -160,32 +406,84 @@ def validate_path(path: Path) -> None:
         raise ValueError(f"Path {path} not found")
 
 
+def set_verbosity(verbosity: int) -> None:
+    if verbosity >= 3:
+        APP_LOG.setLevel(Level.TRACE)
+    elif verbosity == 2:
+        APP_LOG.setLevel(Level.DEBUG)
+    elif verbosity == 1:
+        APP_LOG.setLevel(Level.INFO)
+
+
 def main() -> NoReturn:
     """d2tp entrypoint"""
 
+    # fast path, skips building the argument parser
+    if sys.argv[1:] == ["--version"]:
+        print(f"{APP_NAME} {__version__}")
+        sys.exit(0)
+
     args = parse_args()
 
     if args.cmd not in COMMANDS:
         LOG.error("Invalid command %s", args.cmd)
         sys.exit(1)
 
-    if args.verbosity >= 3:
-        APP_LOG.setLevel(Level.TRACE)
-    elif args.verbosity == 2:
-        APP_LOG.setLevel(Level.DEBUG)
-    elif args.verbosity == 1:
-        APP_LOG.setLevel(Level.INFO)
+    set_verbosity(args.verbosity)
+
+    if args.trace_file is not None:
+        start_trace(PosixPath(args.trace_file).resolve())
 
     steam_path = PosixPath(args.steam_path).resolve()
     proton_path = resolve_proton_path(steam_path, args.proton_path)
     game_path = resolve_game_path(steam_path, args.game_path)
     build_path = PosixPath(args.build_path).resolve()
     prefix_path = PosixPath(args.prefix_path).resolve()
+    cache_path = PosixPath(args.cache_path).resolve()
+    output_cache_path = (
+        cache_path.joinpath("outputs")
+        if args.output_cache_path is None
+        else PosixPath(args.output_cache_path).resolve()
+    )
+
+    config = {
+        "steam_path": str(steam_path),
+        "proton_path": str(proton_path),
+        "game_path": str(game_path),
+        "build_path": str(build_path),
+        "prefix_path": str(prefix_path),
+        "cache_path": str(cache_path),
+        "output_cache_path": str(output_cache_path),
+        "isolate_prefixes": str(args.isolate_prefixes),
+        "batch_files": str(args.batch_files),
+        "batch_bytes": str(args.batch_bytes),
+    }
+
+    if args.cmd == "cache":
+        from .cache_gc import CacheDirs
+
+        cache_dirs = CacheDirs(
+            build_path=build_path,
+            prefix_path=prefix_path,
+            cache_path=cache_path,
+            output_cache_path=output_cache_path,
+        )
+        sys.exit(manage_cache(cache_dirs, args.cmd_args, args.cache_budget))
+
+    if args.socket_path is not None and args.cmd != "serve":
+        from .server import request_command
+
+        client_args = {name: getattr(args, name) for name in CLIENT_ARGS}
+        sys.exit(request_command(Path(args.socket_path), client_args, config))
 
     validate_path(steam_path)
     validate_path(proton_path)
     validate_path(game_path)
 
+    from .build import Build
+    from .game import Game
+    from .runner import Runner
+
     build = Build(
         steam_path=steam_path,
         proton_path=proton_path,
@@ -194,7 +492,225 @@ def main() -> NoReturn:
     )
 
     game = Game(path=game_path)
-    runner = Runner(build=build, game=game)
+    runner = Runner(
+        build=build,
+        game=game,
+        cache_path=cache_path,
+        output_cache_path=output_cache_path,
+        isolate_prefixes=args.isolate_prefixes,
+        batch_files=args.batch_files,
+        batch_bytes=args.batch_bytes,
+    )
+
+    if args.cmd == "serve":
+        from .server import Server
+
+        socket_path = (
+            default_socket_path() if args.socket_path is None else Path(args.socket_path)
+        )
+        server = Server(runner, socket_path, handler=run_command, config=config)
+
+        try:
+            with runner.persistent_wineserver(lazy=False):
+                server.serve()
+        except KeyboardInterrupt:
+            pass
+
+        sys.exit(0)
+
+    from .trace import span
+
+    with span("command", cmd=args.cmd):
+        returncode = run_command(runner, args)
+
+    sys.exit(returncode)
+
+
+def control_wineserver(runner: Runner, cmd_args: list[str], kill: bool = False) -> int:
+    from .wineserver import PERSISTENT_IDLE_TIMEOUT
+
+    action = cmd_args[0] if cmd_args else "status"
+    running = runner.wineserver.running
+
+    if action == "start":
+        if running:
+            print("wineserver already running")
+        else:
+            runner.start_wineserver(PERSISTENT_IDLE_TIMEOUT)
+            print("wineserver started")
+    elif action == "stop":
+        if running and kill:
+            runner.wineserver.kill()
+            print("wineserver killed")
+        elif running:
+            print("waiting for wineserver to exit")
+            runner.wineserver.wait()
+            print("wineserver stopped")
+        else:
+            print("wineserver not running")
+    elif action == "status":
+        state = "running" if running else "not running"
+        print(f"wineserver {state} ({runner.wineserver.server_dir})")
+
+        return 0 if running else 3
+    else:
+        LOG.error("Invalid wineserver action %s", action)
+        return 1
+
+    return 0
+
+
+def manage_cache(cache_dirs: CacheDirs, cmd_args: list[str], budget_arg: str) -> int:
+    from .cache_gc import format_size, parse_size
+
+    action = cmd_args[0] if cmd_args else "stats"
+
+    try:
+        budget = parse_size(budget_arg)
+    except ValueError:
+        LOG.error("Invalid cache budget %s", budget_arg)
+        return 1
+
+    if action == "gc":
+        evicted = cache_dirs.gc(budget)
+        freed = sum(item.size for item in evicted)
+        print(f"evicted {len(evicted)} entries, freed {format_size(freed)}")
+    elif action == "stats":
+        kinds: dict[str, list[int]] = {}
+
+        for item in cache_dirs.items():
+            kinds.setdefault(item.kind, []).append(item.size)
+
+        rows = [(kind, str(len(sizes)), sum(sizes)) for kind, sizes in kinds.items()]
+        rows.append(("state", "-", cache_dirs.state_size()))
+        rows.append(("total", "", sum(size for _, _, size in rows)))
+        rows.append(("budget", "", budget))
+
+        print(f"{'kind':<8} {'entries':>8} {'size':>9}")
+
+        for kind, count, size in rows:
+            print(f"{kind:<8} {count:>8} {format_size(size):>9}")
+    else:
+        LOG.error("Invalid cache action %s", action)
+        return 1
+
+    return 0
+
+
+def read_addons_file(file: PosixPath) -> list[tuple[str, PosixPath]]:
+    addons = []
+
+    for line in file.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+
+        if not line or line.startswith("#"):
+            continue
+
+        try:
+            name, src_path = line.split(maxsplit=1)
+        except ValueError as ex:
+            raise ValueError(f"Invalid line in addons file {file}: {line!r}") from ex
+
+        addons.append((name, file.parent.joinpath(src_path).resolve()))
+
+    return addons
+
+
+def print_addon_results(addon_results: dict[str, list[JobResult]]) -> None:
+    width = max([len("addon"), *(len(name) for name in addon_results)])
+
+    print(f"{'addon':<{width}} {'jobs':>6} {'failed':>6} {'time':>9}")
+
+    for name, results in [*addon_results.items(), ("total", sum(addon_results.values(), []))]:
+        failed = sum(1 for result in results if not result.ok)
+        duration = sum(result.duration for result in results)
+
+        print(f"{name:<{width}} {len(results):>6} {failed:>6} {duration:>8.1f}s")
+
+
+def convert_paths(runner: Runner, paths: list[str], windows: bool, null: bool) -> None:
+    """Prints converted ``paths``, or paths read from stdin, in order as they are converted"""
+
+    separator = b"\0" if null else b"\n"
+    out = sys.stdout.buffer
+    streaming = not paths
+
+    if paths:
+        converted_paths = runner.wine_paths(paths, windows=windows)
+    else:
+        reader = PathReader(null)
+        converted_paths = runner.wine_paths(reader, windows=windows, ready=reader.ready)
+
+    for converted in converted_paths:
+        if not windows:
+            converted = PosixPath(converted).resolve()
+
+        out.write(os.fsencode(str(converted)) + separator)
+
+        if streaming:
+            out.flush()
+
+    out.flush()
+
+
+class PathReader:
+    """Reads newline or NUL separated paths from stdin as they arrive, skipping empty ones"""
+
+    null: bool
+
+    def __init__(self, null: bool) -> None:
+        self.null = null
+        self._fd = sys.stdin.fileno()
+        self._paths: deque[bytes] = deque()
+
+    def __iter__(self) -> Iterator[str]:
+        separator = b"\0" if self.null else b"\n"
+        buffer = b""
+
+        while True:
+            while self._paths:
+                yield os.fsdecode(self._paths.popleft())
+
+            if not (chunk := os.read(self._fd, READ_SIZE)):
+                break
+
+            *paths, buffer = (buffer + chunk).split(separator)
+            self._paths.extend(path for path in map(self._strip, paths) if path)
+
+        if buffer := self._strip(buffer):
+            yield os.fsdecode(buffer)
+
+    def ready(self) -> bool:
+        """Whether more input is available without waiting (including the end of input)"""
+
+        import select
+
+        return bool(self._paths) or bool(select.select([self._fd], [], [], 0)[0])
+
+    def _strip(self, path: bytes) -> bytes:
+        return path if self.null else path.rstrip(b"\r")
+
+
+def start_trace(file: Path) -> None:
+    """Records spans of this process, writing them to ``file`` and a summary to stderr at exit"""
+
+    import atexit
+
+    from .trace import enable
+
+    tracer = enable()
+
+    def finish() -> None:
+        tracer.write(file)
+        tracer.summary()
+
+    atexit.register(finish)
+
+
+def run_command(runner: Runner, args: argparse.Namespace) -> int:
+    """Runs a command, returns its exit code"""
+
+    set_verbosity(args.verbosity)
 
     if args.cmd == "run":
         runner.run(*args.cmd_args)
@@ -202,10 +718,58 @@ def main() -> NoReturn:
         runner.compile(*args.cmd_args, force=args.force)
     elif args.cmd == "compile_custom_game":
         name, src_path = args.cmd_args
-        runner.compile_custom_game(name, src_path, force=args.force)
-    elif args.cmd == "protonpath":
-        print(runner.wine_path(args.cmd_args[0]))
-    elif args.cmd == "nativepath":
-        print(runner.native_path(args.cmd_args[0]).resolve())
 
-    sys.exit(0)
+        with runner.persistent_wineserver():
+            results = runner.compile_custom_game(
+                name,
+                src_path,
+                force=args.force,
+                jobs=args.jobs,
+                shards=args.shards,
+                resume=args.resume,
+            )
+
+        if not all(result.ok for result in results):
+            return 1
+    elif args.cmd == "compile_custom_games":
+        (addons_file,) = args.cmd_args
+
+        with runner.persistent_wineserver():
+            addon_results = runner.compile_custom_games(
+                read_addons_file(PosixPath(addons_file)),
+                force=args.force,
+                jobs=args.jobs,
+                shards=args.shards,
+                resume=args.resume,
+            )
+
+        print_addon_results(addon_results)
+
+        if not all(result.ok for results in addon_results.values() for result in results):
+            return 1
+    elif args.cmd == "watch":
+        from .watch import Watcher
+
+        name, src_path = args.cmd_args
+        watcher = Watcher(
+            runner,
+            runner.game.custom_game(name, src_path),
+            jobs=args.jobs,
+            shards=args.shards,
+            resume=args.resume,
+        )
+
+        try:
+            with runner.persistent_wineserver():
+                watcher.watch()
+        except KeyboardInterrupt:
+            pass
+    elif args.cmd == "wineserver":
+        return control_wineserver(runner, args.cmd_args, kill=args.kill)
+    elif args.cmd in ("protonpath", "nativepath"):
+        convert_paths(runner, args.cmd_args, windows=args.cmd == "protonpath", null=args.null)
+    else:
+        LOG.error("Invalid command %s", args.cmd)
+        return 1
+
+    return 0
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import errno
+import fcntl
+import os
+import shutil
+from collections.abc import Callable
+from enum import Enum
+from pathlib import Path
+from typing import Final
+
+from .log import Logger
+
+LOG: Final = Logger(__name__)
+
+# linux/fs.h: _IOW(0x94, 9, int)
+FICLONE: Final = 0x40049409
+
+# errors meaning a clone method is not supported between two paths
+UNSUPPORTED_ERRNOS: Final = frozenset(
+    {errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.EPERM, errno.EMLINK}
+)
+
+
+class CloneMethod(Enum):
+    REFLINK = "reflink"
+    HARDLINK = "hardlink"
+    COPY = "copy"
+
+
+def reflink(src: str | Path, dst: str | Path) -> None:
+    """Creates ``dst`` as a copy-on-write clone of ``src`` (btrfs, xfs, ...)"""
+
+    with open(src, "rb") as src_f, open(dst, "wb") as dst_f:
+        try:
+            fcntl.ioctl(dst_f.fileno(), FICLONE, src_f.fileno())
+        except OSError:
+            dst_f.close()
+            os.unlink(dst)
+            raise
+
+    shutil.copystat(src, dst)
+
+
+def clone_file(src: str | Path, dst: str | Path, method: CloneMethod) -> None:
+    if method is CloneMethod.REFLINK:
+        reflink(src, dst)
+    elif method is CloneMethod.HARDLINK:
+        os.link(src, dst)
+    else:
+        shutil.copy2(src, dst, follow_symlinks=False)
+
+
+class TreeCloner:
+    """Clones directory trees file by file, preferring the cheapest method that works
+
+    Files are reflinked where the filesystem supports it, otherwise hardlinked, otherwise copied.
+    Once a method fails as unsupported, the next one is used for the remaining files. Hardlinked
+    files share their content with the source, so they must not be modified in place; files for
+    which ``hardlink_filter`` (called with the path relative to the source root) returns ``False``
+    are copied instead of hardlinked.
+    """
+
+    methods: list[CloneMethod]
+    hardlink_filter: Callable[[str], bool] | None
+
+    def __init__(
+        self,
+        methods: list[CloneMethod] | None = None,
+        hardlink_filter: Callable[[str], bool] | None = None,
+    ) -> None:
+        self.methods = list(CloneMethod) if methods is None else methods
+        self.hardlink_filter = hardlink_filter
+
+    @property
+    def method(self) -> CloneMethod:
+        return self.methods[0]
+
+    def clone(self, src: Path, dst: Path) -> None:
+        LOG.debug("cloning %s -> %s (%s)", src, dst, self.method.value)
+
+        dst.mkdir(parents=True, exist_ok=True)
+
+        for dir_path, dir_names, file_names in os.walk(src):
+            rel_dir = os.path.relpath(dir_path, src)
+            dst_dir = os.path.normpath(os.path.join(dst, rel_dir))
+
+            for name in dir_names:
+                src_path = os.path.join(dir_path, name)
+                dst_path = os.path.join(dst_dir, name)
+
+                if os.path.islink(src_path):
+                    copy_symlink(src_path, dst_path)
+                else:
+                    os.makedirs(dst_path, exist_ok=True)
+                    shutil.copymode(src_path, dst_path)
+
+            for name in file_names:
+                src_path = os.path.join(dir_path, name)
+                dst_path = os.path.join(dst_dir, name)
+
+                if os.path.islink(src_path):
+                    copy_symlink(src_path, dst_path)
+                else:
+                    rel_path = os.path.normpath(os.path.join(rel_dir, name))
+                    self.clone_file(src_path, dst_path, rel_path)
+
+    def clone_file(self, src: str | Path, dst: str | Path, rel_path: str | None = None) -> None:
+        if os.path.lexists(dst):
+            os.unlink(dst)
+
+        while True:
+            method = self.method
+
+            if (
+                method is CloneMethod.HARDLINK
+                and self.hardlink_filter is not None
+                and rel_path is not None
+                and not self.hardlink_filter(rel_path)
+            ):
+                method = CloneMethod.COPY
+
+            try:
+                clone_file(src, dst, method)
+                return
+            except OSError as ex:
+                if ex.errno not in UNSUPPORTED_ERRNOS or len(self.methods) == 1:
+                    raise
+
+                LOG.debug(
+                    "  %s not supported (%s), falling back to %s",
+                    self.method.value,
+                    ex,
+                    self.methods[1].value,
+                )
+
+                self.methods.pop(0)
+
+
+def copy_symlink(src: str | Path, dst: str | Path) -> None:
+    if os.path.lexists(dst):
+        if os.path.isdir(dst) and not os.path.islink(dst):
+            shutil.rmtree(dst)
+        else:
+            os.unlink(dst)
+
+    os.symlink(os.readlink(src), dst)
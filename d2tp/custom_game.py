@@ -1,17 +1,39 @@
 from __future__ import annotations
 
-from collections.abc import Generator
+import os
+from collections.abc import Generator, Iterable
 from pathlib import PosixPath
-from typing import TYPE_CHECKING, TypedDict
+from stat import S_ISREG
+from typing import TYPE_CHECKING, Final, NamedTuple, TypedDict
 
-import vdf
+from .log import Logger
+from .trace import span
 
 if TYPE_CHECKING:
     from .game import Game
 
+LOG: Final = Logger(__name__)
+
+MAP_SUFFIX: Final = ".vmap"
+
 ERRF_INVALID_ADDONINFO_FILE = "Invalid addoninfo file {file}: missing addon name key {name}"
 
 
+class SourceFile(NamedTuple):
+    """File found in a custom game's source content directory"""
+
+    path: PosixPath
+    rel_path: str
+    stat: os.stat_result
+
+
+class SourceTree(NamedTuple):
+    """Source content files split into maps and assets"""
+
+    maps: list[SourceFile]
+    assets: list[SourceFile]
+
+
 class CustomGame:  # pylint: disable=too-many-instance-attributes
     game: Game
     name: str
@@ -32,14 +54,15 @@ class CustomGame:  # pylint: disable=too-many-instance-attributes
         self.content_path = self.game.addons_content_path.joinpath(self.name)
         self.game_path = self.game.addons_game_path.joinpath(self.name)
         self._addoninfo: AddonInfo | None = None
-        self._maps_glob: str = str(PosixPath("**", "*.vmap"))
-        self._assets_glob: str = str(PosixPath("**", "*"))
+        self._files: SourceTree | None = None
 
     @property
     def addoninfo(self) -> AddonInfo:
         if self._addoninfo is not None:
             return self._addoninfo
 
+        import vdf  # pylint: disable=import-outside-toplevel
+
         data = self.addoninfo_file.read_text(encoding="utf-8")
         addoninfo_kv = vdf.loads(data)
 
@@ -53,21 +76,97 @@ class CustomGame:  # pylint: disable=too-many-instance-attributes
         return self._addoninfo
 
     @property
-    def map_files(self) -> Generator[PosixPath, None, None]:
-        for path in self.src_content_path.glob(self._maps_glob):
-            if path.is_dir():
-                continue
+    def files(self) -> SourceTree:
+        """Source content files, scanned on first access (see :meth:`scan`)"""
+
+        if self._files is None:
+            self._files = self.scan()
+
+        return self._files
 
-            yield path
+    @property
+    def map_files(self) -> Generator[PosixPath, None, None]:
+        for file in self.files.maps:
+            yield file.path
 
     @property
     def asset_files(self) -> Generator[PosixPath, None, None]:
-        for path in self.src_content_path.glob(self._assets_glob):
-            if path.is_dir():
-                continue
+        for file in self.files.assets:
+            yield file.path
+
+    def scan(self) -> SourceTree:
+        """Walks the source content directory once, splitting files into maps and assets
+
+        Directory symlinks are not followed, so cycles and shared directories can't be scanned
+        twice: they are skipped, like broken symlinks.
+        """
+
+        LOG.debug("scanning %s", self.src_content_path)
+
+        files = SourceTree(maps=[], assets=[])
+        dirs = [(str(self.src_content_path), "")]
+
+        with span("scan"):
+            while dirs:
+                dir_path, rel_dir = dirs.pop()
+
+                with os.scandir(dir_path) as entries:
+                    for entry in entries:
+                        rel_path = f"{rel_dir}{entry.name}"
+
+                        if entry.is_dir(follow_symlinks=False):
+                            dirs.append((entry.path, f"{rel_path}/"))
+                            continue
+
+                        try:
+                            stat = entry.stat()
+                        except FileNotFoundError:
+                            LOG.warning("Skipping broken symlink %s", entry.path)
+                            continue
+
+                        if not S_ISREG(stat.st_mode):
+                            LOG.debug("  skipping directory symlink %s", entry.path)
+                            continue
+
+                        file = SourceFile(
+                            path=PosixPath(entry.path), rel_path=rel_path, stat=stat
+                        )
+
+                        if entry.name.endswith(MAP_SUFFIX):
+                            files.maps.append(file)
+                        else:
+                            files.assets.append(file)
+
+        LOG.debug("  found %d maps and %d assets", len(files.maps), len(files.assets))
+
+        self._files = files
+
+        return files
+
+    def source_file(self, path: str | PosixPath) -> SourceFile | None:
+        """Returns the source file at ``path``, or ``None`` if it is not a source content file"""
+
+        path = PosixPath(path)
+
+        try:
+            rel_path = str(path.relative_to(self.src_content_path))
+            stat = path.stat()
+        except (ValueError, FileNotFoundError):
+            return None
+
+        if not S_ISREG(stat.st_mode):
+            return None
+
+        return SourceFile(path=path, rel_path=rel_path, stat=stat)
+
+    def content_file(self, src_file: PosixPath) -> PosixPath:
+        """Converts a file in ``src_content_path`` to its path in ``content_path``"""
+
+        return self.content_path.joinpath(src_file.relative_to(self.src_content_path))
 
-            if not path.match(self._maps_glob):
-                yield path
+    def content_files(self, src_files: Iterable[PosixPath]) -> Generator[PosixPath, None, None]:
+        for src_file in src_files:
+            yield self.content_file(src_file)
 
     def setup(self) -> None:
         if self.content_path.exists():
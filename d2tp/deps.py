@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import json
+import re
+from collections.abc import Iterable
+from pathlib import Path, PurePosixPath
+from typing import TYPE_CHECKING, Final, NamedTuple
+
+from .log import Logger
+from .util import stat_matches, write_json_atomic
+
+if TYPE_CHECKING:
+    from .custom_game import SourceFile
+
+LOG: Final = Logger(__name__)
+
+DEPS_VERSION: Final = 1
+
+# text based content formats scanned for references
+SCANNED_SUFFIXES: Final = (".vmat", ".vmdl", ".vpcf", ".vmap", ".vtex", ".vsndevts")
+
+# quoted strings that look like file paths, e.g. "materials/foo.vmat" or "textures\\foo.tga"
+REFERENCE_RE: Final = re.compile(rb'"([^"\r\n]+\.[A-Za-z0-9_]+)"')
+BINARY_HEADERS: Final = (b"<!-- dmx encoding:binary", b"<!-- kv3 encoding:binary")
+HEADER_SIZE: Final = 512
+
+# raw inputs (images, meshes, sounds) the compiler turns into child resources of the sources
+# referencing them
+RAW_INPUT_SUFFIXES: Final = frozenset(
+    [
+        # images
+        ".tga",
+        ".png",
+        ".psd",
+        ".jpg",
+        ".jpeg",
+        ".tif",
+        ".tiff",
+        ".bmp",
+        ".exr",
+        ".hdr",
+        ".pfm",
+        # meshes and animations
+        ".fbx",
+        ".obj",
+        ".dmx",
+        ".smd",
+        # sounds
+        ".wav",
+        ".mp3",
+    ]
+)
+
+
+class DependencyEntry(NamedTuple):
+    """References found in a source file"""
+
+    size: int
+    mtime_ns: int
+    refs: list[str]
+
+
+class DependencyIndex:
+    """Persistent index of references between a custom game's source files
+
+    Text based Source 2 content files are scanned for quoted paths. References are stored
+    normalized (lower case, forward slashes, relative to the content directory, without a
+    compiled ``_c`` suffix), so they can be matched to files regardless of how they are written.
+    Entries are rescanned only when their size or mtime change.
+    """
+
+    file: Path
+    entries: dict[str, DependencyEntry]
+
+    def __init__(self, file: Path) -> None:
+        self.file = file
+        self.entries = {}
+        self._reverse: dict[str, set[str]] | None = None
+
+    def load(self) -> None:
+        LOG.debug("loading dependency index %s", self.file)
+
+        self.entries = {}
+        self._reverse = None
+
+        try:
+            data = json.loads(self.file.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            LOG.trace("  dependency index not found")
+            return
+        except ValueError:
+            LOG.warning("Ignoring invalid dependency index %s", self.file)
+            return
+
+        if data.get("version") != DEPS_VERSION:
+            LOG.trace("  dependency index is stale")
+            return
+
+        self.entries = {
+            rel_path: DependencyEntry(*entry) for rel_path, entry in data["files"].items()
+        }
+
+        LOG.trace("  loaded %d entries", len(self.entries))
+
+    def save(self) -> None:
+        LOG.debug("saving dependency index %s (%d entries)", self.file, len(self.entries))
+
+        data = {
+            "version": DEPS_VERSION,
+            "files": {rel_path: list(entry) for rel_path, entry in sorted(self.entries.items())},
+        }
+
+        write_json_atomic(self.file, data)
+
+    def update(self, files: Iterable[SourceFile]) -> None:
+        """Rescans the scannable ``files`` whose size or mtime changed"""
+
+        for file in files:
+            if not file.rel_path.lower().endswith(SCANNED_SUFFIXES):
+                continue
+
+            recorded = self.entries.get(file.rel_path)
+
+            if recorded is not None and stat_matches(file.stat, recorded.size, recorded.mtime_ns):
+                continue
+
+            LOG.trace("  scanning references of %s", file.rel_path)
+
+            self.entries[file.rel_path] = DependencyEntry(
+                size=file.stat.st_size,
+                mtime_ns=file.stat.st_mtime_ns,
+                refs=sorted(scan_references(file.path)),
+            )
+            self._reverse = None
+
+    def prune(self, rel_paths: Iterable[str]) -> None:
+        """Removes entries of files not present in ``rel_paths``"""
+
+        for rel_path in self.entries.keys() - set(rel_paths):
+            del self.entries[rel_path]
+            self._reverse = None
+
+    def remove(self, rel_path: str) -> None:
+        if self.entries.pop(rel_path, None) is not None:
+            self._reverse = None
+
+    def dependents(self, rel_path: str) -> set[str]:
+        """Returns the files referencing ``rel_path``, directly or through other files"""
+
+        if self._reverse is None:
+            self._reverse = {}
+
+            for dependent, entry in self.entries.items():
+                for ref in entry.refs:
+                    self._reverse.setdefault(ref, set()).add(dependent)
+
+        found: set[str] = set()
+        pending = [rel_path]
+
+        while pending:
+            for dependent in self._reverse.get(normalize_reference(pending.pop()), ()):
+                if dependent not in found and dependent != rel_path:
+                    found.add(dependent)
+                    pending.append(dependent)
+
+        return found
+
+
+def is_raw_input(rel_path: str) -> bool:
+    """Whether ``rel_path`` is a raw input (e.g. ``.tga``, ``.fbx``) rather than a source"""
+
+    return PurePosixPath(rel_path).suffix.lower() in RAW_INPUT_SUFFIXES
+
+
+def normalize_reference(ref: str) -> str:
+    ref = ref.replace("\\", "/").lower()
+    ref = str(PurePosixPath(ref)).lstrip("/")
+
+    return ref.removesuffix("_c")
+
+
+def scan_references(path: Path) -> set[str]:
+    refs: set[str] = set()
+
+    with path.open("rb") as f:
+        header = f.read(HEADER_SIZE)
+
+        if b"\0" in header or header.lstrip().startswith(BINARY_HEADERS):
+            return refs
+
+        f.seek(0)
+
+        for line in f:
+            for match in REFERENCE_RE.finditer(line):
+                refs.add(normalize_reference(match.group(1).decode("utf-8", "replace")))
+
+    return refs
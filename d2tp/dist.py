@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import fcntl
+import json
+import os
+import shutil
+import tarfile
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path, PurePosixPath
+from typing import Final
+
+from .clone import TreeCloner
+from .log import Logger
+from .manifest import file_digest
+
+LOG: Final = Logger(__name__)
+
+COMPLETE_MARKER: Final = ".d2tp-complete"
+DIGESTS_FILE: Final = "digests.json"
+COPY_CHUNK_SIZE: Final = 1024 * 1024
+DEFAULT_WORKERS: Final = 8
+
+
+class DistStore:
+    """Content-addressed store of extracted Proton dist tarballs
+
+    Each distinct ``proton_dist.tar`` is extracted once into ``<path>/<sha256>`` and then cloned
+    (reflinked or hardlinked, see :class:`TreeCloner`) into the ``dist`` directory of every build
+    that uses it. Extraction streams file contents with a pool of threads. A completion marker is
+    written last; an interrupted extraction is resumed on the next run, skipping files that were
+    already fully written.
+    """
+
+    path: Path
+    workers: int
+
+    def __init__(self, path: Path, workers: int = DEFAULT_WORKERS) -> None:
+        self.path = path
+        self.workers = workers
+
+    def install(self, tarball: Path, dist_dir: Path, version_file: Path) -> None:
+        """Installs the contents of ``tarball`` into ``dist_dir``, like Proton's extraction"""
+
+        store_dir = self.extract(tarball)
+
+        # the store directory is locked while cloned, so it is not evicted meanwhile
+        with self._lock(store_dir.name), self._lock(dist_dir.name + ".install", dist_dir.parent):
+            if os.path.lexists(dist_dir):
+                LOG.trace("  rm -r %s", dist_dir)
+                shutil.rmtree(dist_dir)
+
+            TreeCloner().clone(store_dir, dist_dir)
+            dist_dir.joinpath(COMPLETE_MARKER).unlink(missing_ok=True)
+
+            # Proton compares this file to its version file to decide whether to extract
+            shutil.copy(version_file, dist_dir.joinpath("version"))
+
+    def extract(self, tarball: Path) -> Path:
+        """Returns the store directory of ``tarball``, extracting it if needed"""
+
+        digest = self.digest(tarball)
+        store_dir = self.path.joinpath(digest)
+        marker = store_dir.joinpath(COMPLETE_MARKER)
+
+        if marker.exists():
+            LOG.debug("  using extracted dist %s", store_dir)
+
+            # marks the entry as recently used, for eviction
+            os.utime(marker)
+
+            return store_dir
+
+        with self._lock(digest):
+            if marker.exists():
+                return store_dir
+
+            if store_dir.exists():
+                LOG.debug("  resuming extraction of %s into %s", tarball, store_dir)
+            else:
+                LOG.debug("  extracting %s into %s", tarball, store_dir)
+
+            store_dir.mkdir(parents=True, exist_ok=True)
+            extract_tarball(tarball, store_dir, workers=self.workers)
+            marker.write_text(digest, encoding="utf-8")
+
+        return store_dir
+
+    def digest(self, tarball: Path) -> str:
+        """Returns the sha256 of ``tarball``, cached by path, size and mtime"""
+
+        digests_file = self.path.joinpath(DIGESTS_FILE)
+        stat = tarball.stat()
+        key = str(tarball.resolve())
+
+        try:
+            digests = json.loads(digests_file.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            digests = {}
+
+        cached = digests.get(key)
+
+        if cached is not None and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return cached[2]
+
+        LOG.debug("  hashing %s", tarball)
+
+        digest = file_digest(tarball)
+        digests[key] = [stat.st_size, stat.st_mtime_ns, digest]
+
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        tmp_file = digests_file.with_name(f".{digests_file.name}.{os.getpid()}.tmp")
+        tmp_file.write_text(json.dumps(digests), encoding="utf-8")
+        os.replace(tmp_file, digests_file)
+
+        return digest
+
+    @contextmanager
+    def _lock(self, name: str, lock_dir: Path | None = None) -> Iterator[None]:
+        lock_dir = self.path if lock_dir is None else lock_dir
+        lock_dir.mkdir(parents=True, exist_ok=True)
+
+        with lock_dir.joinpath(f".{name}.lock").open("a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            yield
+
+
+def extract_tarball(tarball: Path, dst: Path, workers: int = DEFAULT_WORKERS) -> None:
+    """Extracts ``tarball`` into ``dst``, skipping regular files that are already complete
+
+    File contents of uncompressed tarballs are copied concurrently, each worker reading its
+    members straight from the tarball at their data offsets. Compressed tarballs are extracted
+    sequentially.
+    """
+
+    try:
+        tar = tarfile.open(tarball, mode="r:")
+        parallel = True
+    except tarfile.ReadError:
+        tar = tarfile.open(tarball, mode="r:*")
+        parallel = False
+
+    dirs: list[tuple[tarfile.TarInfo, Path]] = []
+    links: list[tuple[tarfile.TarInfo, Path]] = []
+
+    with tar, ThreadPoolExecutor(max_workers=workers, thread_name_prefix="d2tp-dist") as executor:
+        futures = []
+
+        for member in tar:
+            target = member_path(dst, member)
+
+            if target is None:
+                LOG.warning("Skipping unsafe tarball member %s", member.name)
+                continue
+
+            if member.isdir():
+                target.mkdir(parents=True, exist_ok=True)
+                dirs.append((member, target))
+            elif member.issym() or member.islnk():
+                links.append((member, target))
+            elif member.isreg():
+                if is_complete(target, member):
+                    continue
+
+                target.parent.mkdir(parents=True, exist_ok=True)
+
+                if parallel and not member.issparse():
+                    futures.append(executor.submit(copy_member, tarball, member, target))
+                else:
+                    extract_member(tar, member, target)
+
+        for future in futures:
+            future.result()
+
+    for member, target in links:
+        if os.path.lexists(target):
+            os.unlink(target)
+
+        if member.issym():
+            os.symlink(member.linkname, target)
+        else:
+            link_target = member_path(dst, tarfile.TarInfo(member.linkname))
+
+            if link_target is None:
+                LOG.warning("Skipping unsafe tarball hardlink %s", member.name)
+                continue
+
+            os.link(link_target, target)
+
+    for member, target in reversed(dirs):
+        os.chmod(target, member.mode | 0o700)
+
+
+def member_path(dst: Path, member: tarfile.TarInfo) -> Path | None:
+    name = PurePosixPath(member.name)
+
+    if name.is_absolute() or ".." in name.parts:
+        return None
+
+    return dst.joinpath(name)
+
+
+def is_complete(target: Path, member: tarfile.TarInfo) -> bool:
+    """Whether ``target`` was fully extracted
+
+    Its mtime is only set once its content is written.
+    """
+
+    try:
+        stat = target.stat()
+    except FileNotFoundError:
+        return False
+
+    return stat.st_size == member.size and int(stat.st_mtime) == int(member.mtime)
+
+
+def copy_member(tarball: Path, member: tarfile.TarInfo, target: Path) -> None:
+    with tarball.open("rb") as src, target.open("wb") as dst:
+        src.seek(member.offset_data)
+        remaining = member.size
+
+        while remaining > 0:
+            chunk = src.read(min(COPY_CHUNK_SIZE, remaining))
+
+            if not chunk:
+                raise ValueError(f"Unexpected end of tarball {tarball} in {member.name}")
+
+            dst.write(chunk)
+            remaining -= len(chunk)
+
+    finish_member(member, target)
+
+
+def extract_member(tar: tarfile.TarFile, member: tarfile.TarInfo, target: Path) -> None:
+    src = tar.extractfile(member)
+
+    assert src is not None
+
+    with src, target.open("wb") as dst:
+        shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+
+    finish_member(member, target)
+
+
+def finish_member(member: tarfile.TarInfo, target: Path) -> None:
+    os.chmod(target, member.mode)
+    os.utime(target, (member.mtime, member.mtime))
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path, PurePosixPath
+from typing import TYPE_CHECKING, Final, NamedTuple
+
+from .custom_game import MAP_SUFFIX
+from .log import Logger
+from .util import write_json_atomic
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from .custom_game import SourceFile
+
+LOG: Final = Logger(__name__)
+
+HISTORY_VERSION: Final = 1
+
+# weight of the latest run in a file's moving average duration
+SMOOTHING: Final = 0.5
+
+# predicted durations of files of a type never compiled before, in seconds
+DEFAULT_MAP_COST: Final = 60.0
+DEFAULT_ASSET_COST: Final = 0.1
+
+# predicted peak memory of a compiler process for types never compiled before
+DEFAULT_PEAK_MEMORY: Final = 1024 * 1024 * 1024
+
+MEMINFO_FILE: Final = "/proc/meminfo"
+
+
+class HistoryEntry(NamedTuple):
+    """Past compilations of a source file, ``max_rss`` in bytes"""
+
+    duration: float
+    max_rss: int
+
+
+class CompileHistory:
+    """Persistent compile durations and peak memory of a custom game's source files
+
+    Durations are moving averages per file. Peak memory is that of the compiler process the file
+    was compiled in, so files compiled in one filelist share the peak of the whole list. Files and
+    types never compiled before are predicted from the averages of their type.
+    """
+
+    file: Path
+    entries: dict[str, HistoryEntry]
+
+    def __init__(self, file: Path) -> None:
+        self.file = file
+        self.entries = {}
+        self._types: dict[str, tuple[float, int]] | None = None
+
+    def load(self) -> None:
+        LOG.debug("loading compile history %s", self.file)
+
+        self.entries = {}
+        self._types = None
+
+        try:
+            data = json.loads(self.file.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            LOG.trace("  compile history not found")
+            return
+        except ValueError:
+            LOG.warning("Ignoring invalid compile history file %s", self.file)
+            return
+
+        if data.get("version") != HISTORY_VERSION:
+            LOG.trace("  compile history is stale")
+            return
+
+        self.entries = {
+            rel_path: HistoryEntry(*entry) for rel_path, entry in data["files"].items()
+        }
+
+        LOG.trace("  loaded %d entries", len(self.entries))
+
+    def save(self) -> None:
+        LOG.debug("saving compile history %s (%d files)", self.file, len(self.entries))
+
+        data = {
+            "version": HISTORY_VERSION,
+            "files": {
+                rel_path: [round(entry.duration, 3), entry.max_rss]
+                for rel_path, entry in self.entries.items()
+            },
+        }
+
+        write_json_atomic(self.file, data)
+
+    def record(self, rel_path: str, duration: float, max_rss: int) -> None:
+        key = rel_path.lower()
+        recorded = self.entries.get(key)
+
+        if recorded is not None:
+            duration = SMOOTHING * duration + (1 - SMOOTHING) * recorded.duration
+
+        self.entries[key] = HistoryEntry(duration, max_rss)
+        self._types = None
+
+    def cost(self, file: SourceFile) -> float:
+        """Returns the predicted compile duration of ``file`` in seconds"""
+
+        recorded = self.entries.get(file.rel_path.lower())
+
+        if recorded is not None:
+            return recorded.duration
+
+        suffix = file_type(file.rel_path)
+        average = self.types().get(suffix)
+
+        if average is not None:
+            return average[0]
+
+        return DEFAULT_MAP_COST if suffix == MAP_SUFFIX else DEFAULT_ASSET_COST
+
+    def peak_memory(self, files: Iterable[SourceFile]) -> int:
+        """Returns the highest peak memory seen compiling files of the types of ``files``"""
+
+        types = self.types()
+        peaks = [
+            types[suffix][1] if suffix in types else DEFAULT_PEAK_MEMORY
+            for suffix in {file_type(file.rel_path) for file in files}
+        ]
+
+        return max(peaks, default=DEFAULT_PEAK_MEMORY)
+
+    def types(self) -> dict[str, tuple[float, int]]:
+        """Returns the average duration and highest peak memory of each file type"""
+
+        if self._types is None:
+            durations: dict[str, list[float]] = {}
+            peaks: dict[str, int] = {}
+
+            for rel_path, entry in self.entries.items():
+                suffix = file_type(rel_path)
+                durations.setdefault(suffix, []).append(entry.duration)
+                peaks[suffix] = max(peaks.get(suffix, 0), entry.max_rss)
+
+            self._types = {
+                suffix: (sum(values) / len(values), peaks[suffix] or DEFAULT_PEAK_MEMORY)
+                for suffix, values in durations.items()
+            }
+
+        return self._types
+
+
+def file_type(rel_path: str) -> str:
+    return PurePosixPath(rel_path).suffix.lower()
+
+
+def available_memory() -> int | None:
+    """Returns the memory available to new processes in bytes, if known"""
+
+    try:
+        with open(MEMINFO_FILE, encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+
+    return None
+
+
+def worker_count(peak_memory: int, limit: int | None = None) -> int:
+    """Returns how many compiler processes of ``peak_memory`` bytes can run at once
+
+    Bounded by the CPU count, the available memory and ``limit`` if given.
+    """
+
+    workers = os.cpu_count() or 1
+    available = available_memory()
+
+    if available is not None:
+        workers = min(workers, available // max(peak_memory, 1))
+
+    if limit is not None:
+        workers = min(workers, limit)
+
+    workers = max(workers, 1)
+
+    LOG.debug(
+        "using %d workers (%s CPUs, %s available memory, %d peak memory per process)",
+        workers,
+        os.cpu_count(),
+        available,
+        peak_memory,
+    )
+
+    return workers
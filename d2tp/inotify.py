@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+from enum import IntFlag
+from typing import Final, NamedTuple
+
+EVENT_HEADER: Final = struct.Struct("iIII")
+READ_SIZE: Final = 64 * 1024
+
+_LIBC: ctypes.CDLL | None = None
+
+
+class Mask(IntFlag):
+    ACCESS = 0x00000001
+    MODIFY = 0x00000002
+    ATTRIB = 0x00000004
+    CLOSE_WRITE = 0x00000008
+    CLOSE_NOWRITE = 0x00000010
+    OPEN = 0x00000020
+    MOVED_FROM = 0x00000040
+    MOVED_TO = 0x00000080
+    CREATE = 0x00000100
+    DELETE = 0x00000200
+    DELETE_SELF = 0x00000400
+    MOVE_SELF = 0x00000800
+    UNMOUNT = 0x00002000
+    Q_OVERFLOW = 0x00004000
+    IGNORED = 0x00008000
+    ONLYDIR = 0x01000000
+    DONT_FOLLOW = 0x02000000
+    EXCL_UNLINK = 0x04000000
+    MASK_ADD = 0x20000000
+    ISDIR = 0x40000000
+    ONESHOT = 0x80000000
+
+
+class Event(NamedTuple):
+    """inotify event"""
+
+    wd: int
+    mask: Mask
+    cookie: int
+    name: str
+
+
+class Inotify:
+    """Minimal inotify(7) wrapper using libc through ctypes"""
+
+    fd: int
+
+    def __init__(self) -> None:
+        self.fd = _check(libc().inotify_init1(os.O_CLOEXEC))
+
+    def __enter__(self) -> Inotify:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def add_watch(self, path: str, mask: Mask) -> int:
+        return _check(libc().inotify_add_watch(self.fd, os.fsencode(path), int(mask)))
+
+    def rm_watch(self, wd: int) -> None:
+        _check(libc().inotify_rm_watch(self.fd, wd))
+
+    def read(self, timeout: float | None = None) -> list[Event]:
+        """Reads pending events, waiting up to ``timeout`` seconds (forever if ``None``)"""
+
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+
+        if not readable:
+            return []
+
+        data = os.read(self.fd, READ_SIZE)
+        events = []
+        offset = 0
+
+        while offset < len(data):
+            wd, mask, cookie, name_len = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset : offset + name_len].rstrip(b"\0")
+            offset += name_len
+
+            events.append(Event(wd=wd, mask=Mask(mask), cookie=cookie, name=os.fsdecode(name)))
+
+        return events
+
+
+def libc() -> ctypes.CDLL:
+    global _LIBC  # pylint: disable=global-statement
+
+    if _LIBC is None:
+        _LIBC = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        _LIBC.inotify_init1.argtypes = [ctypes.c_int]
+        _LIBC.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        _LIBC.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+
+    return _LIBC
+
+
+def _check(result: int) -> int:
+    if result < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+
+    return result
@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import heapq
+import subprocess
+import time
+from collections.abc import Callable, Generator, Iterable
+from pathlib import PosixPath
+from typing import Final, NamedTuple, TypeVar
+
+from .log import Logger
+from .trace import span
+
+LOG: Final = Logger(__name__)
+
+T = TypeVar("T")
+
+
+class Job(NamedTuple):
+    """Unit of compilation work, ``cost`` is its predicted duration in seconds"""
+
+    name: str
+    paths: list[PosixPath]
+    run: Callable[[], object]
+    cost: float = 0.0
+
+
+class JobResult(NamedTuple):
+    """Outcome of a compilation job
+
+    ``failed_paths`` are the paths of a failed job known to have failed, ``None`` if unknown.
+    """
+
+    job: Job
+    returncode: int
+    duration: float
+    failed_paths: list[PosixPath] | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0
+
+    @property
+    def compiled_paths(self) -> list[PosixPath]:
+        """Paths of the job that compiled, all of them if it succeeded"""
+
+        if self.ok:
+            return self.job.paths
+
+        if self.failed_paths is None:
+            return []
+
+        failed = set(self.failed_paths)
+
+        return [path for path in self.job.paths if path not in failed]
+
+
+class BatchFailure(subprocess.CalledProcessError):
+    """Failure of some of the batches of a job, ``failed_paths`` are the paths that failed"""
+
+    failed_paths: list[PosixPath]
+
+    def __init__(self, returncode: int, cmd: list[str], failed_paths: list[PosixPath]) -> None:
+        super().__init__(returncode, cmd)
+        self.failed_paths = failed_paths
+
+
+def run_job(job: Job) -> JobResult:
+    LOG.debug("starting job %s", job.name)
+
+    start = time.monotonic()
+    failed_paths = None
+
+    try:
+        with span("compile", job=job.name):
+            job.run()
+
+        returncode = 0
+    except BatchFailure as ex:
+        returncode = ex.returncode
+        failed_paths = ex.failed_paths
+    except subprocess.CalledProcessError as ex:
+        returncode = ex.returncode
+    except OSError as ex:
+        LOG.error("Job %s failed to run: %s", job.name, ex)
+        returncode = -1
+
+    result = JobResult(
+        job=job,
+        returncode=returncode,
+        duration=time.monotonic() - start,
+        failed_paths=failed_paths,
+    )
+
+    if result.ok:
+        LOG.info("compiled %s (%.1fs)", job.name, result.duration)
+    else:
+        LOG.error("Failed to compile %s (exit code %d)", job.name, result.returncode)
+
+        paths = job.paths if failed_paths is None else failed_paths
+
+        if len(job.paths) > 1:
+            for path in paths:
+                LOG.error("  %s", path)
+
+    return result
+
+
+def run_jobs(jobs: Iterable[Job], workers: int = 1) -> Generator[JobResult, None, None]:
+    """Runs jobs in a pool of ``workers`` threads, yielding results as they complete
+
+    Jobs are started in order, so sorting them longest first keeps a long job from running alone
+    at the end. A failing job does not cancel the others, an interrupt cancels the jobs not
+    started yet.
+    """
+
+    if workers <= 1:
+        for job in jobs:
+            yield run_job(job)
+
+        return
+
+    # pylint: disable-next=import-outside-toplevel
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="d2tp-job") as executor:
+        futures = [executor.submit(run_job, job) for job in jobs]
+
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        except BaseException:
+            # e.g. interrupted: queued jobs are not started, running ones finish
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+
+
+def log_summary(results: list[JobResult]) -> None:
+    failed = [result for result in results if not result.ok]
+
+    LOG.info(
+        "%d of %d jobs succeeded (%.1fs total compile time)",
+        len(results) - len(failed),
+        len(results),
+        sum(result.duration for result in results),
+    )
+
+    if failed:
+        LOG.error(
+            "%d of %d jobs failed: %s",
+            len(failed),
+            len(results),
+            ", ".join(result.job.name for result in failed),
+        )
+
+
+def batch(
+    items: Iterable[T],
+    max_count: int | None = None,
+    max_weight: float | None = None,
+    weight: Callable[[T], float] = lambda _: 0.0,
+) -> list[list[T]]:
+    """Splits ``items`` in order into batches of at most ``max_count`` items and ``max_weight``
+
+    An item heavier than ``max_weight`` gets a batch of its own.
+    """
+
+    batches: list[list[T]] = []
+    current: list[T] = []
+    total = 0.0
+
+    for item in items:
+        item_weight = weight(item)
+
+        if current and (
+            (max_count is not None and len(current) >= max_count)
+            or (max_weight is not None and total + item_weight > max_weight)
+        ):
+            batches.append(current)
+            current = []
+            total = 0.0
+
+        current.append(item)
+        total += item_weight
+
+    if current:
+        batches.append(current)
+
+    return batches
+
+
+def shard(items: Iterable[T], count: int, weight: Callable[[T], float]) -> list[list[T]]:
+    """Splits ``items`` into at most ``count`` non-empty shards of balanced total weight
+
+    Items are assigned heaviest first to the currently lightest shard.
+    """
+
+    shards: list[list[T]] = [[] for _ in range(max(count, 1))]
+    heap = [(0.0, i) for i in range(len(shards))]
+
+    for item in sorted(items, key=weight, reverse=True):
+        total, i = heapq.heappop(heap)
+        shards[i].append(item)
+        heapq.heappush(heap, (total + weight(item), i))
+
+    return [shard_items for shard_items in shards if shard_items]
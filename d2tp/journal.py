@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import json
+import threading
+from collections.abc import Iterable
+from pathlib import Path, PosixPath
+from typing import IO, TYPE_CHECKING, Final
+
+from .log import Logger
+
+if TYPE_CHECKING:
+    from .custom_game import SourceFile
+
+LOG: Final = Logger(__name__)
+
+JOURNAL_VERSION: Final = 1
+
+
+class CompileJournal:
+    """Append-only journal of the files a custom game's compilation completed
+
+    Each line records a completed unit (a map, or a batch of assets) as the input keys of its
+    files, hashes of the file's content, of the content of every file it references
+    (transitively), of the compiler and of its flags (see :meth:`Runner.plan_sources`). Lines
+    are written as units complete, so the journal survives the process being killed. A run
+    resuming from the journal skips the files whose input keys are unchanged, however much else
+    changed since.
+
+    The journal is removed once a compilation completes all its files.
+    """
+
+    file: Path
+    entries: dict[str, str]
+
+    def __init__(self, file: Path) -> None:
+        self.file = file
+        self.entries = {}
+        self._keys: dict[PosixPath, tuple[str, str]] = {}
+        self._f: IO[str] | None = None
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        LOG.debug("loading compile journal %s", self.file)
+
+        self.entries = {}
+
+        try:
+            with self.file.open(encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            LOG.trace("  compile journal not found")
+            return
+
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, ValueError):
+            LOG.warning("Ignoring invalid compile journal %s", self.file)
+            return
+
+        if header.get("version") != JOURNAL_VERSION:
+            LOG.trace("  compile journal is stale")
+            return
+
+        for line in lines[1:]:
+            try:
+                self.entries.update(json.loads(line)["files"])
+            except (ValueError, KeyError, TypeError):
+                # cut short by the process being killed while writing it
+                LOG.trace("  ignoring invalid line %r", line)
+
+        LOG.trace("  loaded %d entries", len(self.entries))
+
+    def start(self, resume: bool = False) -> None:
+        """Starts a compilation, keeping the completed entries if ``resume`` is true"""
+
+        if resume:
+            self.load()
+        else:
+            self.entries = {}
+
+        if not self.entries:
+            self.file.unlink(missing_ok=True)
+
+    def plan(self, file: SourceFile, key: str) -> bool:
+        """Adds ``file`` to the compilation, returns whether a previous run completed it"""
+
+        self._keys[file.path] = (file.rel_path, key)
+
+        return self.entries.get(file.rel_path) == key
+
+    def record(self, unit: str, paths: Iterable[PosixPath]) -> None:
+        """Appends the planned files in ``paths`` not recorded yet, as completed by ``unit``"""
+
+        with self._lock:
+            planned = [self._keys[path] for path in paths if path in self._keys]
+            files = {
+                rel_path: key for rel_path, key in planned if self.entries.get(rel_path) != key
+            }
+
+            if not files:
+                return
+
+            if self._f is None:
+                self.file.parent.mkdir(parents=True, exist_ok=True)
+                self._f = self.file.open("a", encoding="utf-8")
+
+                if self._f.tell() == 0:
+                    self._f.write(json.dumps({"version": JOURNAL_VERSION}) + "\n")
+
+            self._f.write(json.dumps({"unit": unit, "files": files}) + "\n")
+            self._f.flush()
+            self.entries.update(files)
+
+    def close(self, complete: bool = False) -> None:
+        """Closes the journal, removing it if ``complete`` is true"""
+
+        with self._lock:
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+
+            if complete:
+                LOG.debug("removing compile journal %s", self.file)
+                self.file.unlink(missing_ok=True)
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from collections.abc import Generator, Iterable
+from pathlib import Path, PosixPath
+from typing import TYPE_CHECKING, Final, NamedTuple
+
+from .log import Logger
+from .util import stat_matches, write_json_atomic
+
+if TYPE_CHECKING:
+    from .custom_game import SourceFile
+
+LOG: Final = Logger(__name__)
+
+MANIFEST_VERSION: Final = 1
+HASH_CHUNK_SIZE: Final = 1024 * 1024
+
+
+class ManifestEntry(NamedTuple):
+    """Recorded state of a source file"""
+
+    size: int
+    mtime_ns: int
+    digest: str
+
+
+class Manifest:
+    """Persistent content manifest of a custom game's source files
+
+    Entries are keyed by path relative to ``root``. A file is considered unchanged if its size and
+    mtime match the recorded entry, or if they differ but its content hash does not.
+    """
+
+    file: Path
+    root: PosixPath
+    game_path: PosixPath
+    entries: dict[str, ManifestEntry]
+
+    def __init__(self, file: Path, root: PosixPath, game_path: PosixPath) -> None:
+        self.file = file
+        self.root = root
+        self.game_path = game_path
+        self.entries = {}
+
+    def load(self) -> None:
+        LOG.debug("loading manifest %s", self.file)
+
+        self.entries = {}
+
+        try:
+            data = json.loads(self.file.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            LOG.trace("  manifest not found")
+            return
+        except ValueError:
+            LOG.warning("Ignoring invalid manifest file %s", self.file)
+            return
+
+        if (
+            data.get("version") != MANIFEST_VERSION
+            or data.get("root") != str(self.root)
+            or data.get("game_path") != str(self.game_path)
+        ):
+            LOG.trace("  manifest is stale")
+            return
+
+        self.entries = {
+            rel_path: ManifestEntry(*entry) for rel_path, entry in data["files"].items()
+        }
+
+        LOG.trace("  loaded %d entries", len(self.entries))
+
+    def save(self) -> None:
+        LOG.debug("saving manifest %s (%d entries)", self.file, len(self.entries))
+
+        data = {
+            "version": MANIFEST_VERSION,
+            "root": str(self.root),
+            "game_path": str(self.game_path),
+            "files": {rel_path: list(entry) for rel_path, entry in sorted(self.entries.items())},
+        }
+
+        write_json_atomic(self.file, data)
+
+    def entry(self, file: SourceFile) -> ManifestEntry:
+        """Returns the current entry for ``file``, hashing it only if its stat changed"""
+
+        recorded = self.entries.get(file.rel_path)
+
+        if recorded is not None and stat_matches(file.stat, recorded.size, recorded.mtime_ns):
+            return recorded
+
+        return ManifestEntry(file.stat.st_size, file.stat.st_mtime_ns, file_digest(file.path))
+
+    def is_changed(self, rel_path: str, entry: ManifestEntry) -> bool:
+        recorded = self.entries.get(rel_path)
+
+        return recorded is None or recorded.digest != entry.digest
+
+    def changes(
+        self,
+        files: Iterable[SourceFile],
+        force: bool = False,
+    ) -> Generator[tuple[SourceFile, ManifestEntry], None, None]:
+        """Yields changed or new files in ``files`` along with their current entries
+
+        Unchanged files whose stat differs from the recorded one (e.g. touched files) are updated
+        in place, so they are not hashed again on the next run.
+        """
+
+        for file in files:
+            entry = self.entry(file)
+
+            if force or self.is_changed(file.rel_path, entry):
+                yield file, entry
+            else:
+                self.update(file.rel_path, entry)
+
+    def update(self, rel_path: str, entry: ManifestEntry) -> None:
+        self.entries[rel_path] = entry
+
+    def remove(self, rel_path: str) -> None:
+        self.entries.pop(rel_path, None)
+
+    def prune(self, rel_paths: Iterable[str]) -> None:
+        """Removes entries of files not present in ``rel_paths``"""
+
+        for rel_path in self.entries.keys() - set(rel_paths):
+            LOG.trace("  removing manifest entry %s", rel_path)
+            del self.entries[rel_path]
+
+
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+
+    with path.open("rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+
+    return digest.hexdigest()
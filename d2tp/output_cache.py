@@ -0,0 +1,326 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from pathlib import Path, PosixPath
+from typing import Any, Final
+
+from .custom_game import MAP_SUFFIX
+from .deps import is_raw_input
+from .inotify import Inotify, Mask
+from .log import Logger
+from .util import list_dir
+
+LOG: Final = Logger(__name__)
+
+OUTPUT_CACHE_VERSION: Final = 1
+META_FILE: Final = "outputs.json"
+
+RECORD_MASK: Final = Mask.CLOSE_WRITE | Mask.MOVED_TO | Mask.CREATE | Mask.ONLYDIR
+
+
+class OutputCache:
+    """Content-addressed store of compiled outputs
+
+    Each entry is a directory ``<path>/<key[:2]>/<key>`` holding the outputs of one compiled
+    source, stored by their path relative to the custom game's game directory, plus an
+    ``outputs.json`` listing them. Entries are written to a temporary directory and renamed into
+    place, so the store can be shared between processes and machines (e.g. on a mounted volume)
+    and readers never see partial entries.
+    """
+
+    path: Path
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    def entry_dir(self, key: str) -> Path:
+        return self.path.joinpath(key[:2], key)
+
+    def restore(self, key: str, game_dir: Path) -> bool:
+        """Copies the outputs stored under ``key`` into ``game_dir``, returns whether it hit"""
+
+        entry_dir = self.entry_dir(key)
+
+        try:
+            meta = json.loads(entry_dir.joinpath(META_FILE).read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return False
+
+        try:
+            for rel_path in meta["outputs"]:
+                dst = game_dir.joinpath(rel_path)
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(entry_dir.joinpath(rel_path), dst)
+        except FileNotFoundError:
+            # evicted while restoring
+            return False
+
+        # marks the entry as recently used, for eviction
+        os.utime(entry_dir)
+
+        return True
+
+    def store(self, key: str, game_dir: Path, outputs: Iterable[str]) -> None:
+        """Stores the ``outputs`` (relative to ``game_dir``) of a compiled source under ``key``"""
+
+        entry_dir = self.entry_dir(key)
+
+        if entry_dir.exists():
+            return
+
+        tmp_dir = entry_dir.with_name(f".{key}.{os.getpid()}.tmp")
+        rel_paths = sorted(outputs)
+
+        try:
+            for rel_path in rel_paths:
+                dst = tmp_dir.joinpath(rel_path)
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(game_dir.joinpath(rel_path), dst)
+
+            tmp_dir.mkdir(parents=True, exist_ok=True)
+            tmp_dir.joinpath(META_FILE).write_text(
+                json.dumps({"version": OUTPUT_CACHE_VERSION, "outputs": rel_paths}),
+                encoding="utf-8",
+            )
+
+            os.rename(tmp_dir, entry_dir)
+        except OSError as ex:
+            # another process stored the same entry first, or the store is not writable
+            LOG.debug("  not caching outputs of %s: %s", key, ex)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+class RecordedRun:  # pylint: disable=too-few-public-methods
+    """Compiler run recorded by :class:`OutputRecorder`"""
+
+    paths: list[PosixPath]
+    written: set[str]
+    complete: bool
+
+    def __init__(self, paths: list[PosixPath]) -> None:
+        self.paths = paths
+        self.written = set()
+        self.complete = True
+
+
+class OutputRecorder:  # pylint: disable=too-many-instance-attributes
+    """Records the files compiler runs write to a custom game's game directory
+
+    ``sources`` maps the source files to compile to their paths relative to the content
+    directory; runs of sources not in ``tracked`` (e.g. because there's no cache key for them) are
+    not recorded. The files a run writes are those written under ``game_dir`` while it ran, which
+    include the files written by the runs it overlapped. Writes are watched with inotify, so the
+    game directory is only scanned once, when the first run starts.
+    """
+
+    game_dir: Path
+    sources: dict[PosixPath, str]
+    tracked: set[PosixPath]
+    runs: list[RecordedRun]
+
+    def __init__(
+        self,
+        game_dir: Path,
+        sources: dict[PosixPath, str],
+        tracked: Iterable[PosixPath],
+    ) -> None:
+        self.game_dir = game_dir
+        self.sources = sources
+        self.tracked = set(tracked)
+        self.runs = []
+        self._lock = threading.Lock()
+        self._inotify: Inotify | None = None
+        self._dirs: dict[int, str] = {}
+        self._active: list[RecordedRun] = []
+        self._complete = True
+
+    def close(self) -> None:
+        with self._lock:
+            if self._inotify is not None:
+                self._inotify.close()
+                self._inotify = None
+
+    @contextmanager
+    def run(self, paths: list[PosixPath]) -> Iterator[None]:
+        """Records the files written while the compiler runs on ``paths``, even if it fails"""
+
+        if self.tracked.isdisjoint(paths):
+            yield
+            return
+
+        run = RecordedRun(paths)
+
+        with self._lock:
+            if self._inotify is None:
+                self._watch()
+            else:
+                self._read_events()
+
+            self._active.append(run)
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._read_events()
+                self._active.remove(run)
+                run.complete = run.complete and self._complete
+                self.runs.append(run)
+
+    def outputs(self, child_sources: set[PosixPath]) -> dict[PosixPath, set[str]]:
+        """Returns the outputs of the tracked sources whose outputs are all known
+
+        A written file is attributed to the source it is named after (see :func:`is_output_of`),
+        or to the source of a run compiling a single source if no other run wrote it. Sources
+        in ``child_sources`` may have child resources, named after raw inputs: these sources are
+        left out if a run compiling them wrote a file that could not be attributed.
+        """
+
+        writers: dict[str, list[list[PosixPath]]] = {}
+        unknown: set[PosixPath] = set()
+
+        for run in self.runs:
+            if not run.complete:
+                unknown.update(run.paths)
+
+            for output in run.written:
+                writers.setdefault(output, []).append(run.paths)
+
+        outputs: dict[PosixPath, set[str]] = {}
+
+        for output, runs in writers.items():
+            named = {
+                path
+                for paths in runs
+                for path in paths
+                if is_output_of(output, self.sources[path])
+            }
+
+            if len(named) == 1:
+                outputs.setdefault(named.pop(), set()).add(output)
+            elif not named and len(runs) == 1 and len(runs[0]) == 1:
+                outputs.setdefault(runs[0][0], set()).add(output)
+            else:
+                LOG.trace("  can't attribute output %s", output)
+                unknown.update(named)
+                unknown.update(path for paths in runs for path in paths if path in child_sources)
+
+        return {
+            path: source_outputs
+            for path, source_outputs in outputs.items()
+            if path in self.tracked and path not in unknown
+        }
+
+    def _watch(self) -> None:
+        self.game_dir.mkdir(parents=True, exist_ok=True)
+
+        try:
+            self._inotify = Inotify()
+        except OSError as ex:
+            LOG.warning("Could not watch %s: %s", self.game_dir, ex)
+            self._complete = False
+            return
+
+        self._add_tree(str(self.game_dir))
+
+    def _add_tree(self, root: str) -> None:
+        """Watches ``root`` and its subdirectories, records the files in them as written"""
+
+        assert self._inotify is not None
+
+        dirs = [root]
+
+        while dirs:
+            dir_path = dirs.pop()
+
+            try:
+                self._dirs[self._inotify.add_watch(dir_path, RECORD_MASK)] = dir_path
+                subdirs, files = list_dir(dir_path)
+                dirs.extend(subdirs)
+
+                for file in files:
+                    self._written(file)
+            except OSError as ex:
+                LOG.warning("Could not watch %s: %s", dir_path, ex)
+                self._complete = False
+
+    def _read_events(self) -> None:
+        if self._inotify is None:
+            return
+
+        while events := self._inotify.read(0):
+            for event in events:
+                if event.mask & Mask.Q_OVERFLOW:
+                    LOG.debug("  too many writes under %s to record", self.game_dir)
+                    self._complete = False
+                    continue
+
+                if event.mask & Mask.IGNORED:
+                    self._dirs.pop(event.wd, None)
+                    continue
+
+                dir_path = self._dirs.get(event.wd)
+
+                if dir_path is None or not event.name:
+                    continue
+
+                path = os.path.join(dir_path, event.name)
+
+                if event.mask & Mask.ISDIR:
+                    self._add_tree(path)
+                else:
+                    self._written(path)
+
+    def _written(self, path: str) -> None:
+        rel_path = os.path.relpath(path, self.game_dir)
+
+        for run in self._active:
+            run.written.add(rel_path)
+
+
+def cache_key(parts: dict[str, Any]) -> str:
+    """Returns the key of a compilation described by ``parts``, which must be JSON serializable"""
+
+    data = json.dumps({"version": OUTPUT_CACHE_VERSION, **parts}, sort_keys=True)
+
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def has_child_resources(rel_path: str, refs: dict[str, str | None]) -> bool:
+    """Returns whether a source referencing ``refs`` (transitively) may compile child resources
+
+    The compiler generates child resources for the raw inputs of the custom game (e.g. textures)
+    a source references, named after the input rather than after the source.
+    """
+
+    return is_raw_input(rel_path) or any(
+        is_raw_input(ref) for ref, digest in refs.items() if digest is not None
+    )
+
+
+def is_output_of(output: str, rel_path: str) -> bool:
+    """Returns whether ``output`` (relative to the game directory) is named after a source
+
+    Resources compile to ``<source>_c``; maps compile to a ``.vpk`` and to files in a directory
+    named after the map.
+    """
+
+    output = output.lower()
+    rel_path = rel_path.lower()
+
+    if output == f"{rel_path}_c":
+        return True
+
+    if not rel_path.endswith(MAP_SUFFIX):
+        return False
+
+    stem = rel_path[: -len(MAP_SUFFIX)]
+
+    return output == f"{stem}.vpk" or output.startswith(f"{stem}/")
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+from pathlib import Path, PosixPath
+from typing import TYPE_CHECKING, Final
+
+from .log import Logger
+from .output_cache import has_child_resources
+
+if TYPE_CHECKING:
+    from .custom_game import CustomGame, SourceFile
+    from .deps import DependencyIndex
+    from .history import CompileHistory
+    from .jobs import Job, JobResult
+    from .journal import CompileJournal
+    from .manifest import Manifest, ManifestEntry
+    from .output_cache import OutputCache, OutputRecorder
+    from .report import CompileReport
+
+LOG: Final = Logger(__name__)
+
+
+class CompilePlan:  # pylint: disable=too-many-instance-attributes
+    """Compile jobs for a custom game's changed sources, and the state their results update"""
+
+    def __init__(  # pylint: disable=too-many-arguments,too-many-locals
+        self,
+        custom_game: CustomGame,
+        manifest: Manifest,
+        deps: DependencyIndex,
+        report: CompileReport,
+        changed: dict[PosixPath, tuple[SourceFile, ManifestEntry]],
+        inputs: dict[PosixPath, set[PosixPath]],
+        jobs: list[Job],
+        output_cache: OutputCache,
+        cache_keys: dict[PosixPath, str],
+        refs: dict[PosixPath, dict[str, str | None]],
+        recorder: OutputRecorder,
+        history: CompileHistory,
+        peak_memory: int,
+        journal: CompileJournal,
+        resumed: set[PosixPath],
+        subset: bool = False,
+    ) -> None:
+        self.custom_game = custom_game
+        self.manifest = manifest
+        self.deps = deps
+        self.report = report
+        self.changed = changed
+        self.inputs = inputs
+        self.jobs = jobs
+        self.output_cache = output_cache
+        self.cache_keys = cache_keys
+        self.recorder = recorder
+        self.child_sources = {
+            path
+            for path, file_refs in refs.items()
+            if has_child_resources(changed[path][0].rel_path, file_refs)
+        }
+        self.history = history
+        self.peak_memory = peak_memory
+        self.journal = journal
+        self.subset = subset
+        # files compiled by an interrupted run count as compiled
+        self.compiled: set[PosixPath] = set(resumed)
+
+        # compiled files are reported by their path relative to the game directory
+        self._report_root = custom_game.content_path.relative_to(custom_game.game.path)
+
+    def record(self, result: JobResult) -> None:
+        """Marks the compiled files of a job as up to date, recording their timings"""
+
+        compiled_paths = result.compiled_paths
+
+        if not compiled_paths:
+            return
+
+        self.compiled.update(compiled_paths)
+        self.journal.record(result.job.name, compiled_paths)
+
+        runs = {run.name: run for run in self.report.runs}
+
+        for path in compiled_paths:
+            file, entry = self.changed[path]
+            self.manifest.update(file.rel_path, entry)
+
+            report_path = str(self._report_root.joinpath(file.rel_path))
+            file_report = self.report.files.get(report_path)
+            run = runs.get(file_report.run if file_report is not None else report_path)
+            max_rss = run.max_rss if run is not None and run.max_rss is not None else 0
+
+            if file_report is not None and file_report.duration is not None:
+                self.history.record(file.rel_path, file_report.duration, max_rss)
+            elif len(result.job.paths) == 1:
+                self.history.record(file.rel_path, result.duration, max_rss)
+
+    def store_outputs(self) -> None:
+        """Stores the outputs of the compiled sources in the output cache"""
+
+        outputs = self.recorder.outputs(self.child_sources)
+
+        for path, key in self.cache_keys.items():
+            if path not in self.compiled:
+                continue
+
+            if path not in outputs:
+                LOG.debug(
+                    "  not caching %s, its outputs are unknown", self.changed[path][0].rel_path
+                )
+                continue
+
+            self.output_cache.store(key, self.custom_game.game_path, outputs[path])
+
+    def finish(self, report_file: Path) -> None:
+        """Marks inputs whose dependents all compiled as up to date, saves the plan's state"""
+
+        try:
+            self.store_outputs()
+
+            for path, dependents in self.inputs.items():
+                if dependents <= self.compiled:
+                    file, entry = self.changed[path]
+                    self.manifest.update(file.rel_path, entry)
+        finally:
+            self.recorder.close()
+            self.manifest.save()
+            self.deps.save()
+            self.history.save()
+            self.report.save(report_file)
+            self.journal.close(
+                complete=not self.subset
+                and all(path in self.compiled for job in self.jobs for path in job.paths)
+            )
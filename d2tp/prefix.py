@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import fcntl
+import os
+import shutil
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Final
+
+from .clone import TreeCloner
+from .log import Logger
+
+LOG: Final = Logger(__name__)
+
+COMPLETE_MARKER: Final = ".d2tp-complete"
+DEFAULT_PFX_DIR: Final = "default_pfx"
+PREFIX_DIR: Final = "prefix"
+
+# per-game drive mappings created by the runner, never part of a template
+EXCLUDED_PATHS: Final = ("pfx/dosdevices/g:",)
+
+
+class PrefixTemplate:
+    """Ready-made wine prefix for a Proton version, cloned into new prefixes
+
+    Creating a prefix from scratch means booting wine once for Proton's default prefix and then
+    copying it into the compatdata prefix. The template keeps a snapshot of both, taken right
+    after the first session was initialized, so new builds and prefixes (e.g. a prefix per job)
+    are cloned from it instead.
+
+    Clones are reflinked where the filesystem supports it. Otherwise only the files tracked by
+    Proton are hardlinked: Proton never writes to them in place, it replaces them when upgrading
+    the prefix, so the shared content is never modified. Registry files and everything else wine
+    may write to are copied.
+    """
+
+    path: Path
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    @property
+    def default_pfx_path(self) -> Path:
+        return self.path.joinpath(DEFAULT_PFX_DIR)
+
+    @property
+    def prefix_path(self) -> Path:
+        return self.path.joinpath(PREFIX_DIR)
+
+    @property
+    def exists(self) -> bool:
+        return self.path.joinpath(COMPLETE_MARKER).exists()
+
+    def save(self, default_pfx_dir: Path, prefix_path: Path) -> None:
+        """Snapshots a default prefix and an initialized compatdata prefix into the template"""
+
+        with self._lock():
+            if self.exists:
+                return
+
+            LOG.debug("saving prefix template %s", self.path)
+
+            if self.path.exists():
+                shutil.rmtree(self.path)
+
+            # the default prefix is only ever read by Proton, all of it can be hardlinked
+            TreeCloner().clone(default_pfx_dir, self.default_pfx_path)
+            clone_prefix(prefix_path, self.prefix_path)
+
+            for rel_path in EXCLUDED_PATHS:
+                excluded = self.prefix_path.joinpath(rel_path)
+
+                if os.path.lexists(excluded):
+                    excluded.unlink()
+
+            self.path.joinpath(COMPLETE_MARKER).touch()
+
+    def restore_default_prefix(self, default_pfx_dir: Path) -> bool:
+        """Clones the template's default prefix into ``default_pfx_dir``, if there is one"""
+
+        if not self.exists:
+            return False
+
+        LOG.debug("restoring default prefix from template %s", self.path)
+
+        if default_pfx_dir.exists():
+            shutil.rmtree(default_pfx_dir)
+
+        TreeCloner().clone(self.default_pfx_path, default_pfx_dir)
+
+        return True
+
+    def restore_prefix(self, prefix_path: Path) -> bool:
+        """Clones the template's compatdata prefix into ``prefix_path``, if there is one"""
+
+        if not self.exists:
+            return False
+
+        LOG.debug("restoring prefix %s from template %s", prefix_path, self.path)
+
+        clone_prefix(self.prefix_path, prefix_path)
+
+        return True
+
+    @contextmanager
+    def _lock(self) -> Iterator[None]:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        with self.path.with_name(f".{self.path.name}.lock").open("a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            yield
+
+
+def clone_prefix(src: Path, dst: Path) -> None:
+    """Clones a compatdata prefix, hardlinking only the files tracked by Proton"""
+
+    tracked = tracked_files(src)
+
+    TreeCloner(hardlink_filter=tracked.__contains__).clone(src, dst)
+
+
+def tracked_files(prefix_path: Path) -> set[str]:
+    """Returns the files Proton copied from its dist, relative to the compatdata prefix
+
+    Proton lists them in ``pfx/tracked_files``, relative to the wine prefix.
+    """
+
+    file = prefix_path.joinpath("pfx", "tracked_files")
+
+    try:
+        lines = file.read_text(encoding="utf-8").splitlines()
+    except FileNotFoundError:
+        return set()
+
+    return {os.path.normpath(os.path.join("pfx", line)) for line in lines if line}
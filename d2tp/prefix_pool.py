@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import fcntl
+import queue
+import shutil
+import subprocess
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Final
+
+from .log import Logger
+from .prefix import COMPLETE_MARKER
+from .session_cache import mtime_ns
+from .trace import span
+from .wineserver import IDLE_TIMEOUT, WineServer
+
+if TYPE_CHECKING:
+    from .build import Build
+    from .session_cache import SessionState
+
+LOG: Final = Logger(__name__)
+
+
+class WorkerPrefix:
+    """Wine prefix used by one compiler process at a time, with its own wineserver
+
+    A pool holds an exclusive lock on each of its prefixes (see :meth:`try_lock`), so pools of
+    concurrent processes never share one.
+    """
+
+    path: Path
+    env: dict[str, str]
+    wineserver: WineServer
+    started_wineserver: bool
+
+    def __init__(self, path: Path, env: dict[str, str], wineserver: WineServer) -> None:
+        self.path = path
+        self.env = env
+        self.wineserver = wineserver
+        self.started_wineserver = False
+        self._lock_file: IO[str] | None = None
+
+    def try_lock(self) -> bool:
+        """Takes an exclusive lock on the prefix if nobody holds one, returns whether it did"""
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        # pylint: disable-next=consider-using-with
+        f = self.path.with_name(f".{self.path.name}.lock").open("a", encoding="utf-8")
+
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return False
+
+        self._lock_file = f
+
+        return True
+
+    def unlock(self) -> None:
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+class PrefixPool:
+    """Pool of isolated wine prefixes leased to concurrent compiler processes
+
+    Compiler processes sharing a prefix contend for its registry and temporary files. Each worker
+    prefix is a clone of the build's prefix (see :meth:`Build.clone_prefix`) with the same game
+    drive mapping, so paths converted in the build's prefix are valid in all of them. Worker
+    prefixes are created on first use and kept for later runs, until the build's prefix changes.
+    Their wineservers are started on first use and stopped when the pool is closed.
+
+    Worker prefixes are numbered and locked by the pool using them until it is closed: a pool
+    takes the lowest numbered prefixes no other process holds, so concurrent processes (e.g. two
+    builds, or a build next to ``d2tp serve``) each get their own.
+    """
+
+    build: Build
+    state: SessionState
+    game_path: Path
+    path: Path
+    size: int
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        build: Build,
+        state: SessionState,
+        game_path: Path,
+        path: Path,
+        size: int,
+    ) -> None:
+        self.build = build
+        self.state = state
+        self.game_path = game_path
+        self.path = path
+        self.size = size
+        self._free: queue.LifoQueue[WorkerPrefix] = queue.LifoQueue()
+        self._prefixes: list[WorkerPrefix] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def lease(self) -> Iterator[WorkerPrefix]:
+        """Leases a free prefix for the duration of the context, preparing a new one if needed"""
+
+        prefix = self._acquire()
+
+        try:
+            yield prefix
+        finally:
+            self._free.put(prefix)
+
+    def close(self) -> None:
+        """Stops the wineservers started by the pool and releases its prefixes"""
+
+        for prefix in self._prefixes:
+            try:
+                if prefix.started_wineserver:
+                    # worker prefixes only run the pool's compiler processes, all done by now
+                    prefix.wineserver.kill()
+            finally:
+                prefix.unlock()
+
+    def _acquire(self) -> WorkerPrefix:
+        try:
+            return self._free.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if len(self._prefixes) < self.size:
+                prefix = self._lock_worker_prefix()
+                self._prefixes.append(prefix)
+            else:
+                prefix = None
+
+        if prefix is None:
+            return self._free.get()
+
+        try:
+            with span("prepare_worker_prefix", prefix=prefix.path.name):
+                self._prepare(prefix)
+        except BaseException:
+            with self._lock:
+                self._prefixes.remove(prefix)
+
+            prefix.unlock()
+
+            raise
+
+        return prefix
+
+    def _lock_worker_prefix(self) -> WorkerPrefix:
+        """Returns the lowest numbered worker prefix nobody holds, locked"""
+
+        index = 0
+
+        while not (prefix := self._worker_prefix(index)).try_lock():
+            LOG.debug("worker prefix %s is in use, skipping it", prefix.path)
+            index += 1
+
+        return prefix
+
+    def _worker_prefix(self, index: int) -> WorkerPrefix:
+        path = self.path.joinpath(str(index))
+        main_prefix = str(self.build.prefix_path)
+
+        env = {
+            name: value.replace(main_prefix, str(path)) for name, value in self.state.env.items()
+        }
+
+        return WorkerPrefix(
+            path=path,
+            env=env,
+            wineserver=WineServer(self.state.wineserver_bin, env, path.joinpath("pfx")),
+        )
+
+    def _prepare(self, prefix: WorkerPrefix) -> None:
+        marker = prefix.path.joinpath(COMPLETE_MARKER)
+        version = str(mtime_ns(self.build.prefix_path.joinpath("version")))
+
+        if not marker.exists() or marker.read_text(encoding="utf-8") != version:
+            LOG.debug("creating worker prefix %s", prefix.path)
+
+            if prefix.path.exists():
+                shutil.rmtree(prefix.path)
+
+            self.build.clone_prefix(prefix.path)
+            marker.write_text(version, encoding="utf-8")
+
+        game_drive = prefix.path.joinpath("pfx", "dosdevices", "g:")
+
+        if not game_drive.exists():
+            game_drive.parent.mkdir(parents=True, exist_ok=True)
+            game_drive.symlink_to(self.game_path)
+
+            LOG.trace("  ln -s %s %s", self.game_path, game_drive)
+
+        if not prefix.wineserver.running:
+            prefix.wineserver.start(IDLE_TIMEOUT)
+            prefix.started_wineserver = True
+
+            # boots the prefix, so the first compiler process starts warm
+            subprocess.run(
+                [self.state.wine64_bin, "wineboot"],
+                check=False,
+                env=prefix.env,
+                capture_output=True,
+            )
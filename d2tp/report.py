@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Final
+
+from .log import Logger
+from .util import write_json_atomic
+
+LOG: Final = Logger(__name__)
+
+REPORT_VERSION: Final = 1
+
+# messages kept per file and per report, further ones are only counted
+MAX_MESSAGES: Final = 20
+
+COMPILING_RE: Final = re.compile(
+    r"^\s*\+-\s*(?:\[\s*\d+\s*/\s*\d+\s*\]\s*)?Compiling\s+(?P<path>.+?)(?:\s+->.*)?\s*$",
+    re.IGNORECASE,
+)
+ERROR_RE: Final = re.compile(r"^\s*(?:ERROR|FATAL|Failed)\b", re.IGNORECASE)
+WARNING_RE: Final = re.compile(r"^\s*WARNING\b", re.IGNORECASE)
+
+
+class FileReport:  # pylint: disable=too-few-public-methods
+    """Compilation of one resource, times in seconds since the report started"""
+
+    path: str
+    run: str
+    start: float
+    duration: float | None
+    warnings: int
+    errors: int
+    messages: list[str]
+
+    def __init__(self, path: str, run: str, start: float) -> None:
+        self.path = path
+        self.run = run
+        self.start = start
+        self.duration = None
+        self.warnings = 0
+        self.errors = 0
+        self.messages = []
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "path": self.path,
+            "run": self.run,
+            "start": round(self.start, 3),
+            "duration": None if self.duration is None else round(self.duration, 3),
+            "warnings": self.warnings,
+            "errors": self.errors,
+            "messages": self.messages,
+        }
+
+
+class RunReport:  # pylint: disable=too-few-public-methods
+    """One resource compiler process, ``max_rss`` is its peak memory in bytes if known"""
+
+    name: str
+    start: float
+    duration: float | None
+    returncode: int | None
+    max_rss: int | None
+    files: int
+
+    def __init__(self, name: str, start: float) -> None:
+        self.name = name
+        self.start = start
+        self.duration = None
+        self.returncode = None
+        self.max_rss = None
+        self.files = 0
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "start": round(self.start, 3),
+            "duration": None if self.duration is None else round(self.duration, 3),
+            "returncode": self.returncode,
+            "max_rss": self.max_rss,
+            "files": self.files,
+        }
+
+
+class CompileReport:
+    """Structured results of resource compiler runs, built from their output as it streams
+
+    Only per-file results and a bounded number of warning and error messages are kept, so memory
+    does not grow with the amount of output. Runs may be parsed concurrently from several threads.
+    """
+
+    files: dict[str, FileReport]
+    runs: list[RunReport]
+    messages: list[str]
+
+    def __init__(self) -> None:
+        self.files = {}
+        self.runs = []
+        self.messages = []
+        self._origin = time.monotonic()
+        self._lock = threading.Lock()
+
+    def now(self) -> float:
+        return time.monotonic() - self._origin
+
+    def parser(self, name: str) -> OutputParser:
+        """Returns a parser for the output of a new compiler run named ``name``"""
+
+        run = RunReport(name, self.now())
+
+        with self._lock:
+            self.runs.append(run)
+
+        return OutputParser(self, run)
+
+    def start_file(self, run: RunReport, path: str) -> FileReport:
+        file = FileReport(path, run.name, self.now())
+
+        with self._lock:
+            self.files[path] = file
+            run.files += 1
+
+        return file
+
+    def add_message(self, file: FileReport | None, line: str, error: bool) -> None:
+        with self._lock:
+            if file is None:
+                if len(self.messages) < MAX_MESSAGES:
+                    self.messages.append(line)
+                return
+
+            if error:
+                file.errors += 1
+            else:
+                file.warnings += 1
+
+            if len(file.messages) < MAX_MESSAGES:
+                file.messages.append(line)
+
+    @property
+    def failures(self) -> list[FileReport]:
+        return [file for file in self.files.values() if file.errors]
+
+    def slowest(self, count: int = 10) -> list[FileReport]:
+        timed = [file for file in self.files.values() if file.duration is not None]
+
+        return sorted(timed, key=lambda file: file.duration or 0.0, reverse=True)[:count]
+
+    def to_dict(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "version": REPORT_VERSION,
+                "runs": [run.to_dict() for run in self.runs],
+                "files": [file.to_dict() for file in self.files.values()],
+                "messages": self.messages,
+            }
+
+    def save(self, file: Path) -> None:
+        LOG.debug("saving compile report %s (%d files)", file, len(self.files))
+
+        write_json_atomic(file, self.to_dict(), indent=1)
+
+    def log_summary(self, count: int = 5) -> None:
+        slowest = self.slowest(count)
+
+        if slowest:
+            LOG.info("slowest files:")
+
+        for file in slowest:
+            LOG.info("  %.1fs %s", file.duration, file.path)
+
+        for file in self.failures:
+            LOG.error("  %s: %d errors", file.path, file.errors)
+
+            for message in file.messages:
+                LOG.error("    %s", message)
+
+
+class OutputParser:
+    """Parses resource compiler output line by line into a :class:`CompileReport`
+
+    A resource starts with its ``+- Compiling <path>`` line and finishes when the next one starts
+    or the run ends. Warning and error lines are attributed to the resource being compiled.
+    """
+
+    report: CompileReport
+    run: RunReport
+
+    def __init__(self, report: CompileReport, run: RunReport) -> None:
+        self.report = report
+        self.run = run
+        self._file: FileReport | None = None
+
+    def feed(self, line: str) -> None:
+        line = line.rstrip()
+
+        if not line:
+            return
+
+        match = COMPILING_RE.match(line)
+
+        if match is not None:
+            self._finish_file()
+            self._file = self.report.start_file(self.run, match.group("path"))
+        elif ERROR_RE.match(line):
+            self.report.add_message(self._file, line, error=True)
+        elif WARNING_RE.match(line):
+            self.report.add_message(self._file, line, error=False)
+
+    def close(self, returncode: int, max_rss: int | None = None) -> None:
+        self._finish_file()
+        self.run.returncode = returncode
+        self.run.max_rss = max_rss
+        self.run.duration = self.report.now() - self.run.start
+
+    def _finish_file(self) -> None:
+        if self._file is not None:
+            self._file.duration = self.report.now() - self._file.start
+            self._file = None
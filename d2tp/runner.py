@@ -1,45 +1,99 @@
 from __future__ import annotations
 
+import os
 import subprocess
-from collections.abc import Iterable
+import sys
+import threading
+from collections.abc import Callable, Generator, Iterable, Iterator, Sequence
+from contextlib import contextmanager, nullcontext
+from functools import partial
 from pathlib import Path, PosixPath, PurePath, PureWindowsPath
 from subprocess import CompletedProcess
-from tempfile import NamedTemporaryFile
 from typing import TYPE_CHECKING, Final, overload
 
+from .batching import BatchCompiler
 from .build import Build
+from .custom_game import MAP_SUFFIX
+from .deps import DependencyIndex, is_raw_input
 from .game import Game
+from .history import CompileHistory, worker_count
+from .jobs import Job, JobResult, log_summary, run_jobs, shard
+from .journal import CompileJournal
 from .log import Logger
+from .manifest import Manifest, file_digest
+from .output_cache import OutputCache, OutputRecorder, cache_key
+from .plan import CompilePlan
+from .prefix_pool import PrefixPool
+from .report import CompileReport
+from .trace import span
+from .winepath import DosDevices
+from .wineserver import IDLE_TIMEOUT, WineServer
 
 if TYPE_CHECKING:
     from proton import CompatData, Proton, Session
 
+    from .custom_game import CustomGame, SourceFile, SourceTree
+    from .session_cache import SessionState
+
 
 LOG: Final = Logger(__name__)
 
+ERRF_DUPLICATE_CUSTOM_GAME: Final = "Custom game {name} is listed more than once"
+
+# longest output line read at once when streaming, longer lines are split
+MAX_LINE: Final = 64 * 1024
+
+# paths converted by one winepath process in batch conversions
+WINEPATH_BATCH: Final = 256
+
+# environment variables affecting the compiler's outputs, e.g. through the shader compiler in use
+COMPILER_ENV: Final = ("WINEDLLOVERRIDES",)
+
 
 class Runner:  # pylint: disable=too-many-instance-attributes
     """Proton runner"""
 
     build: Build
     game: Game
-    proton: Proton
-    compatdata: CompatData
-    session: Session
+    state: SessionState
+    cache_path: Path
+    isolate_prefixes: bool
+    batch_files: int | None
+    batch_bytes: int | None
 
     def __init__(
         self,
         build: Build,
         game: Game,
+        cache_path: Path,
+        output_cache_path: Path | None = None,
+        isolate_prefixes: bool = True,
+        batch_files: int | None = None,
+        batch_bytes: int | None = None,
     ) -> None:
         LOG.debug("creating Runner")
 
         self.build = build
         self.game = game
-        self.proton, self.compatdata, self.session = self.build.start_session()
-        self._wine_bin = PosixPath(self.proton.wine64_bin)
-        self._prefix_path = Path(self.compatdata.prefix_dir)
+        self.cache_path = cache_path
+        self.isolate_prefixes = isolate_prefixes
+        self.batch_files = batch_files
+        self.batch_bytes = batch_bytes
+        self._prefix_pool: PrefixPool | None = None
+        self.output_cache = OutputCache(
+            cache_path.joinpath("outputs") if output_cache_path is None else output_cache_path
+        )
+        self._compiler_digest: str | None = None
+        self.state = self.build.session_state()
+        self._wine_bin = PosixPath(self.state.wine64_bin)
+        self._prefix_path = Path(self.state.prefix_dir)
         self._proton_game_path: PureWindowsPath | None = None
+        self._dosdevices = DosDevices(self._prefix_path.joinpath("dosdevices"))
+        self.wineserver = WineServer(self.state.wineserver_bin, self.state.env, self._prefix_path)
+        self._persistent_wineserver = False
+        # whether persistent_wineserver() started the server, None until it is needed
+        self._wineserver_started: bool | None = None
+        self._wineserver_lock = threading.Lock()
 
         self._prepare()
 
@@ -54,6 +108,102 @@ class Runner:  # pylint: disable=too-many-instance-attributes
 
             LOG.trace("  ln -s %s %s", self.game.path, game_drive)
 
+    @contextmanager
+    def persistent_wineserver(self, lazy: bool = True) -> Iterator[None]:
+        """Keeps a warm wineserver running for the duration of the context"""
+
+        if self._persistent_wineserver:
+            yield
+            return
+
+        self._persistent_wineserver = True
+
+        try:
+            if not lazy:
+                self._ensure_wineserver()
+
+            yield
+        finally:
+            self._persistent_wineserver = False
+
+            if self._wineserver_started:
+                self.wineserver.stop()
+
+            self._wineserver_started = None
+
+    def _ensure_wineserver(self) -> None:
+        """Starts the persistent wineserver of the current context, if not done yet"""
+
+        if not self._persistent_wineserver or self._wineserver_started is not None:
+            return
+
+        with self._wineserver_lock:
+            if self._wineserver_started is not None:
+                return
+
+            if self.wineserver.running:
+                LOG.debug("reusing running wineserver")
+                self._wineserver_started = False
+            else:
+                self.start_wineserver(IDLE_TIMEOUT)
+                self._wineserver_started = True
+
+    @contextmanager
+    def prefix_pool(self, size: int) -> Iterator[None]:
+        """Runs compiler processes started in the context in a pool of ``size`` worker prefixes"""
+
+        if size <= 1 or not self.isolate_prefixes or self._prefix_pool is not None:
+            yield
+            return
+
+        self._prefix_pool = PrefixPool(
+            build=self.build,
+            state=self.state,
+            game_path=self.game.path,
+            path=self.build.worker_prefix_path,
+            size=size,
+        )
+
+        try:
+            yield
+        finally:
+            self._prefix_pool.close()
+            self._prefix_pool = None
+
+    @contextmanager
+    def compiler_env(self) -> Iterator[dict[str, str] | None]:
+        """Leases a worker prefix from the pool if there is one, yielding its environment"""
+
+        if self._prefix_pool is None:
+            self._ensure_wineserver()
+            yield None
+            return
+
+        with self._prefix_pool.lease() as prefix:
+            yield prefix.env
+
+    def start_wineserver(self, timeout: int | None = None) -> None:
+        """Starts a persistent wineserver and boots the prefix, so later commands start warm"""
+
+        with span("start_wineserver"):
+            self.wineserver.start(timeout)
+            self.run("wineboot", capture=True)
+
+    @property
+    def proton(self) -> Proton:
+        proton, _, _ = self.build.start_session()
+        return proton
+
+    @property
+    def compatdata(self) -> CompatData:
+        _, compatdata, _ = self.build.start_session()
+        return compatdata
+
+    @property
+    def session(self) -> Session:
+        _, _, session = self.build.start_session()
+        return session
+
     @property
     def proton_game_path(self) -> PureWindowsPath:
         if self._proton_game_path is None:
@@ -74,20 +224,96 @@ class Runner:  # pylint: disable=too-many-instance-attributes
         path: str | PurePath,
         windows: bool = True,
     ) -> PosixPath | PureWindowsPath:
+        converted: PosixPath | PureWindowsPath | None
+
+        if windows:
+            converted = self._dosdevices.windows_path(path)
+        else:
+            converted = self._dosdevices.native_path(path)
+
+        if converted is not None:
+            LOG.trace("translated path %s -> %s", path, converted)
+            return converted
+
+        LOG.debug("falling back to winepath for %s", path)
+
+        return self._winepath([str(path)], windows)[0]
+
+    def wine_paths(
+        self,
+        paths: Iterable[str | PurePath],
+        windows: bool = True,
+        ready: Callable[[], bool] | None = None,
+    ) -> Generator[PosixPath | PureWindowsPath, None, None]:
+        """Converts many paths in order, yielding each as soon as it and all before it are done"""
+
+        pending: list[tuple[str, PosixPath | PureWindowsPath | None]] = []
+        fallbacks: list[str] = []
+
+        def flush() -> Generator[PosixPath | PureWindowsPath, None, None]:
+            # reversed, so they are popped in order
+            converted_fallbacks = self._winepath(fallbacks, windows)[::-1] if fallbacks else []
+
+            for _, converted in pending:
+                yield converted_fallbacks.pop() if converted is None else converted
+
+            pending.clear()
+            fallbacks.clear()
+
+        for path in paths:
+            path = str(path)
+            converted: PosixPath | PureWindowsPath | None
+
+            if windows:
+                converted = self._dosdevices.windows_path(path)
+            else:
+                converted = self._dosdevices.native_path(path)
+
+            if converted is not None and not pending:
+                yield converted
+                continue
+
+            pending.append((path, converted))
+
+            if converted is None:
+                fallbacks.append(path)
+
+            if len(fallbacks) >= WINEPATH_BATCH or (ready is not None and not ready()):
+                yield from flush()
+
+        yield from flush()
+
+    def _winepath(
+        self,
+        paths: list[str],
+        windows: bool,
+    ) -> list[PosixPath | PureWindowsPath]:
+        """Converts ``paths`` with one ``winepath`` process, or one per path if that fails"""
+
+        path_type = PureWindowsPath if windows else PosixPath
         cmd = ["winepath"]
 
         if windows:
             cmd.append("-w")
 
-        cmd.append(str(path))
+        if len(paths) > 1 and not any("\n" in path for path in paths):
+            LOG.debug("converting %d paths with winepath", len(paths))
 
-        process = self.run(*cmd, capture=True)
-        wine_path = process.stdout.strip()
+            process = self.run(*cmd, *paths, capture=True)
+            lines = process.stdout.splitlines()
 
-        if windows:
-            return PureWindowsPath(wine_path)
+            if len(lines) == len(paths):
+                return [path_type(line.strip()) for line in lines]
+
+            LOG.debug("  winepath output does not match paths, converting one at a time")
+
+        converted: list[PosixPath | PureWindowsPath] = []
 
-        return PosixPath(wine_path)
+        for path in paths:
+            process = self.run(*cmd, path, capture=True)
+            converted.append(path_type(process.stdout.strip()))
+
+        return converted
 
     def native_path(self, path: str | PureWindowsPath) -> PosixPath:
         return self.wine_path(path, windows=False)
@@ -100,69 +326,660 @@ class Runner:  # pylint: disable=too-many-instance-attributes
         *args: str,
         cwd: str | PosixPath | None = None,
         capture: bool = False,
+        output: Callable[[str], None] | None = None,
+        env: dict[str, str] | None = None,
     ) -> CompletedProcess:
+        """Runs a command in the session's environment (or ``env``), raising if it fails"""
+
         cmd = [str(self._wine_bin), *args]
-        env = self.session.env
+
+        if env is None:
+            env = self.state.env
 
         debug_cmd(cmd, cwd=cwd, env=env)
 
-        return subprocess.run(
-            cmd,
-            check=True,
-            env=env,
-            cwd=cwd,
-            encoding="utf-8",
-            capture_output=capture,
+        with span("run", cmd=PureWindowsPath(args[0]).name if args else ""):
+            if output is None:
+                return subprocess.run(
+                    cmd,
+                    check=True,
+                    env=env,
+                    cwd=cwd,
+                    encoding="utf-8",
+                    capture_output=capture,
+                )
+
+            return stream(cmd, output, env=env, cwd=cwd)
+
+    def compile(
+        self,
+        *args: str,
+        force: bool = False,
+        report: CompileReport | None = None,
+        name: str = "compile",
+    ) -> CompletedProcess:
+        """Runs the resource compiler, parsing its output into ``report`` if given"""
+
+        cmd = self.compiler_cmd(force=force)
+
+        with self.compiler_env() as env:
+            if report is None:
+                return self.run(*cmd, *args, cwd=self.game.path, env=env)
+
+            parser = report.parser(name)
+
+            try:
+                process = self.run(*cmd, *args, cwd=self.game.path, output=parser.feed, env=env)
+            except subprocess.CalledProcessError as ex:
+                parser.close(ex.returncode)
+                raise
+
+        parser.close(
+            process.returncode,
+            max_rss=process.max_rss if isinstance(process, StreamedProcess) else None,
         )
 
-    def compile(self, *args: str, force: bool = False) -> CompletedProcess:
+        return process
+
+    def compiler_cmd(self, force: bool = False) -> list[str]:
         cmd = [
             str(self.game.compiler_path),
             "-game",
             str(self.proton_game_path.joinpath("game", "dota")),
         ]
 
-        if force:
-            cmd.append("-fshallow")
+        cmd.extend(self.compiler_flags(force))
+
+        return cmd
+
+    def compiler_flags(self, force: bool = False) -> list[str]:
+        """Returns the compiler's flags affecting its outputs, besides its input"""
 
-        return self.run(*cmd, *args, cwd=self.game.path)
+        return ["-fshallow"] if force else []
+
+    def compile_file(
+        self,
+        path: PosixPath,
+        force: bool = False,
+        report: CompileReport | None = None,
+    ) -> CompletedProcess:
+        rel_path = str(self.game_rel_path(path))
 
-    def compile_file(self, path: PosixPath, force: bool = False) -> CompletedProcess:
-        return self.compile("-i", str(self.game_rel_path(path)), force=force)
+        return self.compile("-i", rel_path, force=force, report=report, name=rel_path)
 
     def compile_filelist(
         self,
         paths: Iterable[PosixPath],
         force: bool = False,
+        report: CompileReport | None = None,
+        name: str = "filelist",
     ) -> CompletedProcess:
+        with self.filelist(paths) as filelist_proton_path:
+            return self.compile(
+                "-filelist",
+                str(filelist_proton_path),
+                force=force,
+                report=report,
+                name=name,
+            )
+
+    @contextmanager
+    def filelist(self, paths: Iterable[PosixPath]) -> Iterator[PureWindowsPath]:
+        """Writes a temporary resource compiler filelist, yielding its Proton path"""
+
+        # pylint: disable-next=import-outside-toplevel
+        from tempfile import NamedTemporaryFile
+
         with NamedTemporaryFile(mode="w+", encoding="utf-8") as f:
             f.writelines(f"{self.game_rel_path(p)}\n" for p in paths)
             f.flush()
 
-            filelist_proton_path = self.wine_path(f.name)
-
-            return self.compile("-filelist", str(filelist_proton_path), force=force)
+            yield self.wine_path(f.name)
 
     def compile_custom_game(
         self,
         name: str,
         src_path: str | PosixPath,
         force: bool = False,
-    ) -> None:
+        jobs: int = 1,
+        shards: int = 1,
+        resume: bool = False,
+        report: CompileReport | None = None,
+    ) -> list[JobResult]:
         custom_game = self.game.custom_game(name, src_path)
 
         custom_game.setup()
 
-        for path in custom_game.map_files:
-            rel_path = path.relative_to(custom_game.src_content_path)
-            self.compile_file(custom_game.content_path.joinpath(rel_path), force=force)
+        manifest = self.manifest(custom_game)
+        manifest.load()
+
+        deps = self.dependency_index(custom_game)
+        deps.load()
+
+        return self.sync_custom_game(
+            custom_game,
+            manifest,
+            deps,
+            force=force,
+            jobs=jobs,
+            shards=shards,
+            resume=resume,
+            report=report,
+        )
+
+    def sync_custom_game(
+        self,
+        custom_game: CustomGame,
+        manifest: Manifest,
+        deps: DependencyIndex,
+        force: bool = False,
+        jobs: int = 1,
+        shards: int = 1,
+        resume: bool = False,
+        report: CompileReport | None = None,
+    ) -> list[JobResult]:
+        """Scans a custom game's sources and compiles the ones changed since ``manifest``"""
+
+        return self.compile_sources(
+            custom_game,
+            self._scan(custom_game, manifest, deps),
+            manifest,
+            deps,
+            force=force,
+            jobs=jobs,
+            shards=shards,
+            resume=resume,
+            report=report,
+        )
+
+    def _scan(
+        self,
+        custom_game: CustomGame,
+        manifest: Manifest,
+        deps: DependencyIndex,
+    ) -> SourceTree:
+        """Scans a custom game's sources, dropping removed files from ``manifest`` and ``deps``"""
+
+        files = custom_game.scan()
+        rel_paths = [file.rel_path for file in [*files.maps, *files.assets]]
+
+        manifest.prune(rel_paths)
+        deps.prune(rel_paths)
+
+        return files
+
+    def compile_sources(
+        self,
+        custom_game: CustomGame,
+        files: SourceTree,
+        manifest: Manifest,
+        deps: DependencyIndex,
+        force: bool = False,
+        jobs: int = 1,
+        shards: int = 1,
+        resume: bool = False,
+        subset: bool = False,
+        report: CompileReport | None = None,
+    ) -> list[JobResult]:
+        """Compiles the changed files in ``files`` and the files depending on them"""
+
+        plan = self.plan_sources(
+            custom_game,
+            files,
+            manifest,
+            deps,
+            force=force,
+            shards=shards,
+            resume=resume,
+            subset=subset,
+            report=report,
+        )
+        results = []
+        workers = jobs or worker_count(plan.peak_memory, limit=len(plan.jobs))
+
+        try:
+            with self.prefix_pool(min(workers, len(plan.jobs))):
+                for result in run_jobs(plan.jobs, workers=workers):
+                    results.append(result)
+                    plan.record(result)
+        finally:
+            plan.finish(self.report_file(custom_game))
+
+        log_summary(results)
+        plan.report.log_summary()
+
+        return results
+
+    def compile_custom_games(
+        self,
+        addons: Sequence[tuple[str, str | PosixPath]],
+        force: bool = False,
+        jobs: int = 1,
+        shards: int = 1,
+        resume: bool = False,
+    ) -> dict[str, list[JobResult]]:
+        """Compiles several custom games, scheduling the jobs of all of them in one pool"""
+
+        plans: dict[str, CompilePlan] = {}
+
+        for name, src_path in addons:
+            if name in plans:
+                raise ValueError(ERRF_DUPLICATE_CUSTOM_GAME.format(name=name))
+
+            custom_game = self.game.custom_game(name, src_path)
+            custom_game.setup()
+
+            manifest = self.manifest(custom_game)
+            manifest.load()
+
+            deps = self.dependency_index(custom_game)
+            deps.load()
+
+            LOG.info("planning %s", name)
+
+            plans[name] = self.plan_sources(
+                custom_game,
+                self._scan(custom_game, manifest, deps),
+                manifest,
+                deps,
+                force=force,
+                shards=shards,
+                resume=resume,
+            )
+
+        owners: dict[int, str] = {}
+        compile_jobs = []
+
+        for name, plan in plans.items():
+            for job in plan.jobs:
+                job = job._replace(name=f"{name}: {job.name}")
+                owners[id(job)] = name
+                compile_jobs.append(job)
+
+        compile_jobs.sort(key=lambda job: job.cost, reverse=True)
+
+        results: dict[str, list[JobResult]] = {name: [] for name in plans}
+        workers = jobs or worker_count(
+            max((plan.peak_memory for plan in plans.values()), default=0),
+            limit=len(compile_jobs),
+        )
+
+        try:
+            with self.prefix_pool(min(workers, len(compile_jobs))):
+                for result in run_jobs(compile_jobs, workers=workers):
+                    name = owners[id(result.job)]
+                    results[name].append(result)
+                    plans[name].record(result)
+        finally:
+            for plan in plans.values():
+                plan.finish(self.report_file(plan.custom_game))
+
+        log_summary([result for addon_results in results.values() for result in addon_results])
+
+        for plan in plans.values():
+            plan.report.log_summary()
+
+        return results
+
+    def plan_sources(
+        self,
+        custom_game: CustomGame,
+        files: SourceTree,
+        manifest: Manifest,
+        deps: DependencyIndex,
+        force: bool = False,
+        shards: int = 1,
+        resume: bool = False,
+        subset: bool = False,
+        report: CompileReport | None = None,
+    ) -> CompilePlan:
+        """Returns the compile jobs for the changed files in ``files`` and their dependents"""
+
+        if report is None:
+            report = CompileReport()
+
+        history = self.compile_history(custom_game)
+        history.load()
+
+        deps.update([*files.maps, *files.assets])
+
+        changed = {
+            file.path: (file, entry)
+            for file, entry in manifest.changes([*files.maps, *files.assets], force=force)
+        }
+        inputs: dict[PosixPath, set[PosixPath]] = {}
+
+        for file, _ in list(changed.values()):
+            dependents = [
+                dependent
+                for rel_path in sorted(deps.dependents(file.rel_path))
+                if (dependent := custom_game.source_file(custom_game.src_content_path / rel_path))
+            ]
+
+            for dependent in dependents:
+                if dependent.path not in changed:
+                    LOG.debug("  %s depends on %s", dependent.rel_path, file.rel_path)
+                    changed[dependent.path] = (dependent, manifest.entry(dependent))
+
+            if dependents and is_raw_input(file.rel_path):
+                inputs[file.path] = {dependent.path for dependent in dependents}
+
+        changed_maps = [
+            file
+            for path, (file, _) in changed.items()
+            if path not in inputs and file.rel_path.endswith(MAP_SUFFIX)
+        ]
+        changed_assets = [
+            file
+            for path, (file, _) in changed.items()
+            if path not in inputs and not file.rel_path.endswith(MAP_SUFFIX)
+        ]
+
+        journal = self.compile_journal(custom_game)
+        journal.start(resume=resume or subset)
+
+        cache_keys: dict[PosixPath, str] = {}
+        input_refs: dict[PosixPath, dict[str, str | None]] = {}
+        resumed: set[PosixPath] = set()
+        restored: set[PosixPath] = set()
+        resolve = self._ref_resolver(custom_game, files, manifest)
+
+        def source_digest(file: SourceFile) -> str:
+            if file.path in changed:
+                return changed[file.path][1].digest
+
+            return manifest.entry(file).digest
+
+        for file in [*changed_maps, *changed_assets]:
+            refs = input_refs[file.path] = self._input_refs(file, deps, resolve, source_digest)
+            key = self._input_key(file, source_digest(file), refs, force=force)
+
+            if journal.plan(file, key):
+                LOG.debug("  %s was compiled by an interrupted run", file.rel_path)
+                manifest.update(file.rel_path, changed[file.path][1])
+                resumed.add(file.path)
+            elif not force and self.output_cache.restore(key, custom_game.game_path):
+                LOG.debug("  restored %s from the output cache", file.rel_path)
+                manifest.update(file.rel_path, changed[file.path][1])
+                restored.add(file.path)
+            else:
+                cache_keys[file.path] = key
+
+        if resumed:
+            LOG.info("resuming, skipping %d files compiled by an interrupted run", len(resumed))
+
+        if restored:
+            LOG.info("restored %d files from the output cache", len(restored))
+
+        if resumed or restored:
+            done = resumed | restored
+            changed_maps = [file for file in changed_maps if file.path not in done]
+            changed_assets = [file for file in changed_assets if file.path not in done]
+
+        LOG.info(
+            "compiling %d maps and %d assets (%d changed inputs compiled through dependents)",
+            len(changed_maps),
+            len(changed_assets),
+            len(inputs),
+        )
 
-        asset_files = [
-            custom_game.content_path.joinpath(path.relative_to(custom_game.src_content_path))
-            for path in custom_game.asset_files
+        recorder = OutputRecorder(
+            custom_game.src_game_path,
+            {file.path: file.rel_path for file in [*changed_maps, *changed_assets]},
+            cache_keys,
+        )
+        compile_jobs = [
+            Job(
+                name=file.rel_path,
+                paths=[file.path],
+                run=partial(
+                    self._compile_map,
+                    custom_game,
+                    file.path,
+                    force=force,
+                    report=report,
+                    recorder=recorder,
+                ),
+                cost=history.cost(file),
+            )
+            for file in changed_maps
         ]
 
-        self.compile_filelist(asset_files, force=force)
+        compile_jobs.extend(
+            self._asset_jobs(
+                custom_game,
+                [file.path for file in changed_assets],
+                weight=lambda path: history.cost(changed[path][0]),
+                size=lambda path: changed[path][0].stat.st_size,
+                shards=shards,
+                force=force,
+                report=report,
+                journal=journal,
+                recorder=recorder,
+            )
+        )
+
+        compile_jobs.sort(key=lambda job: job.cost, reverse=True)
+
+        LOG.debug(
+            "  predicted compile time %.1fs, longest job %.1fs",
+            sum(job.cost for job in compile_jobs),
+            compile_jobs[0].cost if compile_jobs else 0.0,
+        )
+
+        return CompilePlan(
+            custom_game=custom_game,
+            manifest=manifest,
+            deps=deps,
+            report=report,
+            changed=changed,
+            inputs=inputs,
+            jobs=compile_jobs,
+            output_cache=self.output_cache,
+            cache_keys=cache_keys,
+            refs=input_refs,
+            recorder=recorder,
+            history=history,
+            peak_memory=history.peak_memory([*changed_maps, *changed_assets]),
+            journal=journal,
+            resumed=resumed,
+            subset=subset,
+        )
+
+    def _ref_resolver(
+        self,
+        custom_game: CustomGame,
+        files: SourceTree,
+        manifest: Manifest,
+    ) -> Callable[[str], SourceFile | None]:
+        """Returns a function resolving lower case references to the custom game's source files"""
+
+        names = {rel_path.lower(): rel_path for rel_path in manifest.entries}
+        names.update(
+            (file.rel_path.lower(), file.rel_path) for file in [*files.maps, *files.assets]
+        )
+        resolved: dict[str, SourceFile | None] = {}
+
+        def resolve(ref: str) -> SourceFile | None:
+            if ref not in resolved:
+                resolved[ref] = custom_game.source_file(
+                    custom_game.src_content_path / names.get(ref, ref)
+                )
+
+            return resolved[ref]
+
+        return resolve
+
+    def _input_refs(
+        self,
+        file: SourceFile,
+        deps: DependencyIndex,
+        lookup: Callable[[str], SourceFile | None],
+        digest: Callable[[SourceFile], str],
+    ) -> dict[str, str | None]:
+        """Returns the content digests of the files ``file`` references transitively"""
+
+        refs: dict[str, str | None] = {}
+        seen = {file.rel_path}
+        pending = [file.rel_path]
+
+        while pending:
+            entry = deps.entries.get(pending.pop())
+
+            for ref in entry.refs if entry is not None else ():
+                ref_file = lookup(ref)
+
+                if ref_file is None:
+                    refs[ref] = None
+                elif ref_file.rel_path not in seen:
+                    seen.add(ref_file.rel_path)
+                    refs[ref] = digest(ref_file)
+                    pending.append(ref_file.rel_path)
+
+        return refs
+
+    def _input_key(
+        self,
+        file: SourceFile,
+        digest: str,
+        refs: dict[str, str | None],
+        force: bool = False,
+    ) -> str:
+        """Returns the key of ``file``'s compilation, used by the output cache and the journal"""
+
+        return cache_key(
+            {
+                "path": file.rel_path,
+                "source": digest,
+                "refs": refs,
+                "compiler": self.compiler_digest,
+                "flags": self.compiler_flags(force),
+                "input": "-i" if file.rel_path.endswith(MAP_SUFFIX) else "-filelist",
+                "proton": str(self.build.proton_version),
+                "env": {name: os.environ.get(name) for name in COMPILER_ENV},
+            }
+        )
+
+    @property
+    def compiler_digest(self) -> str:
+        """Hash of the resource compiler binary, identifying the compiler's version"""
+
+        if self._compiler_digest is None:
+            self._compiler_digest = file_digest(self.game.compiler_path)
+
+        return self._compiler_digest
+
+    def _asset_jobs(  # pylint: disable=too-many-locals
+        self,
+        custom_game: CustomGame,
+        paths: list[PosixPath],
+        weight: Callable[[PosixPath], float],
+        size: Callable[[PosixPath], int],
+        shards: int = 1,
+        force: bool = False,
+        report: CompileReport | None = None,
+        journal: CompileJournal | None = None,
+        recorder: OutputRecorder | None = None,
+    ) -> list[Job]:
+        asset_shards = shard(paths, shards, weight=weight)
+        batches = BatchCompiler(
+            self, custom_game, force=force, report=report, journal=journal, recorder=recorder
+        )
+        compile_jobs = []
+
+        for i, shard_paths in enumerate(asset_shards, start=1):
+            name = f"assets ({len(shard_paths)} files)"
+
+            if len(asset_shards) > 1:
+                name = f"assets shard {i}/{len(asset_shards)} ({len(shard_paths)} files)"
+
+            compile_jobs.append(
+                Job(
+                    name=name,
+                    paths=shard_paths,
+                    run=partial(batches.compile, shard_paths, size, name=name),
+                    cost=sum(weight(path) for path in shard_paths),
+                )
+            )
+
+        return compile_jobs
+
+    def _compile_map(
+        self,
+        custom_game: CustomGame,
+        path: PosixPath,
+        force: bool = False,
+        report: CompileReport | None = None,
+        recorder: OutputRecorder | None = None,
+    ) -> None:
+        with recorder.run([path]) if recorder is not None else nullcontext():
+            self.compile_file(custom_game.content_file(path), force=force, report=report)
+
+    def manifest(self, custom_game: CustomGame) -> Manifest:
+        file = self.cache_path.joinpath("manifest", f"{custom_game.name}.json")
+
+        return Manifest(file, custom_game.src_content_path, self.game.path)
+
+    def dependency_index(self, custom_game: CustomGame) -> DependencyIndex:
+        return DependencyIndex(self.cache_path.joinpath("deps", f"{custom_game.name}.json"))
+
+    def compile_journal(self, custom_game: CustomGame) -> CompileJournal:
+        return CompileJournal(self.cache_path.joinpath("journal", f"{custom_game.name}.jsonl"))
+
+    def compile_history(self, custom_game: CustomGame) -> CompileHistory:
+        return CompileHistory(self.cache_path.joinpath("history", f"{custom_game.name}.json"))
+
+    def report_file(self, custom_game: CustomGame) -> Path:
+        """Returns the file the report of a custom game's last compilation is saved to"""
+
+        return self.cache_path.joinpath("reports", f"{custom_game.name}.json")
+
+
+def stream(
+    cmd: list[str],
+    output: Callable[[str], None],
+    env: dict[str, str] | None = None,
+    cwd: str | PosixPath | None = None,
+) -> StreamedProcess:
+    """Runs ``cmd``, echoing its combined stdout and stderr and passing each line to ``output``"""
+
+    with subprocess.Popen(
+        cmd,
+        env=env,
+        cwd=cwd,
+        encoding="utf-8",
+        errors="replace",
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    ) as process:
+        stdout = process.stdout
+
+        assert stdout is not None
+
+        for line in iter(lambda: stdout.readline(MAX_LINE), ""):
+            sys.stdout.write(line)
+            output(line)
+
+        # reaps the process itself for its resource usage, ru_maxrss is in KiB
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+
+    sys.stdout.flush()
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd)
+
+    return StreamedProcess(cmd, process.returncode, max_rss=usage.ru_maxrss * 1024)
+
+
+class StreamedProcess(CompletedProcess):
+    """Process run by :func:`stream`, ``max_rss`` is its peak memory in bytes"""
+
+    max_rss: int
+
+    def __init__(self, args: list[str], returncode: int, max_rss: int) -> None:
+        super().__init__(args, returncode)
+        self.max_rss = max_rss
 
 
 def debug_cmd(
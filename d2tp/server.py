@@ -0,0 +1,471 @@
+from __future__ import annotations
+
+import json
+import os
+import selectors
+import signal
+import socket
+import sys
+import time
+import traceback
+from argparse import Namespace
+from collections.abc import Callable
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Final, NoReturn
+
+from .log import Logger
+
+if TYPE_CHECKING:
+    from .runner import Runner
+
+
+LOG: Final = Logger(__name__)
+
+MAX_MESSAGE_SIZE: Final = 64 * 1024 * 1024
+STDIO_FDS: Final = [0, 1, 2]
+
+# seconds a client has to send its request
+REQUEST_TIMEOUT: Final = 10.0
+
+ERRF_SERVER_RUNNING = "Server already listening on {path}"
+ERRF_NO_SERVER = "No server listening on {path}"
+ERRF_SERVER_MISMATCH = (
+    "Server at {path} was started with {name} = {server!r}, client has {client!r}"
+)
+
+Handler = Callable[["Runner", Namespace], int]
+
+
+class PendingRequest:  # pylint: disable=too-few-public-methods
+    """Connection whose request is still being read, see :class:`Server`"""
+
+    conn: socket.socket
+    data: bytes
+    fds: list[int]
+    deadline: float
+
+    def __init__(self, conn: socket.socket, deadline: float) -> None:
+        self.conn = conn
+        self.data = b""
+        self.fds = []
+        self.deadline = deadline
+
+
+class RequestProcess:  # pylint: disable=too-few-public-methods
+    """Forked child running a client's request, see :class:`Server`"""
+
+    conn: socket.socket
+    pid: int
+    pidfd: int
+    connected: bool
+
+    def __init__(self, conn: socket.socket, pid: int, pidfd: int) -> None:
+        self.conn = conn
+        self.pid = pid
+        self.pidfd = pidfd
+        self.connected = True
+
+
+class Server:  # pylint: disable=too-many-instance-attributes
+    """Unix socket server running commands on a warm :class:`Runner`
+
+    Clients send one JSON request per connection together with their stdio file descriptors
+    (``SCM_RIGHTS``). Each request runs in a forked child that inherits the initialized runner
+    and writes directly to the client's stdio, so output streams back without copying. The
+    child's exit code is sent back as the reply. If the client disconnects early, the child's
+    process group is terminated.
+
+    Connections and request processes are all handled by the thread calling :meth:`serve`, so
+    children are forked from a single threaded process. Requests are read as they arrive, a
+    client that doesn't send its request within :data:`REQUEST_TIMEOUT` seconds is dropped.
+    """
+
+    runner: Runner
+    path: Path
+    handler: Handler
+    config: dict[str, str]
+
+    def __init__(
+        self,
+        runner: Runner,
+        path: Path,
+        handler: Handler,
+        config: dict[str, str],
+    ) -> None:
+        self.runner = runner
+        self.path = path
+        self.handler = handler
+        self.config = config
+        self._socket: socket.socket | None = None
+        self._selector: selectors.BaseSelector | None = None
+        self._processes: dict[int, RequestProcess] = {}
+        self._pending: list[PendingRequest] = []
+
+    def serve(self) -> None:
+        self._bind()
+
+        assert self._socket is not None
+
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+        # warm up caches inherited by request processes
+        _ = self.runner.proton_game_path
+
+        LOG.warning("listening on %s", self.path)
+
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._socket, selectors.EVENT_READ)
+
+        try:
+            while True:
+                for key, _ in self._selector.select(self._select_timeout()):
+                    if key.fileobj is self._socket:
+                        self._accept()
+                    elif isinstance(key.data, PendingRequest):
+                        self._read_request(key.data)
+                    elif key.fileobj is key.data.conn:
+                        self._check_connection(key.data)
+                    else:
+                        self._finish(key.data)
+
+                self._expire_requests()
+        finally:
+            for pending in list(self._pending):
+                self._drop_request(pending)
+
+            for process in list(self._processes.values()):
+                terminate(process.pid)
+                self._finish(process)
+
+            self._selector.close()
+            self._selector = None
+            self.close()
+
+    def close(self) -> None:
+        if self._socket is None:
+            return
+
+        LOG.debug("closing %s", self.path)
+
+        self._socket.close()
+        self._socket = None
+        self.path.unlink(missing_ok=True)
+
+    def _bind(self) -> None:
+        if self.path.exists():
+            if ping(self.path):
+                raise ValueError(ERRF_SERVER_RUNNING.format(path=self.path))
+
+            LOG.debug("removing stale socket %s", self.path)
+            self.path.unlink()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(str(self.path))
+        os.chmod(self.path, 0o600)
+        self._socket.listen()
+
+    def _accept(self) -> None:
+        assert self._socket is not None and self._selector is not None
+
+        conn, _ = self._socket.accept()
+        conn.setblocking(False)
+
+        pending = PendingRequest(conn, time.monotonic() + REQUEST_TIMEOUT)
+        self._pending.append(pending)
+        self._selector.register(conn, selectors.EVENT_READ, pending)
+
+    def _read_request(self, pending: PendingRequest) -> None:
+        try:
+            data, fds, _, _ = socket.recv_fds(pending.conn, 65536, len(STDIO_FDS))
+        except BlockingIOError:
+            return
+        except OSError as ex:
+            LOG.error("Invalid request: %s", ex)
+            self._drop_request(pending)
+            return
+
+        pending.fds.extend(fds)
+        pending.data += data
+
+        if not data or len(pending.data) > MAX_MESSAGE_SIZE:
+            LOG.error("Invalid request: incomplete request")
+            self._drop_request(pending)
+        elif pending.data.endswith(b"\n"):
+            self._remove_request(pending)
+            pending.conn.setblocking(True)
+            self._handle(pending.conn, pending.data, pending.fds)
+
+    def _select_timeout(self) -> float | None:
+        if not self._pending:
+            return None
+
+        return max(0.0, min(pending.deadline for pending in self._pending) - time.monotonic())
+
+    def _expire_requests(self) -> None:
+        now = time.monotonic()
+
+        for pending in [pending for pending in self._pending if pending.deadline <= now]:
+            LOG.error("Invalid request: timed out")
+            self._drop_request(pending)
+
+    def _remove_request(self, pending: PendingRequest) -> None:
+        assert self._selector is not None
+
+        self._selector.unregister(pending.conn)
+        self._pending.remove(pending)
+
+    def _drop_request(self, pending: PendingRequest) -> None:
+        self._remove_request(pending)
+
+        for fd in pending.fds:
+            os.close(fd)
+
+        pending.conn.close()
+
+    def _handle(self, conn: socket.socket, data: bytes, fds: list[int]) -> None:
+        assert self._selector is not None
+
+        pid = None
+
+        try:
+            request = json.loads(data)
+
+            if isinstance(request, dict) and request.get("ping"):
+                send_exit(conn, 0)
+                return
+
+            check_request(request, fds)
+
+            LOG.info("request %s %r", request["args"]["cmd"], request["args"]["cmd_args"])
+
+            if not self._check_config(request, fds):
+                send_exit(conn, 2)
+                return
+
+            pid = self._fork(request, fds)
+        except ValueError as ex:
+            LOG.error("Invalid request: %s", ex)
+
+            try:
+                send_exit(conn, 2)
+            except OSError:
+                pass
+        except OSError as ex:
+            LOG.error("Failed to handle request: %s", ex)
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+            if pid is None:
+                conn.close()
+
+        if pid is None:
+            return
+
+        process = RequestProcess(conn, pid, os.pidfd_open(pid))
+        self._processes[pid] = process
+        self._selector.register(process.pidfd, selectors.EVENT_READ, process)
+        self._selector.register(conn, selectors.EVENT_READ, process)
+
+    def _check_config(self, request: dict[str, Any], fds: list[int]) -> bool:
+        for name, value in request["config"].items():
+            if self.config.get(name) != value:
+                message = ERRF_SERVER_MISMATCH.format(
+                    path=self.path,
+                    name=name,
+                    server=self.config.get(name),
+                    client=value,
+                )
+                os.write(fds[2], f"{message}\n".encode())
+                return False
+
+        return True
+
+    def _fork(self, request: dict[str, Any], fds: list[int]) -> int:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        pid = os.fork()
+
+        if pid == 0:
+            self._child(request, fds)
+
+        # also set by the child, so the group exists whichever runs first
+        try:
+            os.setpgid(pid, pid)
+        except OSError:
+            pass
+
+        return pid
+
+    def _check_connection(self, process: RequestProcess) -> None:
+        assert self._selector is not None
+
+        # only disconnection is expected, stop watching the connection either way
+        self._selector.unregister(process.conn)
+        process.connected = False
+
+        try:
+            disconnected = not process.conn.recv(1, socket.MSG_PEEK)
+        except OSError:
+            disconnected = True
+
+        if disconnected:
+            LOG.info("client disconnected, terminating request process %d", process.pid)
+            terminate(process.pid)
+
+    def _finish(self, process: RequestProcess) -> None:
+        assert self._selector is not None
+
+        try:
+            self._selector.unregister(process.pidfd)
+
+            if process.connected:
+                self._selector.unregister(process.conn)
+        finally:
+            os.close(process.pidfd)
+            del self._processes[process.pid]
+
+            _, status = os.waitpid(process.pid, 0)
+            exit_code = os.waitstatus_to_exitcode(status)
+
+        try:
+            send_exit(process.conn, exit_code)
+        except OSError:
+            LOG.debug("client disconnected before receiving exit code")
+        finally:
+            process.conn.close()
+
+    def _child(self, request: dict[str, Any], fds: list[int]) -> NoReturn:
+        exit_code = 1
+
+        try:
+            os.setpgid(0, 0)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+            for target_fd, fd in zip(STDIO_FDS, fds):
+                os.dup2(fd, target_fd)
+
+            os.chdir(request["cwd"])
+
+            exit_code = self.handler(self.runner, Namespace(**request["args"]))
+        except SystemExit as ex:
+            exit_code = ex.code if isinstance(ex.code, int) else 1
+        except BaseException:  # pylint: disable=broad-except
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(exit_code)  # pylint: disable=protected-access
+
+
+def request_command(
+    path: Path,
+    args: dict[str, Any],
+    config: dict[str, str],
+) -> int:
+    """Runs a command on the server listening on ``path``, returns its exit code"""
+
+    request = {"args": args, "config": config, "cwd": os.getcwd()}
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        try:
+            conn.connect(str(path))
+        except (FileNotFoundError, ConnectionRefusedError):
+            LOG.error(ERRF_NO_SERVER.format(path=path))
+            return 1
+
+        send_request(conn, request, STDIO_FDS)
+        reply = recv_message(conn)
+
+    exit_code = int(reply["exit"])
+
+    # killed by a signal, report it the way shells do
+    if exit_code < 0:
+        return 128 - exit_code
+
+    return exit_code
+
+
+def ping(path: Path) -> bool:
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.connect(str(path))
+            send_request(conn, {"ping": True}, [])
+            recv_message(conn)
+    except (OSError, ValueError):
+        return False
+
+    return True
+
+
+def send_request(conn: socket.socket, request: dict[str, Any], fds: list[int]) -> None:
+    data = json.dumps(request).encode("utf-8") + b"\n"
+
+    try:
+        sent = socket.send_fds(conn, [data[:4096]], fds)
+
+        if sent < len(data):
+            conn.sendall(data[sent:])
+    except BrokenPipeError:
+        # the server replied (e.g. rejecting the request) and closed the connection early,
+        # its reply is still readable
+        LOG.debug("server closed the connection while sending the request")
+
+
+def check_request(request: Any, fds: list[int]) -> None:
+    """Raises :class:`ValueError` if ``request`` is not a valid command request"""
+
+    if len(fds) != len(STDIO_FDS):
+        raise ValueError(f"expected {len(STDIO_FDS)} file descriptors, got {len(fds)}")
+
+    if not isinstance(request, dict):
+        raise ValueError("request is not an object")
+
+    args = request.get("args")
+
+    if not isinstance(args, dict) or "cmd" not in args or "cmd_args" not in args:
+        raise ValueError("missing or invalid args")
+
+    if not isinstance(request.get("config"), dict):
+        raise ValueError("missing or invalid config")
+
+    if not isinstance(request.get("cwd"), str):
+        raise ValueError("missing or invalid cwd")
+
+
+def terminate(pid: int) -> None:
+    """Terminates the process group of request process ``pid``, or the process alone"""
+
+    try:
+        os.killpg(pid, signal.SIGTERM)
+    except ProcessLookupError:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+
+def send_exit(conn: socket.socket, exit_code: int) -> None:
+    send_message(conn, {"exit": exit_code})
+
+
+def send_message(conn: socket.socket, message: dict[str, Any]) -> None:
+    conn.sendall(json.dumps(message).encode("utf-8") + b"\n")
+
+
+def recv_message(conn: socket.socket) -> dict[str, Any]:
+    data = b""
+
+    while not data.endswith(b"\n"):
+        chunk = conn.recv(65536)
+
+        if not chunk:
+            raise ValueError("server closed connection without reply")
+
+        data += chunk
+
+    return json.loads(data)
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Final, NamedTuple
+
+from .log import Logger
+from .util import write_json_atomic
+
+LOG: Final = Logger(__name__)
+
+SESSION_CACHE_VERSION: Final = 1
+
+# Environment variables that influence how Proton sets up a session
+SESSION_ENV_PREFIXES: Final = ("PROTON_", "WINE", "DXVK_", "VKD3D_", "STEAM_", "Steam")
+SESSION_ENV_NAMES: Final = ("PATH", "LD_LIBRARY_PATH", "HOME", "USER")
+
+
+class SessionState(NamedTuple):
+    """Initialized Proton session data needed to run commands"""
+
+    env: dict[str, str]
+    wine64_bin: str
+    wineserver_bin: str
+    prefix_dir: str
+
+
+class SessionCache:
+    """On-disk snapshot of a :class:`SessionState`
+
+    The environment is stored as a delta against ``os.environ`` at snapshot time, so it can be
+    reapplied on top of the environment of later runs.
+    """
+
+    file: Path
+
+    def __init__(self, file: Path) -> None:
+        self.file = file
+
+    def load(self, key: dict[str, Any]) -> SessionState | None:
+        LOG.debug("loading session snapshot %s", self.file)
+
+        try:
+            data = json.loads(self.file.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            LOG.trace("  session snapshot not found")
+            return None
+        except ValueError:
+            LOG.warning("Ignoring invalid session snapshot %s", self.file)
+            return None
+
+        if data.get("version") != SESSION_CACHE_VERSION or data.get("key") != key:
+            LOG.trace("  session snapshot is stale")
+            return None
+
+        state = data["state"]
+
+        if not os.path.exists(state["wine64_bin"]) or not os.path.isdir(state["prefix_dir"]):
+            LOG.trace("  session snapshot points to missing files")
+            return None
+
+        env = dict(os.environ)
+        env.update(data["env"]["set"])
+
+        for name in data["env"]["unset"]:
+            env.pop(name, None)
+
+        return SessionState(
+            env=env,
+            wine64_bin=state["wine64_bin"],
+            wineserver_bin=state["wineserver_bin"],
+            prefix_dir=state["prefix_dir"],
+        )
+
+    def save(self, key: dict[str, Any], state: SessionState) -> None:
+        LOG.debug("saving session snapshot %s", self.file)
+
+        data = {
+            "version": SESSION_CACHE_VERSION,
+            "key": key,
+            "env": {
+                "set": {
+                    name: value
+                    for name, value in state.env.items()
+                    if os.environ.get(name) != value
+                },
+                "unset": [name for name in os.environ if name not in state.env],
+            },
+            "state": {
+                "wine64_bin": state.wine64_bin,
+                "wineserver_bin": state.wineserver_bin,
+                "prefix_dir": state.prefix_dir,
+            },
+        }
+
+        write_json_atomic(self.file, data)
+
+    def clear(self) -> None:
+        self.file.unlink(missing_ok=True)
+
+
+def session_env_key() -> dict[str, str]:
+    """Returns the part of ``os.environ`` that a session snapshot depends on"""
+
+    return {
+        name: value
+        for name, value in sorted(os.environ.items())
+        if name.startswith(SESSION_ENV_PREFIXES) or name in SESSION_ENV_NAMES
+    }
+
+
+def mtime_ns(path: str | Path) -> int | None:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
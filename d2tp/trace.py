@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Final, NamedTuple, TextIO
+
+from .log import Logger
+
+LOG: Final = Logger(__name__)
+
+
+class Span(NamedTuple):
+    """Timed phase, times in nanoseconds since the tracer started"""
+
+    name: str
+    start: int
+    duration: int
+    tid: int
+    args: dict[str, Any]
+
+
+class Tracer:
+    """Collects timing spans of d2tp's phases
+
+    Spans are written as Chrome trace event JSON, which can be opened in ``chrome://tracing`` or
+    Perfetto, and summarized per phase name.
+    """
+
+    spans: list[Span]
+
+    def __init__(self) -> None:
+        self.spans = []
+        self._origin = time.perf_counter_ns()
+
+    @contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[None]:
+        start = time.perf_counter_ns()
+
+        try:
+            yield
+        finally:
+            end = time.perf_counter_ns()
+            # list.append is atomic, spans may be recorded from worker threads
+            self.spans.append(
+                Span(
+                    name=name,
+                    start=start - self._origin,
+                    duration=end - start,
+                    tid=threading.get_native_id(),
+                    args=args,
+                )
+            )
+
+    def write(self, file: Path) -> None:
+        LOG.debug("writing trace %s (%d spans)", file, len(self.spans))
+
+        pid = os.getpid()
+        events = [
+            {
+                "name": current.name,
+                "cat": "d2tp",
+                "ph": "X",
+                "ts": current.start / 1000,
+                "dur": current.duration / 1000,
+                "pid": pid,
+                "tid": current.tid,
+                "args": current.args,
+            }
+            for current in self.spans
+        ]
+
+        file.parent.mkdir(parents=True, exist_ok=True)
+        file.write_text(
+            json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}), encoding="utf-8"
+        )
+
+    def summary(self, out: TextIO = sys.stderr) -> None:
+        """Prints one line per phase with its count, total and maximum duration"""
+
+        phases: dict[str, list[int]] = {}
+
+        for current in self.spans:
+            phases.setdefault(current.name, []).append(current.duration)
+
+        if not phases:
+            return
+
+        width = max(len(name) for name in phases)
+
+        print(f"{'phase':<{width}} {'count':>6} {'total':>10} {'max':>10}", file=out)
+
+        for name, durations in sorted(phases.items(), key=lambda item: -sum(item[1])):
+            count = len(durations)
+            total = sum(durations) / 1e9
+            longest = max(durations) / 1e9
+
+            print(f"{name:<{width}} {count:>6} {total:>9.3f}s {longest:>9.3f}s", file=out)
+
+
+_TRACER: Tracer | None = None
+
+
+def enable() -> Tracer:
+    """Starts recording spans"""
+
+    global _TRACER  # pylint: disable=global-statement
+
+    if _TRACER is None:
+        _TRACER = Tracer()
+
+    return _TRACER
+
+
+def tracer() -> Tracer | None:
+    return _TRACER
+
+
+@contextmanager
+def span(name: str, **args: Any) -> Iterator[None]:
+    """Records a span named ``name`` if tracing is enabled, otherwise does nothing"""
+
+    if _TRACER is None:
+        yield
+        return
+
+    with _TRACER.span(name, **args):
+        yield
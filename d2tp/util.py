@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+
+def list_dir(path: str) -> tuple[list[str], list[str]]:
+    """Returns the paths of the subdirectories and of the other entries of ``path``
+
+    Directory symlinks are listed with the other entries, so walks don't follow them.
+    """
+
+    dirs: list[str] = []
+    files: list[str] = []
+
+    with os.scandir(path) as entries:
+        for entry in entries:
+            (dirs if entry.is_dir(follow_symlinks=False) else files).append(entry.path)
+
+    return dirs, files
+
+
+def stat_matches(stat: os.stat_result, size: int, mtime_ns: int) -> bool:
+    """Returns whether ``stat`` has the size and modification time recorded for a file"""
+
+    return stat.st_size == size and stat.st_mtime_ns == mtime_ns
+
+
+def write_json_atomic(file: Path, data: Any, indent: int | None = None) -> None:
+    """Writes ``data`` as JSON to ``file``, creating its parent directories
+
+    The data is written to a temporary file renamed over ``file``, so readers never see a partial
+    file and an interrupted write leaves the previous one in place.
+    """
+
+    file.parent.mkdir(parents=True, exist_ok=True)
+
+    tmp_file = file.with_name(f".{file.name}.tmp")
+    tmp_file.write_text(json.dumps(data, indent=indent), encoding="utf-8")
+    os.replace(tmp_file, file)
@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import os
+from typing import TYPE_CHECKING, Final
+
+from .custom_game import MAP_SUFFIX, SourceTree
+from .inotify import Event, Inotify, Mask
+from .log import Logger
+from .util import list_dir
+
+if TYPE_CHECKING:
+    from .custom_game import CustomGame
+    from .jobs import JobResult
+    from .runner import Runner
+
+
+LOG: Final = Logger(__name__)
+
+DEFAULT_DEBOUNCE: Final = 0.25
+
+WATCH_MASK: Final = (
+    Mask.CLOSE_WRITE
+    | Mask.MOVED_TO
+    | Mask.MOVED_FROM
+    | Mask.CREATE
+    | Mask.DELETE
+    | Mask.DELETE_SELF
+    | Mask.ONLYDIR
+)
+
+# editor swap, backup and temporary files
+IGNORED_SUFFIXES: Final = ("~", ".swp", ".swx", ".tmp")
+
+
+class Watcher:
+    """Recompiles a custom game's changed sources as they are saved
+
+    The source content tree is watched with inotify. Events are debounced: after the first event,
+    events keep being collected until none arrive for ``debounce`` seconds, and the touched files
+    are then compiled in one batch using the runner's warm session.
+
+    With ``resume``, the initial sync resumes from the custom game's compile journal. Later
+    compilations always do, and never discard a pending journal (see :meth:`Runner.plan_sources`).
+    """
+
+    runner: Runner
+    custom_game: CustomGame
+    debounce: float
+    jobs: int
+    shards: int
+    resume: bool
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        runner: Runner,
+        custom_game: CustomGame,
+        debounce: float = DEFAULT_DEBOUNCE,
+        jobs: int = 1,
+        shards: int = 1,
+        resume: bool = False,
+    ) -> None:
+        self.runner = runner
+        self.custom_game = custom_game
+        self.debounce = debounce
+        self.jobs = jobs
+        self.shards = shards
+        self.resume = resume
+        self.manifest = runner.manifest(custom_game)
+        self.deps = runner.dependency_index(custom_game)
+        self._inotify: Inotify | None = None
+        self._dirs: dict[int, str] = {}
+
+    def watch(self) -> None:
+        """Compiles changed sources, then recompiles touched files until interrupted"""
+
+        self.custom_game.setup()
+        self.manifest.load()
+        self.deps.load()
+
+        with Inotify() as inotify:
+            self._inotify = inotify
+            self._dirs = {}
+            self._add_tree(str(self.custom_game.src_content_path))
+
+            # sync after watches are in place, so no change slips through
+            self.runner.sync_custom_game(
+                self.custom_game,
+                self.manifest,
+                self.deps,
+                jobs=self.jobs,
+                shards=self.shards,
+                resume=self.resume,
+            )
+
+            LOG.warning("watching %s", self.custom_game.src_content_path)
+
+            while True:
+                self._process(inotify.read())
+
+    def _process(self, events: list[Event]) -> None:
+        assert self._inotify is not None
+
+        touched: set[str] = set()
+        overflow = False
+
+        while events:
+            for event in events:
+                if event.mask & Mask.Q_OVERFLOW:
+                    overflow = True
+                    continue
+
+                path = self._event_path(event)
+
+                if path is None:
+                    continue
+
+                if event.mask & Mask.ISDIR:
+                    if event.mask & (Mask.CREATE | Mask.MOVED_TO):
+                        touched.update(self._add_tree(path))
+                elif event.mask & (Mask.DELETE | Mask.MOVED_FROM):
+                    touched.discard(path)
+                    self.manifest.remove(self._rel_path(path))
+                    self.deps.remove(self._rel_path(path))
+                elif event.mask & (Mask.CLOSE_WRITE | Mask.MOVED_TO) or (
+                    event.mask & Mask.CREATE and os.path.islink(path)
+                ):
+                    if not path.endswith(IGNORED_SUFFIXES):
+                        touched.add(path)
+
+            events = self._inotify.read(self.debounce)
+
+        if overflow:
+            LOG.warning(
+                "Event queue overflowed, rescanning %s", self.custom_game.src_content_path
+            )
+
+            results = self.runner.sync_custom_game(
+                self.custom_game,
+                self.manifest,
+                self.deps,
+                jobs=self.jobs,
+                shards=self.shards,
+                resume=True,
+            )
+            report(results)
+
+            return
+
+        files = SourceTree(maps=[], assets=[])
+
+        for path in sorted(touched):
+            file = self.custom_game.source_file(path)
+
+            if file is None:
+                continue
+
+            if path.endswith(MAP_SUFFIX):
+                files.maps.append(file)
+            else:
+                files.assets.append(file)
+
+        if not files.maps and not files.assets:
+            self.manifest.save()
+            return
+
+        LOG.info("%d files touched", len(files.maps) + len(files.assets))
+
+        results = self.runner.compile_sources(
+            self.custom_game,
+            files,
+            self.manifest,
+            self.deps,
+            jobs=self.jobs,
+            shards=self.shards,
+            subset=True,
+        )
+        report(results)
+
+    def _add_tree(self, root: str) -> list[str]:
+        """Watches ``root`` and its subdirectories, returns the files found in them
+
+        Files in directories created after the parent's watch was added would otherwise be missed.
+        """
+
+        assert self._inotify is not None
+
+        files = []
+        dirs = [root]
+
+        while dirs:
+            dir_path = dirs.pop()
+
+            try:
+                wd = self._inotify.add_watch(dir_path, WATCH_MASK)
+            except OSError as ex:
+                LOG.warning("Could not watch %s: %s", dir_path, ex)
+                continue
+
+            self._dirs[wd] = dir_path
+
+            LOG.trace("  watching %s", dir_path)
+
+            # like CustomGame.scan, directory symlinks are not followed
+            subdirs, dir_files = list_dir(dir_path)
+            dirs.extend(subdirs)
+            files.extend(dir_files)
+
+        return files
+
+    def _event_path(self, event: Event) -> str | None:
+        dir_path = self._dirs.get(event.wd)
+
+        if event.mask & Mask.IGNORED:
+            self._dirs.pop(event.wd, None)
+            return None
+
+        if dir_path is None or not event.name:
+            return None
+
+        return os.path.join(dir_path, event.name)
+
+    def _rel_path(self, path: str) -> str:
+        return os.path.relpath(path, self.custom_game.src_content_path)
+
+
+def report(results: list[JobResult]) -> None:
+    failed = sum(1 for result in results if not result.ok)
+
+    if failed:
+        LOG.error("%d of %d compile jobs failed", failed, len(results))
+    elif results:
+        LOG.warning("compiled %d jobs", len(results))
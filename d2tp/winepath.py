@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import os
+import re
+from pathlib import Path, PosixPath, PurePath, PureWindowsPath
+from typing import Final
+
+from .log import Logger
+
+LOG: Final = Logger(__name__)
+
+DRIVE_RE: Final = re.compile(r"\A[a-z]:\Z")
+
+# Characters wine cannot map to DOS names as-is (it mangles them into short names)
+INVALID_DOS_CHARS_RE: Final = re.compile(r'[\\:*?"<>|\x00-\x1f]')
+
+
+class DosDevices:
+    """In-process path translation based on a prefix's ``dosdevices`` drive symlinks
+
+    Mirrors wine's lookup: native paths are mapped to the drive whose root is the longest
+    existing prefix of the path (compared by device and inode, lowest drive letter first), and
+    Windows paths are mapped by joining the remainder to the drive symlink.
+
+    Drives are cached and reloaded whenever the ``dosdevices`` directory is modified. Methods
+    return ``None`` for paths that cannot be translated unambiguously, in which case callers
+    should fall back to ``winepath``.
+    """
+
+    path: Path
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._mtime_ns: int | None = None
+        self._drives: dict[tuple[int, int], str] = {}
+
+    @property
+    def drives(self) -> dict[tuple[int, int], str]:
+        """Mapping of drive roots' ``(st_dev, st_ino)`` to drive letters"""
+
+        try:
+            mtime_ns = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = None
+
+        if mtime_ns is None:
+            self._drives = {}
+        elif mtime_ns != self._mtime_ns:
+            self._drives = self._load()
+
+        self._mtime_ns = mtime_ns
+
+        return self._drives
+
+    def _load(self) -> dict[tuple[int, int], str]:
+        LOG.debug("loading drives from %s", self.path)
+
+        drives: dict[tuple[int, int], str] = {}
+
+        for name in sorted(os.listdir(self.path)):
+            if not DRIVE_RE.match(name):
+                continue
+
+            try:
+                stat = os.stat(self.path.joinpath(name))
+            except OSError:
+                continue
+
+            LOG.trace("  %s -> %s", name, os.path.realpath(self.path.joinpath(name)))
+
+            drives.setdefault((stat.st_dev, stat.st_ino), name)
+
+        return drives
+
+    def windows_path(self, path: str | PurePath) -> PureWindowsPath | None:
+        drives = self.drives
+        parts = PurePath(os.path.abspath(path)).parts[1:]
+
+        for i in range(len(parts), -1, -1):
+            try:
+                stat = os.stat(PurePath("/", *parts[:i]))
+            except OSError:
+                continue
+
+            drive = drives.get((stat.st_dev, stat.st_ino))
+
+            if drive is None:
+                continue
+
+            rest = parts[i:]
+
+            if any(INVALID_DOS_CHARS_RE.search(part) for part in rest):
+                return None
+
+            return PureWindowsPath(f"{drive.upper()}\\", *rest)
+
+        return None
+
+    def native_path(self, path: str | PurePath) -> PosixPath | None:
+        win_path = PureWindowsPath(path)
+
+        if not win_path.drive or not DRIVE_RE.match(win_path.drive.lower()) or not win_path.root:
+            return None
+
+        native_path = PosixPath(self.path, win_path.drive.lower(), *win_path.parts[1:])
+
+        # wine matches path components case-insensitively, which only a lookup can resolve
+        if not os.path.lexists(native_path):
+            return None
+
+        return native_path
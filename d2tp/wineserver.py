@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import os
+import socket
+import subprocess
+from pathlib import Path
+from typing import Final
+
+from .log import Logger
+
+LOG: Final = Logger(__name__)
+
+# seconds to wait for a server to exit by itself before killing it
+STOP_TIMEOUT: Final = 60.0
+
+# seconds a server started by d2tp lingers after its last client exits
+IDLE_TIMEOUT: Final = 3
+
+# seconds a server started by ``d2tp wineserver start`` lingers after its last client exits
+PERSISTENT_IDLE_TIMEOUT: Final = 60
+
+
+class WineServer:
+    """Controls the wineserver of a prefix
+
+    Wine starts a wineserver on demand and stops it a few seconds after its last client exits, so
+    commands run back to back keep paying for its startup and the prefix boot. A persistent server
+    (``wineserver -p``) stays up until it is stopped, and every wine process run in the prefix
+    connects to it.
+    """
+
+    wineserver_bin: str
+    env: dict[str, str]
+    prefix_dir: Path
+
+    def __init__(self, wineserver_bin: str, env: dict[str, str], prefix_dir: Path) -> None:
+        self.wineserver_bin = wineserver_bin
+        self.env = env
+        self.prefix_dir = prefix_dir
+
+    @property
+    def server_dir(self) -> Path:
+        """Directory of the prefix's server socket, named like wine does after the prefix inode"""
+
+        stat = self.prefix_dir.stat()
+        tmp_dir = Path(f"/tmp/.wine-{os.getuid()}")
+
+        return tmp_dir.joinpath(f"server-{stat.st_dev:x}-{stat.st_ino:x}")
+
+    @property
+    def socket_path(self) -> Path:
+        return self.server_dir.joinpath("socket")
+
+    @property
+    def running(self) -> bool:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            try:
+                conn.connect(str(self.socket_path))
+            except OSError:
+                return False
+
+        return True
+
+    def start(self, timeout: int | None = None) -> None:
+        """Starts a persistent server, exiting after ``timeout`` idle seconds if given"""
+
+        LOG.debug("starting wineserver for %s", self.prefix_dir)
+
+        self._run("-p" if timeout is None else f"-p{timeout}")
+
+    def stop(self, timeout: float = STOP_TIMEOUT) -> None:
+        """Waits for the server to exit by itself, killing it after ``timeout`` seconds
+
+        Only a server started with an idle timeout exits by itself. Wine processes still running
+        in the prefix (e.g. compilers of another d2tp process) are only killed by the fallback.
+        """
+
+        try:
+            self.wait(timeout)
+        except subprocess.TimeoutExpired:
+            LOG.warning(
+                "Wineserver for %s still running after %ss, killing it", self.prefix_dir, timeout
+            )
+            self.kill()
+
+    def wait(self, timeout: float | None = None) -> None:
+        """Waits for the server to exit by itself, raising :exc:`subprocess.TimeoutExpired`"""
+
+        LOG.debug("waiting for wineserver for %s to exit", self.prefix_dir)
+
+        self._run("-w", timeout=timeout)
+
+    def kill(self) -> None:
+        """Kills the server and every wine process in the prefix, and waits until it has exited"""
+
+        LOG.debug("killing wineserver for %s", self.prefix_dir)
+
+        self._run("-k")
+        self._run("-w")
+
+    def _run(self, *args: str, timeout: float | None = None) -> None:
+        cmd = [self.wineserver_bin, *args]
+
+        LOG.trace("  running %r", cmd)
+
+        subprocess.run(cmd, check=False, env=self.env, timeout=timeout)
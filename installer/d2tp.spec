@@ -1,7 +1,17 @@
 # vim: ft=python
 
+import os
+
 block_cipher = None
 
+# "onefile" builds a single self-extracting executable, which unpacks itself to a temporary
+# directory on every run. "onedir" builds an executable plus its files in a directory, which starts
+# much faster since nothing needs to be extracted.
+package_mode = os.environ.get("D2TP_PACKAGE_MODE", "onefile")
+
+if package_mode not in ("onefile", "onedir"):
+    raise ValueError(f"Invalid D2TP_PACKAGE_MODE {package_mode!r}")
+
 a = Analysis(
     ["../d2tp/__main__.py", "analysis/_pyi_proton.py"],
     pathex=[],
@@ -22,20 +32,13 @@ pyz = PYZ(a.pure, a.zipped_data, cipher=block_cipher)
 
 print("[analysis] scripts:", a.scripts)
 
-exe = EXE(
-    pyz,
-    a.scripts,
-    a.binaries,
-    a.zipfiles,
-    a.datas,
-    [],
+exe_options = dict(
     name='d2tp',
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
     upx=True,
     upx_exclude=[],
-    runtime_tmpdir=None,
     console=True,
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -43,3 +46,34 @@ exe = EXE(
     codesign_identity=None,
     entitlements_file=None,
 )
+
+if package_mode == "onedir":
+    exe = EXE(
+        pyz,
+        a.scripts,
+        [],
+        exclude_binaries=True,
+        **exe_options,
+    )
+
+    coll = COLLECT(
+        exe,
+        a.binaries,
+        a.zipfiles,
+        a.datas,
+        strip=False,
+        upx=True,
+        upx_exclude=[],
+        name='d2tp',
+    )
+else:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        a.binaries,
+        a.zipfiles,
+        a.datas,
+        [],
+        runtime_tmpdir=None,
+        **exe_options,
+    )
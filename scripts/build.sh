@@ -10,10 +10,21 @@ ROOT_DIR="$(dirname "$SCRIPT_DIR")"
 cd "$ROOT_DIR"
 pwd
 
+D2TP_PACKAGE_MODE="${D2TP_PACKAGE_MODE:-onefile}"
+export D2TP_PACKAGE_MODE
+
 poetry install
-poetry run pyinstaller "installer/d2tp.spec"
+poetry run pyinstaller --noconfirm "installer/d2tp.spec"
 
-cp "dist/d2tp" "${D2TP_BIN:?}"
-chmod 755 "$D2TP_BIN"
+if [[ "$D2TP_PACKAGE_MODE" == "onedir" ]]; then
+  rm -rf "${D2TP_LIB_DIR:?}"
+  mkdir -p "$(dirname "$D2TP_LIB_DIR")"
+  cp -a "dist/d2tp" "$D2TP_LIB_DIR"
+  printf '#!/bin/sh\nexec "%s/d2tp" "$@"\n' "$D2TP_LIB_DIR" >"${D2TP_BIN:?}"
+  chmod 755 "$D2TP_BIN"
+else
+  cp "dist/d2tp" "${D2TP_BIN:?}"
+  chmod 755 "$D2TP_BIN"
+fi
 
 "$D2TP_BIN" --version
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Startup time regression check
+
+Checks that ``d2tp --version`` does not import modules only needed by commands, and that the
+median wall time of a d2tp command stays under a limit.
+
+    check_startup.py [--max-ms MS] [--runs N] [--bin PATH] [-- d2tp arguments...]
+
+Without --bin, d2tp is run from the source tree with the current interpreter. Arguments after
+``--`` replace the default ``--version``, e.g. ``-- -s ~/.steam/steam protonpath /tmp``.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# Modules that must not be imported by `d2tp --version`
+LAZY_MODULES = [
+    "appdirs",
+    "vdf",
+    "asyncio",
+    "concurrent.futures",
+    "subprocess",
+    "d2tp.async_runner",
+    "d2tp.build",
+    "d2tp.game",
+    "d2tp.runner",
+    "d2tp.server",
+    "d2tp.watch",
+]
+
+IMPORTS_CHECK = f"""
+import sys
+sys.argv = ["d2tp", "--version"]
+from d2tp.cli import main
+try:
+    main()
+except SystemExit:
+    pass
+imported = [name for name in {LAZY_MODULES!r} if name in sys.modules]
+if imported:
+    print("modules imported by --version: " + ", ".join(imported), file=sys.stderr)
+    sys.exit(1)
+"""
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="d2tp startup time regression check")
+    parser.add_argument("--max-ms", type=float, default=100.0, help="Maximum median time in ms")
+    parser.add_argument("--runs", type=int, default=20, help="Number of timed runs")
+    parser.add_argument("--bin", type=str, help="d2tp executable to time")
+    parser.add_argument("d2tp_args", nargs="*", help="d2tp arguments [default: --version]")
+
+    return parser.parse_args()
+
+
+def check_imports() -> bool:
+    env = dict(os.environ, PYTHONPATH=str(ROOT_DIR))
+    process = subprocess.run(
+        [sys.executable, "-c", IMPORTS_CHECK],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        check=False,
+    )
+
+    return process.returncode == 0
+
+
+def time_command(cmd: list[str], runs: int) -> float:
+    env = dict(os.environ, PYTHONPATH=str(ROOT_DIR))
+    times = []
+
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, check=True)
+        times.append((time.perf_counter() - start) * 1000)
+
+    return statistics.median(times)
+
+
+def main() -> None:
+    args = parse_args()
+    d2tp_args = args.d2tp_args or ["--version"]
+
+    if args.bin is None:
+        cmd = [sys.executable, "-m", "d2tp", *d2tp_args]
+        baseline_ms = time_command([sys.executable, "-c", "pass"], args.runs)
+    else:
+        cmd = [args.bin, *d2tp_args]
+        baseline_ms = 0.0
+
+    ok = check_imports()
+
+    median_ms = time_command(cmd, args.runs)
+    overhead_ms = median_ms - baseline_ms
+
+    print(f"{' '.join(cmd)}: median {median_ms:.1f}ms ({overhead_ms:.1f}ms over interpreter)")
+
+    if overhead_ms > args.max_ms:
+        print(f"startup time over limit of {args.max_ms:.1f}ms", file=sys.stderr)
+        ok = False
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()